@@ -0,0 +1,292 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+# 只依赖标准库: pandas / numpy / scipy 等在执行子命令时才导入，
+# 使 --help、参数错误与 submit 客户端的启动时间只有解释器本身的开销
+VALIDATION_CHOICES = ('report', 'flag', 'drop', 'quarantine', 'none')
+
+# 常驻进程预先导入的模块 (导入后各子命令不再有导入开销)
+WARM_MODULES = ('clear_structured_data', 'statistics', 'pipeline', 'esr', 'chi2_tests', 'panel')
+
+
+def _validation(value):
+    return None if value == 'none' else value
+
+
+def cmd_clean(args):
+    """清洗问卷数据为结构化数据"""
+    if args.streaming:
+        from clear_structured_data import process_survey_data_streaming
+
+        process_survey_data_streaming(args.input, args.output, chunksize=args.chunksize,
+                                      min_other_freq=args.min_other_freq,
+                                      validation=_validation(args.validation))
+    else:
+        from clear_structured_data import process_survey_data
+
+        process_survey_data(args.input, args.output, min_other_freq=args.min_other_freq,
+                            excel_file=args.excel, stata_file=args.stata,
+                            validation=_validation(args.validation))
+    return 0
+
+
+def cmd_stats(args):
+    """描述性统计报告"""
+    from statistics import comprehensive_descriptive_stats
+
+    comprehensive_descriptive_stats(args.input, args.output, strata=args.strata,
+                                    weight=args.weight, cluster=args.cluster, n_perm=args.n_perm)
+    return 0
+
+
+def cmd_run(args):
+    """按依赖关系执行完整流水线 (清洗 -> 描述性统计 / 卡方检验 / ESR)"""
+    from pipeline import default_stages, run_pipeline
+
+    stages = default_stages(clean={'validation': _validation(args.validation)},
+                            stats={'strata': args.strata} if args.strata else None)
+    report = run_pipeline(args.input, stages=stages, output_dir=args.output,
+                          cache_dir=args.cache_dir, max_workers=args.max_workers)
+    return 0 if (report['状态'] != '失败').all() else 1
+
+
+def cmd_panel(args):
+    """跨期农户匹配，生成长格式面板数据"""
+    from panel import build_panel, print_link_summary
+    from survey_io import save_structured
+
+    waves = {}
+    for item in args.waves:
+        wave, sep, path = item.partition('=')
+        if not sep:
+            raise ValueError(f"期次应写为 期次=文件: {item}")
+        waves[wave] = path
+    panel = build_panel(waves, args.index, max_distance=args.max_distance)
+    print_link_summary(panel)
+    save_structured(panel, args.output)
+    print(f"\n面板数据已保存到: {args.output}")
+    return 0
+
+
+def cmd_query(args):
+    """本机查询服务: 数据载入内存一次，以 HTTP/JSON 回答筛选、分组与汇总查询"""
+    from query_service import serve
+
+    serve(args.input, host=args.host, port=args.port)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='agritour',
+                                     description='农文旅融合对农户增收影响研究的数据处理与分析')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    clean = sub.add_parser('clean', help='清洗问卷数据为结构化数据')
+    clean.add_argument('input', help='问卷文件 (.xls / .xlsx / .csv)')
+    clean.add_argument('-o', '--output', default='structured_data.parquet',
+                       help='输出文件，格式由扩展名决定 (默认 structured_data.parquet)')
+    clean.add_argument('--stata', help='另外导出的 Stata .dta 文件')
+    clean.add_argument('--excel', help='另外导出的 Excel 文件')
+    clean.add_argument('--min-other-freq', type=int, help='“其他”自由填写选项的最小频数')
+    clean.add_argument('--validation', choices=VALIDATION_CHOICES, default='report',
+                       help='逻辑约束校验的处理策略 (默认 report)')
+    clean.add_argument('--streaming', action='store_true', help='分块读取大文件 (只输出 Parquet)')
+    clean.add_argument('--chunksize', type=int, default=100_000, help='分块处理时每块的行数')
+    clean.set_defaults(func=cmd_clean)
+
+    stats = sub.add_parser('stats', help='生成描述性统计报告')
+    stats.add_argument('input', help='结构化数据文件')
+    stats.add_argument('-o', '--output', default='comprehensive_descriptive_stats.xlsx',
+                       help='输出的 Excel 文件')
+    stats.add_argument('--strata', nargs='+', help='分层变量 (如 county village)')
+    stats.add_argument('--weight', help='抽样权重变量')
+    stats.add_argument('--cluster', help='聚类变量 (如 village)')
+    stats.add_argument('--n-perm', type=int, default=0,
+                       help='ln_income 置换检验的置换次数 (如 9999，默认 0 不做)')
+    stats.set_defaults(func=cmd_stats)
+
+    run = sub.add_parser('run', help='执行完整分析流水线 (带缓存)')
+    run.add_argument('input', help='问卷文件')
+    run.add_argument('-o', '--output', default='pipeline_output', help='输出目录')
+    run.add_argument('--cache-dir', default='.agritour_pipeline', help='缓存目录')
+    run.add_argument('--max-workers', type=int, help='并行进程数')
+    run.add_argument('--strata', nargs='+', help='描述性统计的分层变量')
+    run.add_argument('--validation', choices=VALIDATION_CHOICES, default='report',
+                     help='逻辑约束校验的处理策略')
+    run.set_defaults(func=cmd_run)
+
+    panel = sub.add_parser('panel', help='跨期匹配农户，生成长格式面板数据')
+    panel.add_argument('waves', nargs='+', help='各期结构化数据，写为 期次=文件 (如 2023=a.parquet)')
+    panel.add_argument('--index', default='households.sqlite', help='农户匹配索引文件')
+    panel.add_argument('-o', '--output', default='panel_data.parquet', help='面板数据输出文件')
+    panel.add_argument('--max-distance', type=int, default=1,
+                       help='模糊匹配允许超出容差的属性个数')
+    panel.set_defaults(func=cmd_panel)
+
+    query = sub.add_parser('query', help='启动本机 HTTP/JSON 查询服务 (筛选、分组、汇总)')
+    query.add_argument('input', help='结构化数据文件')
+    query.add_argument('--host', default='127.0.0.1', help='监听地址 (只能为本机地址)')
+    query.add_argument('--port', type=int, default=8765, help='端口 (默认 8765)')
+    query.set_defaults(func=cmd_query)
+
+    serve = sub.add_parser('serve', help='常驻进程: 预先导入模块，从标准输入或本地套接字接收任务')
+    serve.add_argument('--socket', help='Unix 套接字路径，省略时从标准输入逐行读取任务')
+    serve.set_defaults(func=cmd_serve)
+
+    submit = sub.add_parser('submit', help='将一条命令提交给常驻进程执行')
+    submit.add_argument('--socket', required=True, help='常驻进程的 Unix 套接字路径')
+    submit.add_argument('argv', nargs=argparse.REMAINDER,
+                        help='要执行的命令，如 clean 问卷.csv -o 结果.parquet')
+    submit.set_defaults(func=cmd_submit)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        # 数据或文件问题只输出错误信息，不输出调用栈
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+
+
+# ============= 常驻进程 =============
+
+def run_job(job):
+    """
+    在当前进程中执行一个任务
+
+    参数:
+        job: {"argv": [...], "cwd": 工作目录 (可选)}，或直接为参数列表
+
+    返回:
+        {"status": "ok"/"error", "code": 返回码, "seconds": 耗时, "output": 命令输出, "error": 错误信息}
+    """
+    if isinstance(job, list):
+        job = {'argv': job}
+    argv = list(job.get('argv') or [])
+    if argv and argv[0] in ('serve', 'submit', 'query'):
+        return {'status': 'error', 'code': 2, 'seconds': 0.0, 'output': '',
+                'error': f"常驻进程中不能执行 {argv[0]}"}
+    cwd = os.getcwd()
+    output = io.StringIO()
+    start = time.perf_counter()
+    result = {'status': 'ok', 'code': 0}
+    try:
+        if job.get('cwd'):
+            os.chdir(job['cwd'])
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            result['code'] = main(argv) or 0
+    except SystemExit as e:
+        # argparse 的参数错误与 --help
+        result['code'] = e.code if isinstance(e.code, int) else 2
+        if result['code']:
+            result['status'] = 'error'
+    except Exception as e:
+        result.update(status='error', code=1, error=repr(e))
+        output.write(traceback.format_exc())
+    finally:
+        os.chdir(cwd)
+    if result['code'] and result['status'] == 'ok':
+        result['status'] = 'error'
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    result['output'] = output.getvalue()
+    return result
+
+
+def _warm_up():
+    """预先导入各子命令用到的模块"""
+    import importlib
+
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+def _serve_stream(reader, writer):
+    """逐行读取 JSON 任务，每个任务回复一行 JSON 结果；空行或 EOF 时结束"""
+    for line in reader:
+        line = line.strip()
+        if not line:
+            break
+        try:
+            result = run_job(json.loads(line))
+        except json.JSONDecodeError as e:
+            result = {'status': 'error', 'code': 2, 'error': f"无法解析任务: {e}"}
+        writer.write(json.dumps(result, ensure_ascii=False) + '\n')
+        writer.flush()
+
+
+def cmd_serve(args):
+    """
+    常驻进程: 预先导入 pandas / numpy / scipy 与各分析模块，逐个执行提交的任务
+
+    每个任务是一行 JSON ({"argv": ["clean", "问卷.csv", "-o", "结果.parquet"], "cwd": "..."}
+    或直接为参数列表)，结果为一行 JSON (见 run_job)。任务在同一进程中依次执行。
+    --socket 时监听 Unix 套接字 (只有本机进程可以连接)，否则从标准输入读取、
+    结果写到标准输出。
+    """
+    _warm_up()
+    if not args.socket:
+        _serve_stream(sys.stdin, sys.stdout)
+        return 0
+
+    import signal
+    import socket
+
+    # 收到 SIGTERM 时正常退出，删除套接字文件
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(args.socket)
+        os.chmod(args.socket, 0o600)
+        server.listen()
+        print(f"常驻进程已启动: {args.socket} (pid {os.getpid()})", file=sys.stderr)
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile('r', encoding='utf-8') as reader, \
+                    conn.makefile('w', encoding='utf-8') as writer:
+                _serve_stream(reader, writer)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        server.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+def cmd_submit(args):
+    """提交一条命令给常驻进程，输出其结果，返回码与命令相同"""
+    import socket
+
+    argv = args.argv[1:] if args.argv[:1] == ['--'] else args.argv
+    if not argv:
+        print("缺少要执行的命令", file=sys.stderr)
+        return 2
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(args.socket)
+        with conn.makefile('w', encoding='utf-8') as writer:
+            writer.write(json.dumps({'argv': argv, 'cwd': os.getcwd()}, ensure_ascii=False) + '\n')
+        conn.shutdown(socket.SHUT_WR)
+        with conn.makefile('r', encoding='utf-8') as reader:
+            line = reader.readline()
+    if not line:
+        print("常驻进程没有返回结果", file=sys.stderr)
+        return 1
+    result = json.loads(line)
+    sys.stdout.write(result.get('output', ''))
+    if result.get('error'):
+        print(result['error'], file=sys.stderr)
+    return result.get('code', 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from codebook import CODEBOOK
+from survey_io import compact_dtypes, load_structured, read_survey, save_structured
+
+SURVEY_SUFFIXES = ('.xls', '.xlsx', '.csv')
+
+
+def find_survey_files(inputs):
+    """
+    展开输入为问卷文件列表
+
+    参数:
+        inputs: 目录 (递归查找 .xls/.xlsx/.csv)、通配符模式或文件路径，也可以是它们的列表
+    """
+    if isinstance(inputs, (str, os.PathLike)):
+        inputs = [inputs]
+    files = []
+    for item in inputs:
+        item = str(item)
+        if os.path.isdir(item):
+            for suffix in SURVEY_SUFFIXES:
+                files.extend(glob.glob(os.path.join(item, '**', f'*{suffix}'), recursive=True))
+        else:
+            files.extend(glob.glob(item))
+    # Excel 打开时产生的临时文件 (~$xxx.xlsx) 不是问卷
+    return sorted(set(f for f in files if not os.path.basename(f).startswith('~$')))
+
+
+def file_digest(path, salt=''):
+    """文件内容的 SHA-256 (附加处理参数作为盐)"""
+    digest = hashlib.sha256(salt.encode('utf-8'))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _clean_one(path, cache_dir, min_other_freq):
+    """在子进程中清洗单个问卷文件，结果写入以内容哈希命名的缓存"""
+    from clear_structured_data import recode_survey_frame
+
+    start = time.perf_counter()
+    digest = file_digest(path, salt=repr((CODEBOOK, min_other_freq)))
+    cache_file = os.path.join(cache_dir, digest + '.parquet')
+    cached = os.path.exists(cache_file)
+    if not cached:
+        processed = recode_survey_frame(read_survey(path), min_other_freq=min_other_freq)
+        # 先写临时文件再改名，避免中断时留下不完整的缓存
+        tmp_file = os.path.join(cache_dir, f'{digest}.{os.getpid()}.tmp.parquet')
+        save_structured(processed, tmp_file)
+        os.replace(tmp_file, cache_file)
+    return cache_file, cached, time.perf_counter() - start
+
+
+def process_survey_batch(inputs, output_file='structured_data.parquet', max_workers=None,
+                         cache_dir='.agritour_cache', min_other_freq=None):
+    """
+    批量并行清洗多个村/县的问卷文件，并合并为一个结构化数据集
+
+    每个文件按内容哈希缓存清洗结果，新增文件后重新运行只处理变化的文件。
+    合并后的数据增加 village (文件名) 与 county (所在目录名) 两列标记来源。
+
+    参数:
+        inputs: 目录、通配符模式或文件列表 (见 find_survey_files)
+        output_file: 合并后的输出路径，格式由扩展名决定
+        max_workers: 进程数，None 时为 CPU 核数
+        cache_dir: 缓存目录
+        min_other_freq: “其他”自由填写选项的最小频数 (在每个文件内判断)
+
+    返回:
+        (合并后的数据, 每个文件的处理报告)
+    """
+    files = find_survey_files(inputs)
+    if not files:
+        raise ValueError(f"找不到问卷文件: {inputs}")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    print(f"共 {len(files)} 个问卷文件，开始并行处理...")
+    report = []
+    frames = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_clean_one, f, cache_dir, min_other_freq) for f in files]
+        for path, future in zip(files, futures):
+            row = {
+                '文件': path,
+                'village': os.path.splitext(os.path.basename(path))[0],
+                'county': os.path.basename(os.path.dirname(os.path.abspath(path))),
+            }
+            try:
+                cache_file, cached, seconds = future.result()
+                df = load_structured(cache_file)
+                df.insert(1, 'county', row['county'])
+                df.insert(1, 'village', row['village'])
+                frames.append(df)
+                row.update({'状态': '缓存' if cached else '成功', '样本数': len(df),
+                            '耗时(秒)': round(seconds, 3), '错误': ''})
+            except Exception as e:
+                row.update({'状态': '失败', '样本数': 0, '耗时(秒)': None, '错误': repr(e)})
+            report.append(row)
+    report = pd.DataFrame(report)
+
+    if not frames:
+        print("所有文件处理失败")
+        return None, report
+
+    # 各文件的多选题选项不同，缺少的虚拟变量视为未选择
+    merged = pd.concat(frames, ignore_index=True)
+    known = {var.name for var in CODEBOOK} | {'village', 'county'}
+    dummy_cols = [c for c in merged.columns if c not in known]
+    merged[dummy_cols] = merged[dummy_cols].fillna(0).astype('int8')
+    merged = compact_dtypes(merged)
+    save_structured(merged, output_file)
+
+    n_failed = (report['状态'] == '失败').sum()
+    n_cached = (report['状态'] == '缓存').sum()
+    print(f"\n批量处理完成！成功 {len(files) - n_failed} 个 (其中缓存 {n_cached} 个)，失败 {n_failed} 个")
+    print(f"合并后的数据已保存到: {output_file} (总样本量: {len(merged)})")
+    if n_failed:
+        print("\n失败的文件:")
+        print(report.loc[report['状态'] == '失败', ['文件', '错误']].to_string(index=False))
+
+    return merged, report
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python batch.py <问卷目录或通配符> [输出文件]")
+    else:
+        output = sys.argv[2] if len(sys.argv) > 2 else 'structured_data.parquet'
+        _, batch_report = process_survey_batch(sys.argv[1], output)
+        print("\n各文件处理情况:")
+        print(batch_report.to_string(index=False))
@@ -0,0 +1,209 @@
+import contextlib
+import datetime
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+# 默认的样本规模
+BENCHMARK_SIZES = (1_000, 10_000, 100_000)
+HISTORY_FILE = 'benchmark_history.csv'
+
+
+def _git_commit():
+    """当前代码的 git 提交号，不在 git 仓库中时为空字符串"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def measure(func, *args, memory=True, **kwargs):
+    """
+    执行一次 func(*args, **kwargs)，返回 (结果, 耗时(秒), 峰值内存(MB))
+
+    峰值内存为执行期间 tracemalloc 记录的新增分配峰值；tracemalloc 会拖慢执行，
+    memory=True 时先不跟踪内存计时一次，再跟踪内存执行一次。
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            func(*args, **kwargs)
+            peak = (tracemalloc.get_traced_memory()[1] - base) / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark_stats_sections(structured_file, memory=True):
+    """
+    描述性统计 (statistics.py) 各部分的耗时与峰值内存
+
+    由 instrument 计时段记录: 先不跟踪内存运行一次计时，memory=True 时
+    再以 tracemalloc 模式运行一次记录各部分的 Python/NumPy 分配峰值。
+
+    参数:
+        structured_file: 结构化数据文件
+        memory: 是否记录峰值内存
+
+    返回:
+        [(项目, 耗时(秒), 峰值内存(MB)), ...]
+    """
+    import instrument
+    from statistics import comprehensive_descriptive_stats
+
+    timings = {}
+    peaks = {}
+    for profile in ([None, 'tracemalloc'] if memory else [None]):
+        instrument.records(clear=True)
+        instrument.enable(profile=profile)
+        try:
+            with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+                comprehensive_descriptive_stats(structured_file, os.path.join(tmp, 'stats.xlsx'))
+        finally:
+            instrument.disable()
+        for record in instrument.records(clear=True):
+            if profile is None:
+                timings[record['name']] = record['seconds']
+            else:
+                peaks[record['name']] = record['peak_traced_mb']
+    return [(name, seconds, peaks.get(name)) for name, seconds in timings.items()]
+
+
+def benchmark_pipeline(raw_file, max_workers=None):
+    """
+    各流水线阶段的耗时与峰值内存 (使用空缓存运行 run_pipeline，每个阶段在独立进程中执行)
+
+    返回:
+        [(项目, 耗时(秒), 峰值内存(MB)), ...]
+    """
+    from pipeline import run_pipeline
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        report = run_pipeline(raw_file, output_dir=os.path.join(tmp, 'output'),
+                              cache_dir=os.path.join(tmp, 'cache'), max_workers=max_workers)
+    failed = report[report['状态'] != '运行']
+    if len(failed):
+        raise RuntimeError(f"流水线阶段执行失败: {failed[['阶段', '错误']].to_dict('records')}")
+    return [(f'pipeline.{name}', seconds, peak) for name, seconds, peak
+            in report[['阶段', '耗时(秒)', '峰值内存(MB)']].itertuples(index=False, name=None)]
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, history_file=HISTORY_FILE, data_dir=None, seed=0,
+                   memory=True, pipeline=True, max_workers=None):
+    """
+    在不同规模的合成问卷上运行基准测试，结果追加到历史记录文件
+
+    每个规模依次测量: 合成问卷生成、流水线各阶段 (清洗/描述性统计/卡方检验/ESR，
+    子进程峰值内存)、描述性统计各部分 (tracemalloc 峰值内存)。
+    历史记录包含 git 提交号，可用 compare_benchmarks 比较不同提交的性能。
+
+    参数:
+        sizes: 样本规模列表
+        history_file: 历史记录文件 (.csv)，None 时不保存
+        data_dir: 合成数据目录 (已存在的同规模同种子数据直接复用)，None 时使用临时目录
+        seed: 合成数据的随机数种子
+        memory: 是否记录描述性统计各部分的峰值内存
+        pipeline: 是否运行流水线各阶段
+        max_workers: 流水线的并行进程数
+
+    返回:
+        本次运行的结果表
+    """
+    from synthetic import generate_survey, write_synthetic_survey
+
+    commit = _git_commit()
+    stamp = datetime.datetime.now().isoformat(timespec='seconds')
+    records = []
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(data_dir, exist_ok=True)
+        for n in sizes:
+            print(f"\n===== 样本数 {n} =====")
+            raw_file = os.path.join(data_dir, f'survey_{n}_{seed}.csv')
+            _, seconds, peak = measure(generate_survey, n, seed, memory=memory)
+            rows = [('synthetic.生成问卷', seconds, peak)]
+            if not os.path.exists(raw_file):
+                write_synthetic_survey(raw_file, n, seed=seed)
+
+            structured_file = os.path.join(data_dir, f'structured_{n}_{seed}.parquet')
+            if pipeline:
+                rows.extend(benchmark_pipeline(raw_file, max_workers=max_workers))
+            if not os.path.exists(structured_file):
+                from clear_structured_data import process_survey_data
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_survey_data(raw_file, structured_file)
+            rows.extend(benchmark_stats_sections(structured_file, memory=memory))
+
+            for item, seconds, peak in rows:
+                print(f"  {item:<24} {seconds:9.3f} 秒" +
+                      (f" {peak:10.1f} MB" if peak is not None else ''))
+                records.append({'时间': stamp, '提交': commit, '样本数': n, '项目': item,
+                                '耗时(秒)': seconds, '峰值内存(MB)': peak})
+
+    result = pd.DataFrame(records)
+    if history_file:
+        result.to_csv(history_file, mode='a', index=False, encoding='utf-8-sig',
+                      header=not os.path.exists(history_file))
+        print(f"\n基准测试结果已追加到: {history_file}")
+    return result
+
+
+def compare_benchmarks(history_file=HISTORY_FILE, baseline=None, current=None):
+    """
+    比较两次基准测试 (默认为历史记录中最后两次运行)
+
+    参数:
+        history_file: 历史记录文件
+        baseline / current: 运行时间或 git 提交号，None 时为倒数第二次 / 最后一次运行
+
+    返回:
+        样本数 / 项目 / 基准耗时 / 当前耗时 / 耗时比 / 基准内存 / 当前内存 的比较表
+    """
+    history = pd.read_csv(history_file, dtype={'提交': str})
+    runs = list(dict.fromkeys(history['时间']))
+    if len(runs) < 2 and (baseline is None or current is None):
+        raise ValueError("历史记录中不足两次运行，无法比较")
+
+    def select(run, default):
+        if run is None:
+            return history[history['时间'] == default]
+        selected = history[(history['时间'] == run) | (history['提交'] == run)]
+        if selected.empty:
+            raise ValueError(f"历史记录中没有运行: {run}")
+        # 同一提交多次运行时取最后一次
+        return selected[selected['时间'] == selected['时间'].iloc[-1]]
+
+    keys = ['样本数', '项目']
+    old = select(baseline, runs[-2]).set_index(keys)
+    new = select(current, runs[-1]).set_index(keys)
+    table = pd.DataFrame({
+        '基准耗时': old['耗时(秒)'],
+        '当前耗时': new['耗时(秒)'],
+        '基准内存': old['峰值内存(MB)'],
+        '当前内存': new['峰值内存(MB)'],
+    }).dropna(subset=['基准耗时', '当前耗时'])
+    table.insert(2, '耗时比', table['当前耗时'] / table['基准耗时'])
+    return table.reset_index()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        print(compare_benchmarks().round(3).to_string(index=False))
+    else:
+        sizes = [int(s) for s in sys.argv[1:]] or BENCHMARK_SIZES
+        run_benchmarks(sizes)
@@ -0,0 +1,407 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from codebook import CODEBOOK
+
+# 与 Chi-squared test.do 相同的检验变量
+CHI2_VARS = ['age_cat', 'edu', 'land_cat']
+
+
+def multiselect_dummy_columns(df, exclude=('village', 'county')):
+    """结构化数据中的多选题虚拟变量 (码本以外的列)"""
+    known = {var.name for var in CODEBOOK} | set(exclude)
+    return [c for c in df.columns if c not in known and not str(c).startswith('_')]
+
+
+def _encode_integer_categories(values, max_range=1024):
+    """
+    整数编码变量的快速编码：减去列最小值后查表压缩掉未出现的取值，无需排序
+
+    存在非整数取值或取值范围过大时返回 (None, None)。
+    """
+    n, n_vars = values.shape
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        lo = np.where(valid.any(axis=0), np.nanmin(np.where(valid, values, np.inf), axis=0), 0)
+        hi = np.where(valid.any(axis=0), np.nanmax(np.where(valid, values, -np.inf), axis=0), 0)
+    width = int((hi - lo).max()) + 1 if n_vars else 1
+    if width > max_range or not np.all(np.where(valid, values == np.round(values), True)):
+        return None, None
+    offset = np.where(valid, values - lo, 0).astype('int64') + np.arange(n_vars) * width
+    present = np.bincount(offset[valid], minlength=n_vars * width).reshape(n_vars, width) > 0
+    # 原取值偏移 -> 本列中的类别编码
+    lookup = np.cumsum(present, axis=1) - 1
+    codes = np.where(valid, lookup.ravel()[offset], -1)
+    levels = [lo[j] + np.flatnonzero(present[j]) for j in range(n_vars)]
+    return codes, levels
+
+
+def _encode_categories(values):
+    """
+    对 n × V 的取值矩阵按列分别编码 (一次排序完成，不逐列循环)
+
+    返回:
+        (各元素在本列中的类别编码 (缺失为 -1), 各列的类别取值列表)
+    """
+    n, n_vars = values.shape
+    codes, levels = _encode_integer_categories(values)
+    if codes is not None:
+        return codes, levels
+    flat = values.ravel(order='F')
+    var = np.repeat(np.arange(n_vars), n)
+    valid = ~np.isnan(flat)
+    pos = np.flatnonzero(valid)
+    order = pos[np.lexsort((flat[pos], var[pos]))]
+    sorted_vals = flat[order]
+    sorted_var = var[order]
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (sorted_var[1:] != sorted_var[:-1]) | (sorted_vals[1:] != sorted_vals[:-1])
+    gid = np.cumsum(new) - 1
+    # 每列第一个类别的全局编号
+    first = np.full(n_vars, 0)
+    starts = new & np.r_[True, sorted_var[1:] != sorted_var[:-1]]
+    first[sorted_var[starts]] = gid[starts]
+    codes = np.full(n * n_vars, -1)
+    codes[order] = gid - first[sorted_var]
+    uniq_var = sorted_var[new]
+    uniq_val = sorted_vals[new]
+    levels = [uniq_val[uniq_var == j] for j in range(n_vars)]
+    return codes.reshape((n, n_vars), order='F'), levels
+
+
+def _binary_columns(df, variables):
+    """取值只有 0/1 且无缺失的整数列 (多选题虚拟变量)"""
+    ints = [v for v in variables
+            if pd.api.types.is_bool_dtype(df[v].dtype)
+            or (isinstance(df[v].dtype, np.dtype) and pd.api.types.is_integer_dtype(df[v].dtype))]
+    if not ints:
+        return set()
+    lo = df[ints].min().to_numpy(dtype='float64')
+    hi = df[ints].max().to_numpy(dtype='float64')
+    return {v for v, a, b in zip(ints, lo, hi) if a >= 0 and b <= 1}
+
+
+def _crosstab_tables(df, variables, rows, stratum, n_strata, labels, n_labels,
+                     block_cells=5_000_000):
+    """
+    构造全部列联表 (分层 × 变量 × 类别 × 分组)
+
+    0/1 虚拟变量由 (分层 × 分组) 指示矩阵与数据矩阵的一次矩阵乘积得到各组中取 1 的个数；
+    其他变量一次编码、一次 bincount。变量按列分块，内存占用与变量个数无关。
+
+    返回:
+        (四维频数数组，各变量的类别取值列表)
+    """
+    n = len(rows)
+    n_vars = len(variables)
+    step = max(1, block_cells // max(n, 1))
+    binary = _binary_columns(df, variables)
+    results = {}
+
+    dummy_idx = [j for j, v in enumerate(variables) if v in binary]
+    if dummy_idx:
+        group = stratum * n_labels + labels
+        indicator = sparse.csr_matrix((np.ones(n), (group, np.arange(n))),
+                                      shape=(n_strata * n_labels, n))
+        sizes = np.bincount(group, minlength=n_strata * n_labels).reshape(n_strata, 1, n_labels)
+        for start in range(0, len(dummy_idx), step):
+            block = dummy_idx[start:start + step]
+            values = df[[variables[j] for j in block]].to_numpy(dtype='float64')[rows]
+            ones = np.rint(indicator @ values).astype('int64')
+            ones = ones.reshape(n_strata, n_labels, len(block)).transpose(0, 2, 1)
+            counts = np.stack([sizes - ones, ones], axis=2)
+            present = counts.sum(axis=(0, 3)) > 0
+            for i, j in enumerate(block):
+                keep = np.flatnonzero(present[i])
+                results[j] = (counts[:, i, keep], np.array([0.0, 1.0])[keep])
+
+    other_idx = [j for j in range(n_vars) if variables[j] not in binary]
+    for start in range(0, len(other_idx), step):
+        block = other_idx[start:start + step]
+        values = df[[variables[j] for j in block]].to_numpy(dtype='float64', na_value=np.nan)[rows]
+        codes, block_levels = _encode_categories(values)
+        width = len(block)
+        n_levels = max((len(lv) for lv in block_levels), default=1)
+        valid = codes >= 0
+        cell = ((stratum[:, None] * width + np.arange(width)[None, :]) * n_levels + codes) \
+            * n_labels + labels[:, None]
+        counts = np.bincount(cell[valid], minlength=n_strata * width * n_levels * n_labels)
+        counts = counts.reshape(n_strata, width, n_levels, n_labels)
+        for i, j in enumerate(block):
+            results[j] = (counts[:, i, :len(block_levels[i])], block_levels[i])
+
+    n_levels = max((len(lv) for _, lv in results.values()), default=1)
+    tables = np.zeros((n_strata, n_vars, max(n_levels, 1), n_labels), dtype='int64')
+    levels = []
+    for j in range(n_vars):
+        counts, lv = results[j]
+        tables[:, j, :len(lv)] = counts
+        levels.append(lv)
+    return tables, levels
+
+
+def _chi2_from_tables(tables):
+    """
+    对堆叠的列联表 (..., R, C) 向量化计算 Pearson 卡方
+
+    全零的行与列 (填充或该分层没有的类别) 不参与计算，自由度按非零行列数计。
+
+    返回:
+        (chi2, 自由度, 样本数, 期望频数)
+    """
+    tables = tables.astype('float64')
+    rows = tables.sum(axis=-1)
+    cols = tables.sum(axis=-2)
+    total = rows.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = rows[..., :, None] * cols[..., None, :] / total[..., None, None]
+        contrib = np.where(expected > 0, (tables - expected) ** 2 / expected, 0)
+    chi2 = contrib.sum(axis=(-2, -1))
+    dof = ((rows > 0).sum(axis=-1) - 1) * ((cols > 0).sum(axis=-1) - 1)
+    return chi2, dof, total, expected
+
+
+def _fisher_2x2(tables):
+    """
+    2 × 2 表的 Fisher 精确检验 (双侧，超几何分布，多个表一次计算)
+
+    参数:
+        tables: (T, 2, 2) 列联表
+    """
+    a = tables[:, 0, 0]
+    r1 = tables[:, 0].sum(axis=1)
+    c1 = tables[:, :, 0].sum(axis=1)
+    total = tables.sum(axis=(1, 2))
+    lo = np.maximum(0, r1 + c1 - total)
+    hi = np.minimum(r1, c1)
+    support = lo[:, None] + np.arange(int((hi - lo).max()) + 1 if len(a) else 1)[None, :]
+    inside = support <= hi[:, None]
+    logpmf = stats.hypergeom.logpmf(support, total[:, None], r1[:, None], c1[:, None])
+    observed = stats.hypergeom.logpmf(a, total, r1, c1)
+    # 与 scipy.stats.fisher_exact 相同的相对容差
+    extreme = inside & (logpmf <= observed[:, None] + np.log1p(1e-7))
+    return np.minimum(np.where(extreme, np.exp(logpmf), 0).sum(axis=1), 1.0)
+
+
+def _nonzero_2x2(tables):
+    """取出有效行列恰为 2 × 2 的表中的非零行列"""
+    rows = np.argsort(tables.sum(axis=2) == 0, axis=1, kind='stable')[:, :2]
+    tables = np.take_along_axis(tables, rows[:, :, None], axis=1)
+    cols = np.argsort(tables.sum(axis=1) == 0, axis=1, kind='stable')[:, :2]
+    return np.take_along_axis(tables, cols[:, None, :], axis=2)
+
+
+def adjust_pvalues(pvalues, method='holm'):
+    """
+    多重检验校正 (缺失的 p 值不参与校正)
+
+    参数:
+        pvalues: p 值数组
+        method: 'bonferroni' / 'holm' / 'fdr_bh' (Benjamini-Hochberg)
+    """
+    p = np.asarray(pvalues, dtype='float64')
+    adjusted = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    m = len(valid)
+    if m == 0:
+        return adjusted
+    order = valid[np.argsort(p[valid], kind='stable')]
+    sorted_p = p[order]
+    if method == 'bonferroni':
+        adj = sorted_p * m
+    elif method == 'holm':
+        adj = np.maximum.accumulate(sorted_p * (m - np.arange(m)))
+    elif method == 'fdr_bh':
+        adj = np.minimum.accumulate((sorted_p * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"不支持的校正方法: {method}")
+    adjusted[order] = np.minimum(adj, 1.0)
+    return adjusted
+
+
+def _permutation_pvalues(codes, n_levels, labels, n_labels, stratum, n_strata, chi2_obs,
+                         n_perm, rng, max_cells=20_000_000):
+    """
+    Monte-Carlo 置换 p 值：在各分层内打乱分组标签，一次 bincount 得到全部置换表
+
+    参数:
+        codes: n × V 的类别编码 (需要置换检验的变量)
+        labels: 分组编码 (0..n_labels-1)
+        stratum: 分层编码，行已按分层排序
+        chi2_obs: (S, V) 观测卡方
+    """
+    n, n_vars = codes.shape
+    valid = codes >= 0
+    exceed = np.zeros((n_strata, n_vars))
+    done = 0
+    chunk = max(1, max_cells // max(n * n_vars, 1))
+    while done < n_perm:
+        b = min(chunk, n_perm - done)
+        # 分层编码加上 [0,1) 随机数后排序，只在分层内打乱
+        perm = np.argsort(stratum[None, :] + rng.random((b, n)), axis=1)
+        perm_labels = labels[perm]
+        cell = ((np.arange(b)[:, None, None] * n_strata + stratum[None, :, None]) * n_vars
+                + np.arange(n_vars)[None, None, :]) * n_levels
+        cell = (cell + codes[None, :, :]) * n_labels + perm_labels[:, :, None]
+        keep = np.broadcast_to(valid[None, :, :], cell.shape)
+        counts = np.bincount(cell[keep], minlength=b * n_strata * n_vars * n_levels * n_labels)
+        tables = counts.reshape(b, n_strata, n_vars, n_levels, n_labels)
+        chi2, _, _, _ = _chi2_from_tables(tables)
+        exceed += (chi2 >= chi2_obs[None] * (1 - 1e-10)).sum(axis=0)
+        done += b
+    return (exceed + 1) / (n_perm + 1)
+
+
+def chi2_battery(df, variables=None, by='participate', strata=None, p_method='auto',
+                 n_perm=2000, correction='holm', seed=12345):
+    """
+    分类变量 × 分组变量的卡方检验组，所有列联表一次构造、向量化计算
+
+    参数:
+        df: 结构化数据
+        variables: 检验变量，None 时为 CHI2_VARS 与全部多选题虚拟变量
+        by: 分组变量 (默认是否参与农文旅)
+        strata: 分层变量名或列表，在各分层内分别检验
+        p_method: 'asymptotic' 只用卡方分布；'auto' 对稀疏表 (期望频数 < 1，或超过 20%
+                  的格子期望频数 < 5) 改用精确 p 值 (2 × 2 表，Fisher) 或
+                  Monte-Carlo 置换 p 值 (其他表)；'exact' 对全部 2 × 2 表用 Fisher、
+                  其他表用置换；'permutation' 全部使用置换 p 值
+        n_perm: 置换次数
+        correction: 多重检验校正方法 (见 adjust_pvalues)，None 时不校正
+        seed: 置换检验的随机数种子
+
+    返回:
+        (检验结果表, 列联表长表)
+    """
+    if variables is None:
+        variables = [v for v in CHI2_VARS if v in df.columns] + multiselect_dummy_columns(df)
+    variables = [v for v in variables if v != by]
+    strata = [] if strata is None else ([strata] if isinstance(strata, str) else list(strata))
+
+    # 分组与分层编码，缺失的样本剔除；按分层排序便于分层内置换
+    label_values = df[by].to_numpy(dtype='float64', na_value=np.nan)
+    if strata:
+        stratum_all = df.groupby(strata, observed=True, sort=True).ngroup().to_numpy()
+        stratum_keys = df.groupby(strata, observed=True, sort=True).size().index
+    else:
+        stratum_all = np.zeros(len(df), dtype='int64')
+        stratum_keys = None
+    rows = np.flatnonzero(~np.isnan(label_values) & (stratum_all >= 0))
+    rows = rows[np.argsort(stratum_all[rows], kind='stable')]
+    stratum = stratum_all[rows]
+    n_strata = int(stratum.max()) + 1 if len(rows) else 0
+    labels, label_levels = pd.factorize(label_values[rows], sort=True)
+    n_labels = len(label_levels)
+
+    tables, levels = _crosstab_tables(df, variables, rows, stratum, n_strata, labels, n_labels)
+    n_vars = len(variables)
+    n_levels = tables.shape[2]
+
+    chi2, dof, total, expected = _chi2_from_tables(tables)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_asym = np.where(dof > 0, stats.chi2.sf(chi2, np.maximum(dof, 1)), np.nan)
+        k = np.minimum((tables.sum(axis=-1) > 0).sum(axis=-1), (tables.sum(axis=-2) > 0).sum(axis=-1))
+        cramer_v = np.sqrt(chi2 / (total * (k - 1)))
+    cramer_v = np.where(dof > 0, cramer_v, np.nan)
+
+    # 稀疏表判断 (Cochran 规则)，只统计非零行列的格子
+    used = (tables.sum(axis=-1) > 0)[..., :, None] & (tables.sum(axis=-2) > 0)[..., None, :]
+    n_cells = used.sum(axis=(-2, -1))
+    small = (used & (expected < 5)).sum(axis=(-2, -1))
+    small_expected = (dof > 0) & ((used & (expected < 1)).any(axis=(-2, -1))
+                                  | (small > 0.2 * n_cells))
+    is_2x2 = dof == 1
+
+    if p_method == 'asymptotic':
+        use_exact = np.zeros_like(small_expected)
+        use_perm = np.zeros_like(small_expected)
+    elif p_method == 'auto':
+        use_exact = small_expected & is_2x2
+        use_perm = small_expected & ~is_2x2
+    elif p_method == 'exact':
+        use_exact = (dof > 0) & is_2x2
+        use_perm = (dof > 0) & ~is_2x2
+    elif p_method == 'permutation':
+        use_exact = np.zeros_like(small_expected)
+        use_perm = dof > 0
+    else:
+        raise ValueError(f"不支持的 p 值方法: {p_method}")
+
+    pvalue = p_asym.copy()
+    method = np.where(dof > 0, '渐近', '').astype(object)
+    if use_exact.any():
+        pvalue[use_exact] = _fisher_2x2(_nonzero_2x2(tables[use_exact]))
+        method[use_exact] = 'Fisher精确'
+    if use_perm.any():
+        perm_vars = np.flatnonzero(use_perm.any(axis=0))
+        codes, _ = _encode_categories(
+            df[[variables[j] for j in perm_vars]].to_numpy(dtype='float64', na_value=np.nan)[rows])
+        p_perm = _permutation_pvalues(codes, n_levels, labels, n_labels, stratum,
+                                      n_strata, chi2[:, perm_vars], n_perm,
+                                      np.random.default_rng(seed))
+        full = np.full(chi2.shape, np.nan)
+        full[:, perm_vars] = p_perm
+        pvalue[use_perm] = full[use_perm]
+        method[use_perm] = f'置换({n_perm}次)'
+
+    result = pd.DataFrame({
+        '变量': np.tile(variables, n_strata),
+        '样本数': total.ravel().astype('int64'),
+        'chi2': chi2.ravel(),
+        '自由度': dof.ravel(),
+        'p值': pvalue.ravel(),
+        'p值方法': method.ravel(),
+        "Cramér's V": cramer_v.ravel(),
+        '稀疏': small_expected.ravel(),
+    })
+    if correction:
+        result[f'校正p值({correction})'] = adjust_pvalues(result['p值'].to_numpy(), correction)
+    if strata:
+        keys = stratum_keys.to_frame(index=False).loc[np.repeat(np.arange(n_strata), n_vars)]
+        result = pd.concat([keys.reset_index(drop=True), result], axis=1)
+
+    # 列联表长表 (只保留出现过的类别)
+    level_values = np.full((n_vars, n_levels), np.nan)
+    for j, lv in enumerate(levels):
+        level_values[j, :len(lv)] = lv
+    s_idx, v_idx, r_idx, c_idx = np.nonzero(~np.isnan(level_values)[None, :, :, None]
+                                            & (tables >= 0))
+    crosstab = pd.DataFrame({
+        '变量': np.asarray(variables, dtype=object)[v_idx],
+        '取值': level_values[v_idx, r_idx],
+        by: label_levels[c_idx],
+        '频数': tables[s_idx, v_idx, r_idx, c_idx],
+    })
+    if strata:
+        keys = stratum_keys.to_frame(index=False).iloc[s_idx].reset_index(drop=True)
+        crosstab = pd.concat([keys, crosstab], axis=1)
+    return result, crosstab
+
+
+def run_chi2_tests(input_file, output_file='chi2_results.xlsx', **kwargs):
+    """
+    读取结构化数据，进行卡方检验并输出到 Excel (对应 Chi-squared test.do)
+
+    参数:
+        input_file: 结构化数据路径
+        output_file: 输出的 Excel 文件
+        kwargs: 传给 chi2_battery 的参数
+    """
+    from survey_io import load_structured
+
+    print("正在读取数据...")
+    df = load_structured(input_file)
+    result, crosstab = chi2_battery(df, **kwargs)
+    print(f"共 {len(result)} 个卡方检验")
+    print(result.head(20).round(4).to_string(index=False))
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        result.to_excel(writer, sheet_name='卡方检验', index=False)
+        crosstab.to_excel(writer, sheet_name='列联表', index=False)
+    print(f"\n结果已保存到: {output_file}")
+    return result
+
+
+if __name__ == "__main__":
+    run_chi2_tests("structured_data.parquet", "chi2_results.xlsx")
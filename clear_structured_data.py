@@ -2,216 +2,276 @@ import pandas as pd
 import numpy as np
 import os
 import re
+from scipy import sparse
 
-def process_survey_data(input_file, output_file='structured_data.xlsx'):
+from codebook import CODEBOOK, compile_plan
+from instrument import span
+from validation import combine_results, enforce_rules, print_summary
+
+# 多选题选项分隔符与“其他（请注明）”的填写格式
+MULTI_SELECT_SEP = '┋'
+OTHER_PATTERN = re.compile(r'其他（请注明）〖(.*?)〗')
+
+
+def _clean_multiselect(col_data):
+    """将多选题原始列统一为字符串，(跳过) 与缺失视为未选择"""
+    return col_data.replace('(跳过)', '').fillna('').astype(str)
+
+
+def _tokenize_multiselect(col_data):
+    """
+    一次性拆分多选题列
+
+    返回:
+        rows: 每个选项所在的行位置
+        tokens: 去除首尾空白后的非空选项文本
+    """
+    parts = col_data.str.split(MULTI_SELECT_SEP)
+    rows = np.repeat(np.arange(len(parts)), parts.str.len().to_numpy())
+    tokens = parts.explode().str.strip().to_numpy(dtype=object)
+    keep = tokens != ''
+    return rows[keep], tokens[keep]
+
+
+def discover_multiselect_options(col_data):
+    """
+    提取多选题的全部选项（按出现频数降序），并追加“其他（请注明）”的具体说明
+
+    参数:
+        col_data: 多选题原始列 (以'┋'分隔)
+
+    返回:
+        选项列表，“其他”的具体说明以 '其他_' 为前缀
+    """
+    col_data = _clean_multiselect(col_data)
+    _, tokens = _tokenize_multiselect(col_data)
+    options = pd.Series(tokens, dtype=object).value_counts().index.tolist()
+    others = col_data.str.findall(OTHER_PATTERN).explode().dropna()
+    options.extend(f'其他_{o}' for o in pd.unique(others))
+    return options
+
+
+def _option_needle(option):
+    """选项在单元格中的匹配文本；'其他_xxx' 匹配 '〖xxx〗'"""
+    if option.startswith('其他_'):
+        return f"〖{option.replace('其他_', '')}〗"
+    return option
+
+
+def multiselect_indicator_matrix(col_data, options):
+    """
+    构造多选题的稀疏指示矩阵 (行 × 选项)
+
+    每列只拆分一次：先得到 行 × 不同选项文本 的稀疏矩阵，
+    再与 选项文本 × 目标选项 的包含关系矩阵相乘，所有选项一次完成。
+    匹配规则为“选项文本包含该关键词”。
+
+    参数:
+        col_data: 多选题原始列
+        options: 选项列表 (见 discover_multiselect_options)
+
+    返回:
+        scipy.sparse.csr_matrix (bool)，形状为 (行数, 选项数)
+    """
+    col_data = _clean_multiselect(col_data)
+    rows, tokens = _tokenize_multiselect(col_data)
+    codes, uniques = pd.factorize(tokens)
+    token_matrix = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int32), (rows, codes)),
+        shape=(len(col_data), len(uniques))
+    )
+    # 包含关系只在不同选项文本上计算，与样本量无关
+    unique_tokens = pd.Series(uniques, dtype=object)
+    contain_rows, contain_cols = [], []
+    for j, option in enumerate(options):
+        hit = np.flatnonzero(unique_tokens.str.contains(_option_needle(option), regex=False).to_numpy(dtype=bool))
+        contain_rows.append(hit)
+        contain_cols.append(np.full(len(hit), j))
+    contain_rows = np.concatenate(contain_rows) if contain_rows else np.array([], dtype=np.int64)
+    contain_cols = np.concatenate(contain_cols) if contain_cols else np.array([], dtype=np.int64)
+    contain_matrix = sparse.csr_matrix(
+        (np.ones(len(contain_rows), dtype=np.int32), (contain_rows, contain_cols)),
+        shape=(len(uniques), len(options))
+    )
+    return (token_matrix @ contain_matrix) > 0
+
+
+def safe_column_name(option):
+    """列名安全化"""
+    return re.sub(r'\W+', '_', option)
+
+
+def _is_free_text_option(option):
+    """是否为“其他（请注明）”的自由填写选项"""
+    return option.startswith('其他_') or '〖' in option
+
+
+def rare_free_text_options(col_data, options, min_other_freq):
+    """
+    找出频数低于 min_other_freq 的“其他”自由填写选项
+
+    参数:
+        col_data: 多选题原始列
+        options: 选项列表
+        min_other_freq: 最小频数
+
+    返回:
+        低频选项列表
+    """
+    counts = np.asarray(multiselect_indicator_matrix(col_data, options).sum(axis=0)).ravel()
+    return [o for o, n in zip(options, counts) if _is_free_text_option(o) and n < min_other_freq]
+
+
+def encode_multiselect(col_data, options=None, sparse_output=False, min_other_freq=None,
+                       rare_options=None):
+    """
+    将多选题列展开为 0/1 虚拟变量 (适用于问题7、10、12、19)
+
+    参数:
+        col_data: 多选题原始列 (以'┋'分隔)
+        options: 选项列表，None 时从数据中提取
+        sparse_output: 为 True 时以 pandas SparseDtype 列保存虚拟变量
+        min_other_freq: “其他”自由填写选项的最小频数，低于该值的合并为 '其他_rare'
+        rare_options: 预先确定需要合并的低频选项，给定时忽略 min_other_freq
+                      (分块处理时保证各块列一致)
+
+    返回:
+        虚拟变量数据框，列名为安全化后的选项名
+    """
+    if options is None:
+        options = discover_multiselect_options(col_data)
+    options = list(options)
+    indicators = multiselect_indicator_matrix(col_data, options).tocsc()
+
+    # 合并低频的“其他”自由填写选项
+    rare = None
+    if rare_options is not None:
+        rare_options = set(rare_options)
+        rare = np.array([o in rare_options for o in options], dtype=bool)
+    elif min_other_freq is not None and len(options) > 0:
+        counts = np.asarray(indicators.sum(axis=0)).ravel()
+        rare = np.array([_is_free_text_option(o) for o in options]) & (counts < min_other_freq)
+    if rare is not None and rare.any():
+        rare_col = indicators[:, np.flatnonzero(rare)].sum(axis=1) > 0
+        indicators = sparse.hstack([indicators[:, np.flatnonzero(~rare)],
+                                    sparse.csc_matrix(rare_col)], format='csc')
+        options = [o for o, r in zip(options, rare) if not r] + ['其他_rare']
+
+    # 安全化后重名的选项以后出现者为准，列位置保持首次出现的位置
+    positions = {}
+    for j, option in enumerate(options):
+        positions[safe_column_name(option)] = j
+    names = list(positions)
+    indicators = indicators[:, list(positions.values())]
+
+    if sparse_output:
+        dummies = pd.DataFrame.sparse.from_spmatrix(indicators.astype(np.int8), columns=names)
+        dummies.index = col_data.index
+        return dummies
+    return pd.DataFrame(indicators.toarray().astype(np.int64), columns=names, index=col_data.index)
+
+
+def densify(df):
+    """将数据框中的稀疏列 (SparseDtype) 转换为普通稠密列"""
+    sparse_cols = [c for c in df.columns if isinstance(df[c].dtype, pd.SparseDtype)]
+    if not sparse_cols:
+        return df
+    df = df.copy()
+    df[sparse_cols] = df[sparse_cols].sparse.to_dense()
+    return df
+
+
+def recode_survey_frame(df, multiselect_options=None, id_start=1, sparse_dummies=False,
+                        min_other_freq=None, rare_options=None, codebook=CODEBOOK):
+    """
+    按码本对原始数据进行编码，返回结构化数据框 (不做任何读写)
+
+    参数:
+        df: 原始问卷数据 (整表或分块)
+        multiselect_options: {多选题变量名: 选项列表}，未给出的从 df 中提取；
+                             分块处理时应传入全局选项
+        id_start: 第一行的序号
+        sparse_dummies: 为 True 时多选题虚拟变量以稀疏列保存
+        min_other_freq: “其他”自由填写选项的最小频数，低于该值的合并为 '其他_rare'
+        rare_options: {多选题变量名: 低频选项列表} (分块处理时使用全局频数)
+        codebook: 码本，默认为 codebook.CODEBOOK
+    """
+    df = df.reset_index(drop=True)
+    multiselect_options = multiselect_options or {}
+    rare_options = rare_options or {}
+
+    # 1-19. 单选与数值变量：按编译后的编码计划查表
+    with span('clean.recode.codebook', rows_in=len(df)) as sp:
+        plan = compile_plan(df.columns, codebook)
+        blocks = [plan.apply(df, id_start=id_start)]
+        sp.record(columns_created=blocks[0].shape[1])
+
+    # 20. 多选题 (问题19 - 主要问题)：展开为虚拟变量
+    for name, position in plan.multiselect.items():
+        with span('clean.recode.multiselect', variable=name, rows_in=len(df)) as sp:
+            blocks.append(encode_multiselect(df.iloc[:, position],
+                                             options=multiselect_options.get(name),
+                                             sparse_output=sparse_dummies,
+                                             min_other_freq=min_other_freq,
+                                             rare_options=rare_options.get(name)))
+            sp.record(columns_created=blocks[-1].shape[1])
+
+    with span('clean.recode.concat', rows_in=len(df)):
+        return pd.concat(blocks, axis=1)
+
+
+def process_survey_data(input_file, output_file='structured_data.parquet',
+                        sparse_dummies=False, min_other_freq=None,
+                        excel_file=None, stata_file=None, validation='report'):
     """
     处理问卷数据，将其转换为结构化的数据表
 
     参数:
-        input_file: 输入的Excel文件路径
-        output_file: 输出的Excel文件路径
+        input_file: 输入的问卷文件路径 (.xlsx / .xls / .csv)
+        output_file: 输出路径，格式由扩展名决定 (.parquet / .feather / .dta / .xlsx)
+        sparse_dummies: 为 True 时多选题虚拟变量以稀疏列保存在返回的数据框中
+                        (可用 densify 转为稠密数据框)
+        min_other_freq: “其他”自由填写选项的最小频数，低于该值的合并为 '其他_rare'
+        excel_file: 另外导出的 Excel 文件路径 (可选，仅用于展示)
+        stata_file: 另外导出的 Stata .dta 文件路径 (可选，供 do 文件使用)
+        validation: 逻辑约束校验的处理策略 (见 validation.enforce_rules)，
+                    'quarantine' 时违反规则的样本保存到 <输出文件名>_隔离样本.parquet；
+                    None 时不校验
     """
+    from survey_io import read_survey, save_structured
 
     # 读取原始数据
     print("正在读取数据...")
-    df = pd.read_excel(input_file)
-
-    # 创建新的数据框
-    processed_data = pd.DataFrame()
-
-    # 1. 序号 (ID)
-    processed_data['ID'] = range(1, len(df) + 1)
-
-    # 2. 性别 (gender): 0=男, 1=女
-    # 假设原始数据中"男"和"女"在某一列
-    gender_col = df.iloc[:, 1]  # 根据图片，性别在第2列
-    processed_data['gender'] = gender_col.map({'男': 0, '女': 1})
-
-    # 3. 年龄分层 (age_cat)
-    age_col = df.iloc[:, 2]  # 年龄在第3列
-    age_mapping = {
-        '35岁及以下': 1,
-        # '小学及以下': 1,  # 可能的变体
-        '36-45岁': 2,
-        '46-55岁': 3,
-        '56-65岁': 4,
-        '66岁及以上': 5
-    }
-    processed_data['age_cat'] = age_col.map(age_mapping)
-
-    # 4. 受教育程度 (edu)
-    edu_col = df.iloc[:, 3]  # 教育程度在第4列
-    edu_mapping = {
-        '小学及以下': 1,
-        '初中/中专': 2,
-        '高中': 3,
-        '大专': 4,
-        '本科': 5
-    }
-    processed_data['edu'] = edu_col.map(edu_mapping)
-
-    # 5. 家庭人口相关变量 (问题4)
-    processed_data['f_size'] = pd.to_numeric(df.iloc[:, 4], errors='coerce')  # 家庭总人口
-    processed_data['up15_size'] = pd.to_numeric(df.iloc[:, 5], errors='coerce')  # 15周岁以上人口
-    processed_data['l_size'] = pd.to_numeric(df.iloc[:, 6], errors='coerce')  # 劳动人口
-    processed_data['migrant'] = pd.to_numeric(df.iloc[:, 7], errors='coerce')  # 外出务工人数
-
-    # 6. 家庭年总收入 (问题5)
-    processed_data['income'] = pd.to_numeric(df.iloc[:, 8], errors='coerce')
-
-    # 生成收入的自然对数
-    # processed_data['ln_income'] = np.log(processed_data['income'].replace(0, np.nan))
-
-    # 7. 是否参与农文旅 (问题6) - 决策变量
-    participate_col = df.iloc[:, 9]
-    processed_data['participate'] = participate_col.map({'是': 1, '否': 0})
-
-    # 8. 处理问题7 - 从事农文旅的方式 (多选题，需要拆分)
-    # 这部分需要根据实际列数和内容调整
-
-    # 9. 农文旅收入 (问题8)
-    processed_data['agri_income'] = pd.to_numeric(df.iloc[:, 11], errors='coerce').replace('(跳过)', '').fillna(0)
-
-    # 10. 分红收入 (问题9)
-    processed_data['dividend'] = pd.to_numeric(df.iloc[:, 12], errors='coerce').replace('(跳过)', '').fillna(0)
-
-    # 11. 处理问题10 - 未从事农文旅的原因 (多选题)
-    # 根据实际情况添加虚拟变量
-
-    # 12. 技能培训 (问题11)
-    training_col = df.iloc[:, 14] if len(df.columns) > 14 else None
-    if training_col is not None:
-        training_mapping = {
-            '是，政府组织': 1,
-            '是，企业培训': 2,
-            '是，在学校学习过': 3,
-            '否': 4
-        }
-        processed_data['training'] = training_col.map(training_mapping)
-        # 生成二分变量
-        processed_data['training_yes'] = processed_data['training'].apply(
-            lambda x: 1 if x in [1, 2, 3] else 0 if x == 4 else np.nan
-        )
-
-    # 13. 处理问题12 - 淡季工作 (多选题)
-    # 根据实际情况添加虚拟变量
-
-    # 14. 耕地面积分层 (问题13)
-    land_col = df.iloc[:, 16] if len(df.columns) > 16 else None
-    if land_col is not None:
-        land_mapping = {
-            '无': 0,
-            '1-5亩': 1,
-            '6-10亩': 2,
-            '11-15亩': 3,
-            '16-20亩': 4,
-            '21亩及以上': 5
-        }
-        processed_data['land_cat'] = land_col.map(land_mapping)
-
-    # 15. 交通通畅程度 (问题14)
-    transport_col = df.iloc[:, 17] if len(df.columns) > 17 else None
-    if transport_col is not None:
-        likert_mapping = {
-            '极差': 1,
-            '较差': 2,
-            '一般': 3,
-            '较高': 4,
-            '非常完善': 5,
-            '极弱': 1,
-            '较弱': 2,
-            '较强': 4,
-            '极强': 5
-        }
-        processed_data['transport'] = transport_col.map(likert_mapping)
-
-    # 16. 政策扶持力度 (问题15) - 工具变量
-    policy_col = df.iloc[:, 18] if len(df.columns) > 18 else None
-    if policy_col is not None:
-        processed_data['policy'] = policy_col.map(likert_mapping)
-
-    # 17. 信息化建设程度 (问题16)
-    info_col = df.iloc[:, 19] if len(df.columns) > 19 else None
-    if info_col is not None:
-        processed_data['info'] = info_col.map(likert_mapping)
-
-    # 18. 旅游吸引力 (问题17)
-    attraction_col = df.iloc[:, 20] if len(df.columns) > 20 else None
-    if attraction_col is not None:
-        processed_data['attraction'] = attraction_col.map(likert_mapping)
-
-    # 19. 环境卫生条件 (问题18)
-    env_col = df.iloc[:, 21] if len(df.columns) > 21 else None
-    if env_col is not None:
-        env_mapping = {
-            '完全不适合': 1,
-            '适合但需要改进': 2,
-            '适合需要加大投入建设': 3,
-            '适合': 4,
-            '非常适合': 5
-        }
-        processed_data['env'] = env_col.map(env_mapping)
-
-    # 20. 处理问题19 - 主要问题 (多选题)
-    # 根据实际列数添加虚拟变量
-    col_data = df.iloc[:, 22].replace('(跳过)', '').fillna('')
-    # ---- Step 1: 提取所有不同选项 ----
-    all_items = []
-    for x in col_data:
-        items = [i.strip() for i in str(x).split('┋') if i.strip()]
-        all_items.extend(items)
-    unique_items = pd.Series(all_items).value_counts().index.tolist()
-    # ---- Step 2: 识别“其他（请注明）” ----
-    other_pattern = re.compile(r'其他（请注明）〖(.*?)〗')
-    other_items = set()
-    for x in col_data:
-        matches = other_pattern.findall(str(x))
-        other_items.update(matches)
-    # 把“其他”具体说明加入 unique_items（加上前缀）
-    for o in other_items:
-        unique_items.append(f'其他_{o}')
-    # ---- Step 3: 创建虚拟变量列 ----
-    def has_keyword(x, kw):
-        if kw.startswith('其他_'):
-            real_kw = kw.replace('其他_', '')
-            return 1 if f'〖{real_kw}〗' in str(x) else 0
-        else:
-            return 1 if kw in str(x) else 0
-    for kw in unique_items:
-        safe_col = re.sub(r'\W+', '_', kw)  # 列名安全化
-        processed_data[safe_col] = col_data.apply(lambda x: has_keyword(x, kw))
+    with span('clean.1_read', input_file=str(input_file)) as sp:
+        df = read_survey(input_file)
+        sp.record(rows_out=len(df), columns_out=df.shape[1])
+
+    with span('clean.2_recode', rows_in=len(df), columns_in=df.shape[1]) as sp:
+        processed_data = recode_survey_frame(df, sparse_dummies=sparse_dummies,
+                                             min_other_freq=min_other_freq)
+        sp.record(rows_out=len(processed_data), columns_created=processed_data.shape[1])
+
+    # 逻辑约束校验 (人口结构、收入构成、跳转逻辑)
+    if validation is not None:
+        processed_data, result = enforce_rules(
+            processed_data, policy=validation,
+            quarantine_file=os.path.splitext(output_file)[0] + '_隔离样本.parquet')
+        print_summary(result)
 
     # 保存处理后的数据
     print(f"正在保存数据到 {output_file}...")
-    processed_data.to_excel(output_file, index=False)
+    with span('clean.3_save', rows_in=len(processed_data), output_file=str(output_file)):
+        save_structured(processed_data, output_file)
+        for extra_file in (excel_file, stata_file):
+            if extra_file:
+                print(f"正在导出 {extra_file}...")
+                save_structured(processed_data, extra_file)
 
     # 生成数据字典
-    data_dict = {
-        '变量名': ['ID', 'gender', 'age_cat', 'edu', 'f_size', 'up15_size', 'l_size',
-                   'migrant', 'income', 'ln_income', 'participate', 'agri_income',
-                   'dividend', 'training', 'training_yes', 'land_cat', 'transport',
-                   'policy', 'info', 'attraction', 'env'],
-        '变量含义': ['样本唯一编号', '受访者性别', '年龄分层', '受教育程度', '家庭总人口',
-                     '15周岁以上人口数', '家庭劳动人口数', '常年外出务工人数',
-                     '家庭年总收入(万元)', '收入的自然对数', '决策变量(处理组)',
-                     '农文旅收入(万元)', '分红收入(万元)', '技能培训', '是否培训(二分)',
-                     '耕地面积分层', '交通通畅程度', '政策扶持力度', '信息化建设程度',
-                     '旅游吸引力', '环境卫生条件'],
-        '编码说明': ['1,2,3,...', '0=男; 1=女', '1=35岁及以下; 2=36-45岁; 3=46-55岁; 4=56-65岁; 5=66岁及以上',
-                     '1=小学及以下; 2=初中/中专; 3=高中; 4=大专; 5=本科', '数值',
-                     '数值', '数值', '数值', '数值', 'ln(income)', '1=是; 0=否',
-                     '数值', '数值', '1=政府组织; 2=企业培训; 3=否', '1=是; 0=否',
-                     '0=无; 1=1-5亩; 2=6-10亩; 3=11-15亩; 4=16-20亩; 5=21亩及以上',
-                     '1=极差; 2=较差; 3=一般; 4=较高; 5=非常完善',
-                     '1=极弱; 2=较弱; 3=一般; 4=较强; 5=极强',
-                     '1=极差; 2=较差; 3=一般; 4=较高; 5=非常完善',
-                     '1=极弱; 2=较弱; 3=一般; 4=较强; 5=极强',
-                     '1=完全不适合; 2=适合但需要改进; 3=适合需要加大投入建设; 4=适合; 5=非常适合']
-    }
-
-    dict_df = pd.DataFrame(data_dict)
-    dict_output = output_file.replace('.xlsx', '_数据字典.xlsx')
-    dict_df.to_excel(dict_output, index=False)
+    with span('clean.4_dictionary'):
+        dict_df = compile_plan(df.columns).data_dictionary()
+        dict_output = os.path.splitext(output_file)[0] + '_数据字典.xlsx'
+        dict_df.to_excel(dict_output, index=False)
 
     # 输出描述性统计
     print("\n数据处理完成！")
@@ -222,15 +282,78 @@ def process_survey_data(input_file, output_file='structured_data.xlsx'):
 
     # 显示基本统计信息
     print("\n基本描述性统计:")
-    print(processed_data.describe())
+    with span('clean.5_describe', rows_in=len(processed_data)):
+        print(densify(processed_data).describe())
 
     return processed_data
 
+
+def process_survey_data_streaming(input_file, output_file='structured_data.parquet',
+                                  chunksize=50000, min_other_freq=None, validation='report'):
+    """
+    流式处理大型问卷导出文件：分块读取、编码并逐块写入 Parquet
+
+    第一遍只读取表头与多选题所在列，确定全局选项 (及需要合并的低频“其他”选项)，
+    第二遍逐块编码写出，内存占用与样本量无关。
+
+    参数:
+        input_file: 问卷文件路径 (.csv / .xlsx 可流式读取)
+        output_file: 输出的 Parquet 文件路径
+        chunksize: 每块的行数
+        min_other_freq: “其他”自由填写选项的最小频数，低于该值的合并为 '其他_rare'
+        validation: 逻辑约束校验的处理策略 (见 process_survey_data)
+
+    返回:
+        写出的总行数
+    """
+    from survey_io import (iter_survey_chunks, read_survey_header, read_survey_column,
+                           ParquetChunkWriter, compact_dtypes)
+
+    print("正在提取多选题的选项...")
+    plan = compile_plan(read_survey_header(input_file))
+    multiselect_options = {}
+    rare_options = {}
+    for name, position in plan.multiselect.items():
+        with span('clean.discover_options', variable=name) as sp:
+            col_data = read_survey_column(input_file, position)
+            multiselect_options[name] = discover_multiselect_options(col_data)
+            if min_other_freq is not None:
+                rare_options[name] = rare_free_text_options(col_data, multiselect_options[name],
+                                                            min_other_freq)
+            sp.record(rows_in=len(col_data), columns_created=len(multiselect_options[name]))
+            del col_data
+
+    print(f"正在分块处理数据 (每块 {chunksize} 行)...")
+    id_start = 1
+    results = []
+    quarantine_file = os.path.splitext(output_file)[0] + '_隔离样本.parquet'
+    with ParquetChunkWriter(output_file) as writer, \
+            ParquetChunkWriter(quarantine_file) as quarantine:
+        for chunk in iter_survey_chunks(input_file, chunksize=chunksize):
+            with span('clean.chunk', rows_in=len(chunk), id_start=id_start):
+                processed = recode_survey_frame(chunk, multiselect_options=multiselect_options,
+                                                id_start=id_start, rare_options=rare_options)
+                if validation is not None:
+                    processed, result = enforce_rules(processed, policy=validation,
+                                                      quarantine_file=quarantine)
+                    results.append(result)
+                # 各块统一数据类型，避免缺失值有无导致的 int/float 不一致
+                writer.write(compact_dtypes(processed))
+            id_start += len(chunk)
+            print(f"  已处理 {id_start - 1} 行")
+
+    if results:
+        print_summary(combine_results(results))
+    print(f"\n数据处理完成！处理后的数据已保存到: {output_file}")
+    return writer.rows
+
+
 if __name__ == "__main__":
     input_file = "农文旅融合对农户增收的影响研究问卷(1).xls" 
 
     if os.path.exists(input_file):
-        processed_df = process_survey_data(input_file)
+        processed_df = process_survey_data(input_file, 'structured_data.parquet',
+                                           stata_file='structured_data.dta')
     else:
         print(f"错误: 找不到文件 {input_file}")
         print("请将代码中的 'your_survey_data.xlsx' 替换为实际文件路径")
\ No newline at end of file
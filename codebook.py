@@ -0,0 +1,239 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Variable:
+    """
+    码本中的一个变量
+
+    参数:
+        name: 结构化数据中的变量名
+        label: 变量含义
+        kind: 'categorical' (按 mapping 编码) / 'numeric' (转为数值) /
+              'multiselect' (多选题，展开为虚拟变量) / 'derived' (由其他变量生成)
+        position: 问卷导出文件中的列位置 (从0开始)，表头无法唯一匹配时使用
+        header: 匹配表头的正则表达式
+        mapping: 分类变量的 选项文本 -> 编码 对照表
+        fill: 数值变量缺失时的填充值
+        note: 编码说明，分类变量为空时由 mapping 自动生成
+        required: 为 False 时问卷中缺少该列则跳过
+        source: 派生变量所依赖的变量
+    """
+    name: str
+    label: str
+    kind: str = 'numeric'
+    position: int = None
+    header: str = None
+    mapping: dict = field(default=None, hash=False, compare=False)
+    fill: float = None
+    note: str = ''
+    required: bool = True
+    source: str = None
+
+    def coding_note(self):
+        if self.note or not self.mapping:
+            return self.note or ('数值' if self.kind == 'numeric' else '')
+        labels = {}
+        for text, code in self.mapping.items():
+            labels.setdefault(code, []).append(text)
+        return '; '.join(f"{code}={'/'.join(texts)}" for code, texts in sorted(labels.items()))
+
+
+LIKERT_MAPPING = {
+    '极差': 1,
+    '较差': 2,
+    '一般': 3,
+    '较高': 4,
+    '非常完善': 5,
+    '极弱': 1,
+    '较弱': 2,
+    '较强': 4,
+    '极强': 5
+}
+
+CODEBOOK = (
+    Variable('ID', '样本唯一编号', kind='derived', note='1,2,3,...'),
+    Variable('gender', '受访者性别', kind='categorical', position=1, header='性别',
+             mapping={'男': 0, '女': 1}),
+    Variable('age_cat', '年龄分层', kind='categorical', position=2, header='年龄',
+             mapping={'35岁及以下': 1, '36-45岁': 2, '46-55岁': 3, '56-65岁': 4, '66岁及以上': 5}),
+    Variable('edu', '受教育程度', kind='categorical', position=3, header='受教育程度|文化程度',
+             mapping={'小学及以下': 1, '初中/中专': 2, '高中': 3, '大专': 4, '本科': 5}),
+    Variable('f_size', '家庭总人口', position=4, header='家庭总人口'),
+    Variable('up15_size', '15周岁以上人口数', position=5, header='15周岁以上'),
+    Variable('l_size', '家庭劳动人口数', position=6, header='劳动'),
+    Variable('migrant', '常年外出务工人数', position=7, header='外出务工'),
+    Variable('income', '家庭年总收入(万元)', position=8, header='家庭年总收入'),
+    Variable('participate', '决策变量(处理组)', kind='categorical', position=9,
+             header='是否参与|是否从事', mapping={'是': 1, '否': 0}),
+    Variable('agri_income', '农文旅收入(万元)', position=11, header='农文旅.*收入', fill=0),
+    Variable('dividend', '分红收入(万元)', position=12, header='分红', fill=0),
+    Variable('training', '技能培训', kind='categorical', position=14, header='培训',
+             mapping={'是，政府组织': 1, '是，企业培训': 2, '是，在学校学习过': 3, '否': 4},
+             required=False),
+    Variable('training_yes', '是否培训(二分)', kind='derived', note='1=是; 0=否',
+             required=False, source='training'),
+    Variable('land_cat', '耕地面积分层', kind='categorical', position=16, header='耕地',
+             mapping={'无': 0, '1-5亩': 1, '6-10亩': 2, '11-15亩': 3, '16-20亩': 4, '21亩及以上': 5},
+             required=False),
+    Variable('transport', '交通通畅程度', kind='categorical', position=17, header='交通',
+             mapping=LIKERT_MAPPING, required=False),
+    Variable('policy', '政策扶持力度', kind='categorical', position=18, header='政策',
+             mapping=LIKERT_MAPPING, required=False),
+    Variable('info', '信息化建设程度', kind='categorical', position=19, header='信息化',
+             mapping=LIKERT_MAPPING, required=False),
+    Variable('attraction', '旅游吸引力', kind='categorical', position=20, header='吸引力',
+             mapping=LIKERT_MAPPING, required=False),
+    Variable('env', '环境卫生条件', kind='categorical', position=21, header='环境卫生',
+             mapping={'完全不适合': 1, '适合但需要改进': 2, '适合需要加大投入建设': 3,
+                      '适合': 4, '非常适合': 5},
+             required=False),
+    Variable('q19', '主要问题(多选)', kind='multiselect', position=22, header='主要问题',
+             note='每个选项一个0/1虚拟变量'),
+)
+
+
+def load_codebook(path):
+    """
+    从 JSON / YAML 文件读取码本
+
+    文件内容为变量列表，每个变量的字段与 Variable 相同。
+    """
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    return tuple(Variable(**item) for item in spec)
+
+
+def _derive(var, data):
+    """生成派生变量"""
+    if var.name == 'training_yes':
+        training = data[var.source]
+        return np.where(np.isin(training, [1, 2, 3]), 1.0,
+                        np.where(training == 4, 0.0, np.nan))
+    raise ValueError(f"未知的派生变量: {var.name}")
+
+
+class RecodePlan:
+    """
+    编译后的编码计划
+
+    每个变量的列位置与查找表在编译时确定，执行时只做向量化的查表与类型转换。
+    """
+
+    def __init__(self, codebook, columns):
+        self.codebook = codebook
+        self.steps = []
+        self.multiselect = {}
+        headers = [str(c) for c in columns]
+        for var in codebook:
+            if var.kind == 'derived':
+                self.steps.append((var, None, None))
+                continue
+            position = self._locate(var, headers)
+            if position is None:
+                if var.required:
+                    raise ValueError(f"问卷中找不到变量 {var.name} ({var.label}) 对应的列")
+                continue
+            if var.kind == 'multiselect':
+                self.multiselect[var.name] = position
+            elif var.kind == 'categorical':
+                categories = pd.Index(list(var.mapping.keys()))
+                # 末尾追加 NaN，未匹配的编码 (-1) 取到 NaN
+                lookup = np.append(np.asarray(list(var.mapping.values()), dtype='float64'), np.nan)
+                self.steps.append((var, position, (categories, lookup)))
+            else:
+                self.steps.append((var, position, None))
+        present = {var.name for var, _, _ in self.steps}
+        # 派生变量所依赖的变量不存在时跳过
+        self.steps = [step for step in self.steps
+                      if step[0].source is None or step[0].source in present]
+
+    @staticmethod
+    def _locate(var, headers):
+        if var.header:
+            pattern = re.compile(var.header)
+            matches = [i for i, h in enumerate(headers) if pattern.search(h)]
+            if len(matches) == 1:
+                return matches[0]
+        if var.position is not None and var.position < len(headers):
+            return var.position
+        return None
+
+    @property
+    def variables(self):
+        return [var for var, _, _ in self.steps]
+
+    def apply(self, df, id_start=1):
+        """
+        对原始数据执行编码
+
+        参数:
+            df: 原始问卷数据
+            id_start: 第一行的序号
+
+        返回:
+            结构化数据框 (不含多选题虚拟变量)
+        """
+        data = {}
+        for var, position, lookup in self.steps:
+            if var.name == 'ID':
+                data['ID'] = np.arange(id_start, id_start + len(df), dtype=np.int64)
+            elif var.kind == 'derived':
+                data[var.name] = _derive(var, data)
+            elif var.kind == 'categorical':
+                categories, values = lookup
+                codes = categories.get_indexer(df.iloc[:, position])
+                data[var.name] = np.take(values, codes)
+            else:
+                values = pd.to_numeric(df.iloc[:, position], errors='coerce').to_numpy(dtype='float64')
+                if var.fill is not None:
+                    values = np.where(np.isnan(values), var.fill, values)
+                data[var.name] = values
+        return pd.DataFrame(data)
+
+    def data_dictionary(self):
+        """由码本生成数据字典"""
+        variables = self.variables + [self._multiselect_var(name) for name in self.multiselect]
+        return pd.DataFrame({
+            '变量名': [var.name for var in variables],
+            '变量含义': [var.label for var in variables],
+            '编码说明': [var.coding_note() for var in variables]
+        })
+
+    def _multiselect_var(self, name):
+        return next(var for var in self.codebook if var.name == name)
+
+
+_PLAN_CACHE = {}
+
+
+def compile_plan(columns, codebook=CODEBOOK):
+    """
+    根据问卷表头编译编码计划 (相同表头与码本的结果会被缓存)
+
+    参数:
+        columns: 问卷导出文件的表头
+        codebook: 码本，默认为 CODEBOOK
+    """
+    key = (tuple(str(c) for c in columns), id(codebook))
+    plan = _PLAN_CACHE.get(key)
+    if plan is None or plan.codebook is not codebook:
+        plan = RecodePlan(codebook, columns)
+        _PLAN_CACHE[key] = plan
+    return plan
+
+
+def variables_of_kind(*kinds, codebook=CODEBOOK):
+    """码本中指定类型的变量名"""
+    return [var.name for var in codebook if var.kind in kinds]
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='session')
+def structured():
+    """由 synthetic.py 生成并清洗的 3000 行结构化数据 (附加 village 分层变量)"""
+    from clear_structured_data import recode_survey_frame
+    from synthetic import generate_survey
+
+    df = recode_survey_frame(generate_survey(3000, seed=1))
+    df['village'] = np.random.default_rng(1).choice([f'村{i}' for i in range(12)], len(df))
+    return df
@@ -0,0 +1,533 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from scipy import optimize, special, stats
+
+from survey import segment_sum
+
+# 与 esr_final_short.do 相同的模型设定
+OUTCOME = 'lnincome_pc'
+COVARIATES = ['gender', 'age_cat', 'edu', 'f_size', 'l_size', 'migrant', 'land_cat']
+INSTRUMENTS = ['iv_training', 'iv_policy']
+TREATMENT = 'participate'
+
+_LOG_SQRT_2PI = 0.5 * np.log(2 * np.pi)
+
+
+def prepare_esr_data(df):
+    """
+    生成 ESR 所需变量 (与 esr_final_short.do 第一部分相同)
+
+    lnincome_pc = ln(income / f_size)，iv_training = training，iv_policy = policy
+    """
+    df = df.copy()
+    income = df['income'].to_numpy(dtype='float64', na_value=np.nan)
+    f_size = df['f_size'].to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lnincome_pc = np.log(income / f_size)
+    # Stata 中 ln 非正数为缺失值
+    df['lnincome_pc'] = np.where(np.isfinite(lnincome_pc), lnincome_pc, np.nan)
+    if 'training' in df.columns:
+        df['iv_training'] = df['training']
+    if 'policy' in df.columns:
+        df['iv_policy'] = df['policy']
+    return df
+
+
+@dataclass
+class ESRData:
+    """
+    ESR 的设计矩阵 (已剔除缺失值，均含常数项)
+
+    w 为抽样权重 (None 时不加权)，cluster 为聚类编码 (None 时使用异方差稳健标准误)
+    """
+    y: np.ndarray
+    d: np.ndarray
+    X: np.ndarray
+    Z: np.ndarray
+    x_names: list
+    z_names: list
+    mask: np.ndarray = None
+    w: np.ndarray = None
+    cluster: np.ndarray = None
+
+    _regimes: tuple = field(default=None, repr=False)
+
+    @property
+    def n(self):
+        return len(self.y)
+
+    def regimes(self):
+        """按参与状态拆分的 (行索引, y, X, Z, 权重)，只拆分一次"""
+        if self._regimes is None:
+            parts = []
+            for value in (1, 0):
+                idx = np.flatnonzero(self.d == value)
+                w = None if self.w is None else self.w[idx]
+                parts.append((idx, self.y[idx], self.X[idx], self.Z[idx], w))
+            self._regimes = tuple(parts)
+        return self._regimes
+
+    def take(self, idx):
+        """按行索引抽取子样本 (可重复，用于 bootstrap 重抽样)"""
+        return ESRData(y=self.y[idx], d=self.d[idx], X=self.X[idx], Z=self.Z[idx],
+                       x_names=self.x_names, z_names=self.z_names,
+                       w=None if self.w is None else self.w[idx],
+                       cluster=None if self.cluster is None else self.cluster[idx])
+
+
+def esr_design(df, outcome=OUTCOME, covariates=COVARIATES, instruments=INSTRUMENTS,
+               treatment=TREATMENT, weight=None, cluster=None):
+    """
+    构造 ESR 设计矩阵 (只保留所有变量均不缺失的样本)
+
+    参数:
+        df: 含有所需变量的数据 (见 prepare_esr_data)
+        outcome: 结果变量
+        covariates: 收入方程与选择方程共同的协变量
+        instruments: 只进入选择方程的工具变量
+        treatment: 处理变量 (0/1)
+        weight: 抽样权重变量 (pweight)，None 时不加权
+        cluster: 聚类变量 (如 village)，None 时不聚类；权重或聚类缺失的样本同样剔除
+    """
+    covariates = list(covariates)
+    instruments = list(instruments)
+    cols = [outcome, treatment] + covariates + instruments + ([weight] if weight else [])
+    missing = [c for c in cols if c not in df.columns]
+    if missing:
+        raise ValueError(f"数据中缺少变量: {missing}")
+    values = df[cols].to_numpy(dtype='float64', na_value=np.nan)
+    mask = ~np.isnan(values).any(axis=1)
+    codes = None
+    if cluster:
+        if cluster not in df.columns:
+            raise ValueError(f"数据中缺少聚类变量: {cluster}")
+        codes = pd.factorize(df[cluster])[0]
+        mask &= codes >= 0
+    w = None
+    if weight:
+        w = values[mask, -1]
+        if (w < 0).any():
+            raise ValueError(f"权重变量 {weight} 有负值")
+        values = values[:, :-1]
+    values = values[mask]
+    ones = np.ones((len(values), 1))
+    k = len(covariates)
+    X = np.hstack([values[:, 2:2 + k], ones])
+    Z = np.hstack([values[:, 2:], ones])
+    return ESRData(y=values[:, 0], d=values[:, 1], X=X, Z=Z,
+                   x_names=covariates + ['_cons'],
+                   z_names=covariates + instruments + ['_cons'],
+                   mask=mask, w=w,
+                   cluster=None if codes is None else pd.factorize(codes[mask])[0])
+
+
+def _split(theta, k, m):
+    b1 = theta[:k]
+    b2 = theta[k:2 * k]
+    g = theta[2 * k:2 * k + m]
+    lns1, lns2, a1, a2 = theta[2 * k + m:]
+    return b1, b2, g, lns1, lns2, a1, a2
+
+
+def _regime_terms(y, X, zg, b, lns, a, q):
+    """单个状态方程的对数似然贡献及其对 (xb, zγ, lnσ, atanh ρ) 的导数"""
+    sigma = np.exp(lns)
+    r = np.tanh(a)
+    s = np.sqrt(1 - r * r)
+    u = (y - X @ b) / sigma
+    eta = (zg + r * u) / s
+    log_cdf = special.log_ndtr(q * eta)
+    ll = log_cdf - 0.5 * u * u - lns - _LOG_SQRT_2PI
+    # m = d ln Φ(qη) / dη
+    m = q * np.exp(-0.5 * eta * eta - _LOG_SQRT_2PI - log_cdf)
+    d_xb = (u - m * r / s) / sigma
+    d_zg = m / s
+    d_lns = u * (u - m * r / s) - 1
+    d_a = m * (u + r * zg) / s
+    return ll, d_xb, d_zg, d_lns, d_a
+
+
+def esr_loglik(theta, data, scores=False):
+    """
+    ESR 完全信息极大似然的对数似然 (Lokshin & Sajaia 2004)
+
+    参数:
+        theta: [β1, β2, γ, lnσ1, lnσ2, atanh ρ1, atanh ρ2]，1=参与者，2=非参与者
+        data: ESRData (有权重时为加权对数似然)
+        scores: 为 True 时同时返回每个观测的 (加权) 得分矩阵 (n × 参数个数)
+
+    返回:
+        对数似然 (及得分矩阵)
+    """
+    k = data.X.shape[1]
+    m = data.Z.shape[1]
+    b1, b2, g, lns1, lns2, a1, a2 = _split(theta, k, m)
+    n = data.n
+    ll = np.empty(n)
+    score = np.zeros((n, len(theta))) if scores else None
+    grad = np.zeros(len(theta))
+
+    params = ((b1, lns1, a1, 1.0), (b2, lns2, a2, -1.0))
+    for regime, ((idx, y, X, Z, w), (b, lns, a, q)) in enumerate(zip(data.regimes(), params)):
+        ll_i, d_xb, d_zg, d_lns, d_a = _regime_terms(y, X, Z @ g, b, lns, a, q)
+        if w is not None:
+            # 加权似然: 每个观测的对数似然与各阶导数乘以权重
+            ll_i, d_xb, d_zg, d_lns, d_a = (t * w for t in (ll_i, d_xb, d_zg, d_lns, d_a))
+        ll[idx] = ll_i
+        b_slice = slice(regime * k, (regime + 1) * k)
+        lns_pos = 2 * k + m + regime
+        a_pos = 2 * k + m + 2 + regime
+        if scores:
+            score[idx, b_slice] = X * d_xb[:, None]
+            score[idx, 2 * k:2 * k + m] = Z * d_zg[:, None]
+            score[idx, lns_pos] = d_lns
+            score[idx, a_pos] = d_a
+        else:
+            grad[b_slice] = X.T @ d_xb
+            grad[2 * k:2 * k + m] += Z.T @ d_zg
+            grad[lns_pos] = d_lns.sum()
+            grad[a_pos] = d_a.sum()
+
+    if scores:
+        return ll.sum(), score
+    return ll.sum(), grad
+
+
+def fit_probit(d, Z, start=None, w=None, cluster=None):
+    """
+    Probit 模型 (牛顿法)
+
+    参数:
+        w: 抽样权重，None 时不加权
+        cluster: 聚类编码，给定时为聚类稳健协方差矩阵
+
+    返回:
+        (系数, 稳健协方差矩阵, 对数似然)
+    """
+    n, p = Z.shape
+    q = 2 * d - 1
+    w = np.ones(n) if w is None else w
+    g = np.zeros(p) if start is None else np.asarray(start, dtype='float64').copy()
+    ll_old = -np.inf
+    for _ in range(100):
+        zg = Z @ g
+        log_cdf = special.log_ndtr(q * zg)
+        ll = w @ log_cdf
+        lam = q * np.exp(-0.5 * zg * zg - _LOG_SQRT_2PI - log_cdf)
+        grad = Z.T @ (w * lam)
+        hess = -(Z * (w * lam * (lam + zg))[:, None]).T @ Z
+        step = np.linalg.solve(hess, grad)
+        g = g - step
+        if abs(ll - ll_old) < 1e-12 * (1 + abs(ll)) and np.abs(step).max() < 1e-10:
+            break
+        ll_old = ll
+    zg = Z @ g
+    log_cdf = special.log_ndtr(q * zg)
+    lam = q * np.exp(-0.5 * zg * zg - _LOG_SQRT_2PI - log_cdf)
+    hess = -(Z * (w * lam * (lam + zg))[:, None]).T @ Z
+    score = Z * (w * lam)[:, None]
+    vcov = _sandwich(hess, score, n, cluster)
+    return g, vcov, w @ log_cdf
+
+
+def _sandwich(hess, score, n, cluster=None):
+    """
+    稳健协方差矩阵 H⁻¹ (S'S) H⁻¹，含 Stata 的小样本修正 n/(n-1)
+
+    给定聚类编码时，得分先按聚类求和 (np.bincount)，S 为各聚类的得分合计，
+    修正系数为 G/(G-1) (G 为非空聚类数)，与 Stata 的 vce(cluster) 相同。
+    """
+    bread = np.linalg.pinv(-hess)
+    if cluster is not None:
+        n_groups = int(cluster.max()) + 1 if len(cluster) else 0
+        score = segment_sum(score, cluster, n_groups)
+        n = int(np.count_nonzero(np.bincount(cluster, minlength=n_groups)))
+    return n / (n - 1) * bread @ (score.T @ score) @ bread
+
+
+def esr_hessian(theta, data):
+    """
+    ESR 对数似然的解析 Hessian
+
+    记 η = zγ·cosh α + u·sinh α，F = ln Φ(qη)，F' = m，F'' = -m(η + m)，
+    每个观测对 (xβ, zγ, lnσ, α) 的二阶导数由链式法则得到，再按块汇总为矩阵。
+    """
+    k = data.X.shape[1]
+    m_ = data.Z.shape[1]
+    b1, b2, g, lns1, lns2, a1, a2 = _split(theta, k, m_)
+    p = len(theta)
+    hess = np.zeros((p, p))
+    params = ((b1, lns1, a1, 1.0), (b2, lns2, a2, -1.0))
+    gz = slice(2 * k, 2 * k + m_)
+    for regime, ((_, y, X, Z, w), (b, lns, a, q)) in enumerate(zip(data.regimes(), params)):
+        sigma = np.exp(lns)
+        ch = np.cosh(a)
+        sh = np.sinh(a)
+        zg = Z @ g
+        u = (y - X @ b) / sigma
+        eta = zg * ch + u * sh
+        log_cdf = special.log_ndtr(q * eta)
+        m = q * np.exp(-0.5 * eta * eta - _LOG_SQRT_2PI - log_cdf)
+        f2 = -m * (eta + m)
+        eta_a = zg * sh + u * ch
+
+        h_bb = f2 * (sh / sigma) ** 2 - 1 / sigma ** 2
+        h_bg = -f2 * sh * ch / sigma
+        h_bs = f2 * sh * sh * u / sigma + m * sh / sigma - 2 * u / sigma
+        h_ba = -f2 * sh * eta_a / sigma - m * ch / sigma
+        h_gg = f2 * ch * ch
+        h_gs = -f2 * ch * sh * u
+        h_ga = f2 * ch * eta_a + m * sh
+        h_ss = f2 * (sh * u) ** 2 + m * sh * u - 2 * u * u
+        h_sa = -f2 * sh * u * eta_a - m * ch * u
+        h_aa = f2 * eta_a ** 2 + m * eta
+        if w is not None:
+            h_bb, h_bg, h_bs, h_ba, h_gg, h_gs, h_ga, h_ss, h_sa, h_aa = (
+                h * w for h in (h_bb, h_bg, h_bs, h_ba, h_gg, h_gs, h_ga, h_ss, h_sa, h_aa))
+
+        bb = slice(regime * k, (regime + 1) * k)
+        s_pos = 2 * k + m_ + regime
+        a_pos = 2 * k + m_ + 2 + regime
+        hess[bb, bb] = (X * h_bb[:, None]).T @ X
+        hess[bb, gz] = (X * h_bg[:, None]).T @ Z
+        hess[bb, s_pos] = X.T @ h_bs
+        hess[bb, a_pos] = X.T @ h_ba
+        hess[gz, gz] += (Z * h_gg[:, None]).T @ Z
+        hess[gz, s_pos] = Z.T @ h_gs
+        hess[gz, a_pos] = Z.T @ h_ga
+        hess[s_pos, s_pos] = h_ss.sum()
+        hess[s_pos, a_pos] = h_sa.sum()
+        hess[a_pos, a_pos] = h_aa.sum()
+    # 补全对称部分
+    upper = np.triu(hess, 1)
+    return np.triu(hess) + upper.T
+
+
+def wald_test(params, vcov, idx):
+    """参数子集为 0 的 Wald 检验，返回 (chi2, 自由度, p值)"""
+    b = params[idx]
+    V = vcov[np.ix_(idx, idx)]
+    chi2 = float(b @ np.linalg.solve(V, b))
+    return chi2, len(idx), float(stats.chi2.sf(chi2, len(idx)))
+
+
+@dataclass
+class ESRResult:
+    """ESR 估计结果"""
+    params: pd.Series
+    vcov: pd.DataFrame
+    loglik: float
+    n: int
+    converged: bool
+    rho1: float
+    rho2: float
+    sigma1: float
+    sigma2: float
+    att: float
+    atu: float
+    theta: np.ndarray = field(repr=False)
+    ancillary: pd.DataFrame = field(default=None, repr=False)
+    rho_test: tuple = None
+    instrument_test: tuple = None
+    n_clusters: int = None
+
+    @property
+    def att_pct(self):
+        return (np.exp(self.att) - 1) * 100
+
+    @property
+    def atu_pct(self):
+        return (np.exp(self.atu) - 1) * 100
+
+    @property
+    def se(self):
+        return pd.Series(np.sqrt(np.diag(self.vcov)), index=self.params.index)
+
+    def summary(self):
+        """系数表: 系数 / 稳健标准误 / z / p值"""
+        se = self.se
+        z = self.params / se
+        return pd.DataFrame({
+            '系数': self.params,
+            '稳健标准误': se,
+            'z': z,
+            'p值': 2 * stats.norm.sf(np.abs(z))
+        })
+
+    def effects(self):
+        """处理效应表"""
+        return pd.DataFrame({
+            '效应': ['ATT', 'ATU'],
+            '对数差异': [self.att, self.atu],
+            '百分比变化(%)': [self.att_pct, self.atu_pct]
+        })
+
+
+def treatment_effects(theta, data):
+    """
+    由 ESR 参数计算 ATT 与 ATU (条件期望，与 movestay 的预测一致；有权重时为加权平均)
+
+    E[y1|D=1] = xβ1 + σ1ρ1 φ(zγ)/Φ(zγ)，E[y2|D=1] = xβ2 + σ2ρ2 φ(zγ)/Φ(zγ)
+    E[y1|D=0] = xβ1 - σ1ρ1 φ(zγ)/(1-Φ(zγ))，E[y2|D=0] = xβ2 - σ2ρ2 φ(zγ)/(1-Φ(zγ))
+
+    返回:
+        (ATT, ATU)
+    """
+    k = data.X.shape[1]
+    m = data.Z.shape[1]
+    b1, b2, g, lns1, lns2, a1, a2 = _split(theta, k, m)
+    zg = data.Z @ g
+    pdf = -0.5 * zg * zg - _LOG_SQRT_2PI
+    mills1 = np.exp(pdf - special.log_ndtr(zg))
+    mills0 = np.exp(pdf - special.log_ndtr(-zg))
+    c1 = np.exp(lns1) * np.tanh(a1)
+    c2 = np.exp(lns2) * np.tanh(a2)
+    diff_xb = data.X @ (b1 - b2)
+    treated = data.d == 1
+    w1 = None if data.w is None else data.w[treated]
+    w0 = None if data.w is None else data.w[~treated]
+    att = np.average(diff_xb[treated] + (c1 - c2) * mills1[treated], weights=w1)
+    atu = np.average(diff_xb[~treated] - (c1 - c2) * mills0[~treated], weights=w0)
+    return att, atu
+
+
+def _start_values(data):
+    """初始值: probit 选择方程 + 两个状态的 OLS，ρ 取 0"""
+    g, _, _ = fit_probit(data.d, data.Z, w=data.w)
+    parts = []
+    lns = []
+    for regime in (1, 0):
+        idx = data.d == regime
+        X = data.X[idx]
+        y = data.y[idx]
+        b = np.linalg.lstsq(X, y, rcond=None)[0]
+        resid = y - X @ b
+        parts.append(b)
+        lns.append(np.log(max(resid.std(), 1e-6)))
+    return np.concatenate([parts[0], parts[1], g, lns, [0.0, 0.0]])
+
+
+def fit_esr(df=None, outcome=OUTCOME, covariates=COVARIATES, instruments=INSTRUMENTS,
+            treatment=TREATMENT, data=None, start=None, compute_vcov=True, weight=None,
+            cluster=None):
+    """
+    内生转换回归 (ESR) 的完全信息极大似然估计，对应 Stata 的 movestay ..., vce(robust)；
+    指定 weight / cluster 时对应 movestay ... [pw=weight], vce(cluster village)
+
+    参数:
+        df: 结构化数据 (会先调用 prepare_esr_data)；已构造好设计矩阵时可传入 data
+        outcome / covariates / instruments / treatment: 模型设定，默认与 esr_final_short.do 相同
+        data: 预先构造的 ESRData
+        start: 初始参数 (如全样本估计结果，用于 bootstrap 热启动)
+        compute_vcov: 为 False 时只估计参数与处理效应 (bootstrap 使用)
+        weight: 抽样权重变量 (加权似然与加权处理效应)
+        cluster: 聚类变量 (如 village)，给定时为聚类稳健标准误
+
+    返回:
+        ESRResult
+    """
+    if data is None:
+        data = esr_design(prepare_esr_data(df), outcome, covariates, instruments, treatment,
+                          weight=weight, cluster=cluster)
+    k = data.X.shape[1]
+    m = data.Z.shape[1]
+    theta0 = _start_values(data) if start is None else np.asarray(start, dtype='float64')
+
+    def objective(theta):
+        ll, grad = esr_loglik(theta, data)
+        if not np.isfinite(ll):
+            return np.inf, np.zeros_like(theta)
+        return -ll, -grad
+
+    def neg_hessian(theta):
+        return -esr_hessian(theta, data)
+
+    res = optimize.minimize(objective, theta0, jac=True, hess=neg_hessian, method='trust-exact',
+                            options={'gtol': 1e-6, 'maxiter': 200})
+    theta = res.x
+    loglik = -res.fun
+    hess = esr_hessian(theta, data)
+    # 与 Stata 相同的收敛判据: 标度化梯度 g'H⁻¹g 足够小
+    try:
+        converged = bool(res.success) or float(-res.jac @ np.linalg.solve(hess, res.jac)) < 1e-5
+    except np.linalg.LinAlgError:
+        converged = False
+
+    names = ([('y1', v) for v in data.x_names] + [('y2', v) for v in data.x_names]
+             + [('select', v) for v in data.z_names]
+             + [('lns1', '_cons'), ('lns2', '_cons'), ('r1', '_cons'), ('r2', '_cons')])
+    index = pd.MultiIndex.from_tuples(names, names=['equation', 'variable'])
+    p = len(theta)
+    vcov = np.full((p, p), np.nan)
+    if compute_vcov:
+        _, score = esr_loglik(theta, data, scores=True)
+        vcov = _sandwich(hess, score, data.n, data.cluster)
+
+    b1, b2, g, lns1, lns2, a1, a2 = _split(theta, k, m)
+    att, atu = treatment_effects(theta, data)
+    result = ESRResult(
+        params=pd.Series(theta, index=index),
+        vcov=pd.DataFrame(vcov, index=index, columns=index),
+        loglik=loglik, n=data.n, converged=converged,
+        rho1=float(np.tanh(a1)), rho2=float(np.tanh(a2)),
+        sigma1=float(np.exp(lns1)), sigma2=float(np.exp(lns2)),
+        att=float(att), atu=float(atu), theta=theta,
+        n_clusters=None if data.cluster is None else int(len(np.unique(data.cluster)))
+    )
+
+    if compute_vcov:
+        # 辅助参数 σ、ρ 的标准误 (delta 方法)
+        pos = 2 * k + m
+        se = np.sqrt(np.diag(vcov))
+        result.ancillary = pd.DataFrame({
+            '估计值': [result.sigma1, result.sigma2, result.rho1, result.rho2],
+            '标准误': [result.sigma1 * se[pos], result.sigma2 * se[pos + 1],
+                       (1 - result.rho1 ** 2) * se[pos + 2], (1 - result.rho2 ** 2) * se[pos + 3]]
+        }, index=['sigma1', 'sigma2', 'rho1', 'rho2'])
+        # 方程独立性检验 (ρ1 = ρ2 = 0)
+        result.rho_test = wald_test(theta, vcov, [pos + 2, pos + 3])
+        # 工具变量联合显著性 (第一阶段 probit，与 do 文件中的 test iv_training iv_policy 相同)
+        g_probit, v_probit, _ = fit_probit(data.d, data.Z, w=data.w, cluster=data.cluster)
+        iv_idx = list(range(k - 1, m - 1))
+        result.instrument_test = wald_test(g_probit, v_probit, iv_idx)
+    return result
+
+
+def run_esr(input_file, output_file='ESR_results.csv', **kwargs):
+    """
+    读取结构化数据，估计 ESR 并输出结果 (对应 esr_final_short.do)
+
+    参数:
+        input_file: 结构化数据路径
+        output_file: 系数表输出路径 (.csv)
+        kwargs: 传给 fit_esr 的模型设定
+    """
+    from survey_io import load_structured
+
+    print("正在读取数据...")
+    df = load_structured(input_file)
+    print("正在估计内生转换模型 (ESR)...")
+    result = fit_esr(df, **kwargs)
+
+    print(f"\n样本量: {result.n}，对数似然: {result.loglik:.2f}，收敛: {result.converged}")
+    if result.n_clusters is not None:
+        print(f"聚类稳健标准误，聚类数: {result.n_clusters}")
+    print(result.summary().round(3).to_string())
+    print("\n辅助参数:")
+    print(result.ancillary.round(4).to_string())
+    print(f"\nATT (对数差异): {result.att:.4f}，ATT (参与者收入增长百分比): {result.att_pct:.2f}%")
+    print(f"ATU (对数差异): {result.atu:.4f}，ATU (非参与者潜在收入增长百分比): {result.atu_pct:.2f}%")
+    chi2, dof, p = result.rho_test
+    print(f"方程独立性检验 (rho1=rho2=0): chi2({dof}) = {chi2:.2f}, p = {p:.4f}")
+    chi2, dof, p = result.instrument_test
+    print(f"工具变量联合显著性检验: chi2({dof}) = {chi2:.2f}, p = {p:.4f}")
+
+    result.summary().to_csv(output_file, encoding='utf-8-sig')
+    print(f"\n结果已保存到: {output_file}")
+    return result
+
+
+if __name__ == "__main__":
+    run_esr("structured_data.parquet", "ESR_results.csv")
@@ -0,0 +1,229 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from codebook import compile_plan
+from survey_io import (CODED_VARIABLES, CONTINUOUS_VARIABLES, compact_dtypes, read_survey,
+                       save_structured)
+
+HASH_COL = '_row_hash'
+OCC_COL = '_row_occ'
+RAW_PREFIX = '_raw_'
+
+
+class RunningAggregates:
+    """
+    可合并的描述性统计汇总量
+
+    连续变量保存 有效样本数 / 和 / 平方和，分类变量保存各取值的频数。
+    新增样本以 sign=1 累加，删除样本以 sign=-1 扣除，无需重新扫描全表。
+
+    只能得到样本数、均值、标准差与频数；分位数、最小值/最大值与分组统计不可合并，
+    完整的描述性统计工作簿 (statistics.comprehensive_descriptive_stats) 仍需读取全表。
+    """
+
+    def __init__(self, continuous=None, categorical=None):
+        self.continuous = list(CONTINUOUS_VARIABLES if continuous is None else continuous)
+        self.categorical = list(CODED_VARIABLES if categorical is None else categorical)
+        self.rows = 0
+        self.moments = {var: np.zeros(3) for var in self.continuous}
+        self.counts = {var: {} for var in self.categorical}
+
+    def update(self, df, sign=1):
+        """累加 (sign=1) 或扣除 (sign=-1) 一批样本"""
+        self.rows += sign * len(df)
+        for var in self.continuous:
+            if var in df.columns:
+                values = df[var].to_numpy(dtype='float64', na_value=np.nan)
+                values = values[~np.isnan(values)]
+                self.moments[var] += sign * np.array([len(values), values.sum(), (values ** 2).sum()])
+        for var in self.categorical:
+            if var in df.columns:
+                table = self.counts[var]
+                for value, n in df[var].value_counts().items():
+                    key = float(value)
+                    table[key] = table.get(key, 0) + sign * int(n)
+                    if table[key] == 0:
+                        del table[key]
+        return self
+
+    def merge(self, other):
+        """合并另一批样本的汇总量"""
+        self.rows += other.rows
+        for var, m in other.moments.items():
+            self.moments[var] = self.moments.get(var, np.zeros(3)) + m
+        for var, table in other.counts.items():
+            merged = self.counts.setdefault(var, {})
+            for value, n in table.items():
+                merged[value] = merged.get(value, 0) + n
+        return self
+
+    def summary(self):
+        """连续变量的 有效样本数 / 均值 / 标准差 (样本标准差)"""
+        rows = []
+        for var, (n, total, total_sq) in self.moments.items():
+            mean = total / n if n > 0 else np.nan
+            var_ = (total_sq - n * mean ** 2) / (n - 1) if n > 1 else np.nan
+            rows.append({'变量': var, '有效样本数': int(n), '均值': mean,
+                         '标准差': np.sqrt(max(var_, 0)) if n > 1 else np.nan})
+        return pd.DataFrame(rows)
+
+    def frequencies(self, var):
+        """分类变量的频数表"""
+        table = pd.Series(self.counts[var], dtype='int64').sort_index()
+        table.index.name = var
+        return table
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'moments': {var: m.tolist() for var, m in self.moments.items()},
+            'counts': {var: sorted(table.items()) for var, table in self.counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        agg = cls(list(data['moments']), list(data['counts']))
+        agg.rows = data['rows']
+        agg.moments = {var: np.array(m, dtype='float64') for var, m in data['moments'].items()}
+        agg.counts = {var: {float(k): int(n) for k, n in table} for var, table in data['counts'].items()}
+        return agg
+
+
+def row_keys(raw):
+    """
+    原始问卷每一行的内容哈希与重复序号
+
+    统一转为文本后再哈希，避免同一数据因缺失值导致的 int/float 差异。
+    """
+    hashes = pd.util.hash_pandas_object(raw.astype(str), index=False).to_numpy()
+    occ = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.DataFrame({HASH_COL: hashes, OCC_COL: occ})
+
+
+class IncrementalState:
+    """
+    增量处理的持久化状态 (保存在一个目录中)
+
+    rows.parquet     - 已处理的样本 (含行哈希与多选题原文)
+    aggregates.json  - 描述性统计汇总量
+    options.json     - 多选题选项表
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.rows = None
+        self.aggregates = RunningAggregates()
+        self.options = {}
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def load(self):
+        if os.path.exists(self._path('rows.parquet')):
+            self.rows = pd.read_parquet(self._path('rows.parquet'))
+            with open(self._path('aggregates.json'), encoding='utf-8') as f:
+                self.aggregates = RunningAggregates.from_dict(json.load(f))
+            with open(self._path('options.json'), encoding='utf-8') as f:
+                self.options = json.load(f)
+        return self
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        internal = [c for c in self.rows.columns if c.startswith('_')]
+        rows = pd.concat([compact_dtypes(self.rows.drop(columns=internal)), self.rows[internal]], axis=1)
+        rows.to_parquet(self._path('rows.parquet'), index=False)
+        with open(self._path('aggregates.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.aggregates.to_dict(), f, ensure_ascii=False)
+        with open(self._path('options.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.options, f, ensure_ascii=False)
+
+
+def process_survey_incremental(input_file, state_dir='.agritour_state',
+                               output_file='structured_data.parquet'):
+    """
+    增量处理问卷数据：只对新增或修改的样本重新编码
+
+    以整行内容哈希识别样本：旧状态中不再出现的行视为删除，新出现的行视为新增
+    (修改过的行即“删除旧行 + 新增新行”)。描述性统计汇总量 (样本数、均值、标准差、频数)
+    按增减样本更新，只用于输出的摘要；描述性统计工作簿仍需对结构化数据全表重新计算。
+    多选题出现新选项时，只对多选题部分按保存的原文重新展开；新选项排在原有选项之后。
+
+    参数:
+        input_file: 本期完整的问卷文件
+        state_dir: 状态目录
+        output_file: 输出的结构化数据路径
+
+    返回:
+        (结构化数据, 汇总量 RunningAggregates)
+    """
+    from clear_structured_data import (discover_multiselect_options, encode_multiselect,
+                                       recode_survey_frame)
+
+    print("正在读取数据...")
+    raw = read_survey(input_file).reset_index(drop=True)
+    keys = row_keys(raw)
+    plan = compile_plan(raw.columns)
+    state = IncrementalState(state_dir).load()
+
+    old = state.rows
+    if old is None:
+        matched = pd.Series(False, index=keys.index)
+        removed = pd.DataFrame()
+    else:
+        in_new = old[[HASH_COL, OCC_COL]].merge(keys, how='left', indicator=True)['_merge'] == 'both'
+        in_old = keys.merge(old[[HASH_COL, OCC_COL]], how='left', indicator=True)['_merge'] == 'both'
+        matched = pd.Series(in_old.to_numpy(), index=keys.index)
+        removed = old.loc[~in_new.to_numpy()]
+        old = old.loc[in_new.to_numpy()]
+    added = raw.loc[~matched.to_numpy()]
+    print(f"新增/修改 {len(added)} 行，删除 {len(removed)} 行，"
+          f"未变化 {int(matched.sum())} 行")
+
+    # 多选题选项表只增不减；出现新选项时需要重新展开已有样本
+    grown = []
+    for name, position in plan.multiselect.items():
+        known = state.options.get(name, [])
+        new_options = [o for o in discover_multiselect_options(added.iloc[:, position])
+                       if o not in known]
+        if new_options or name not in state.options:
+            state.options[name] = known + new_options
+            grown.append(name)
+
+    processed = recode_survey_frame(added, multiselect_options=state.options)
+    processed = pd.concat([processed.drop(columns='ID'),
+                           keys.loc[~matched.to_numpy()].reset_index(drop=True)], axis=1)
+    for name, position in plan.multiselect.items():
+        processed[RAW_PREFIX + name] = added.iloc[:, position].astype('string').to_numpy()
+
+    if old is not None and len(old):
+        for name in grown:
+            dummies = encode_multiselect(old[RAW_PREFIX + name], options=state.options[name])
+            old = old.drop(columns=[c for c in dummies.columns if c in old.columns])
+            old = pd.concat([old, dummies], axis=1)
+        rows = pd.concat([old, processed], ignore_index=True)
+    else:
+        rows = processed
+
+    # 更新汇总量
+    if len(removed):
+        state.aggregates.update(removed, sign=-1)
+    state.aggregates.update(processed, sign=1)
+
+    # 按本期文件的行顺序排列，并重新生成序号
+    order = keys.merge(rows[[HASH_COL, OCC_COL]].reset_index(), how='left')['index'].to_numpy()
+    rows = rows.iloc[order].reset_index(drop=True)
+    state.rows = rows
+    state.save()
+
+    structured = rows.drop(columns=[c for c in rows.columns if c.startswith('_')])
+    structured.insert(0, 'ID', np.arange(1, len(structured) + 1))
+    structured = compact_dtypes(structured)
+    save_structured(structured, output_file)
+    print(f"\n数据处理完成！处理后的数据已保存到: {output_file}")
+    print("\n描述性统计 (由汇总量更新):")
+    print(state.aggregates.summary().to_string(index=False))
+
+    return structured, state.aggregates
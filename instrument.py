@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+# 环境变量: 设置为 1 或 JSON Lines 文件路径时自动启用 (子进程继承)
+TRACE_ENV = 'AGRITOUR_TRACE'
+PROFILE_ENV = 'AGRITOUR_PROFILE'
+# 内存中保留的最近记录数 (常驻进程中持续记录时内存不随任务数增长)
+MAX_RECORDS = 10000
+
+logger = logging.getLogger('agritour.instrument')
+
+
+class _Config:
+    enabled = False
+    log_file = None
+    profile = None
+    profile_dir = 'profiles'
+    records = deque(maxlen=MAX_RECORDS)
+    stack = []
+
+
+def enable(log_file=None, profile=None, profile_dir='profiles'):
+    """
+    启用计时记录
+
+    参数:
+        log_file: 记录追加写入的 JSON Lines 文件，None 时只在内存中保留最近 MAX_RECORDS 条
+                  (见 records())
+                  并输出到 logging 的 'agritour.instrument' 记录器
+        profile: None、'cprofile' (最外层计时段的 cProfile 结果保存为 .prof 文件) 或
+                 'tracemalloc' (记录每个计时段的 Python/NumPy 内存分配峰值)
+        profile_dir: cProfile 结果的保存目录
+    """
+    if profile not in (None, 'cprofile', 'tracemalloc'):
+        raise ValueError(f"未知的 profile 模式: {profile}")
+    _Config.enabled = True
+    _Config.log_file = log_file
+    _Config.profile = profile
+    _Config.profile_dir = profile_dir
+    if profile == 'tracemalloc':
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def disable():
+    """停止计时记录 (已有的记录保留)"""
+    if _Config.profile == 'tracemalloc':
+        import tracemalloc
+
+        tracemalloc.stop()
+    _Config.enabled = False
+    _Config.profile = None
+
+
+def is_enabled():
+    return _Config.enabled
+
+
+def records(clear=False):
+    """已完成的计时记录 (字典列表，按结束顺序)"""
+    result = list(_Config.records)
+    if clear:
+        _Config.records.clear()
+    return result
+
+
+def _rss_mb():
+    """当前进程的常驻内存 (MB)，无法获取时为 None"""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _NullSpan:
+    """未启用时的计时段: 不做任何事，开销只有一次函数调用"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, **fields):
+        return self
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    一个计时段，结束时生成一条记录:
+    name / parent / seconds / rss_mb / rss_delta_mb / rows_in / rows_out / columns_created /
+    status (ok/error)，tracemalloc 模式下另有 peak_traced_mb
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self._peak = 0
+
+    def record(self, **fields):
+        """补充记录字段 (如 rows_out=len(result)、columns_created=...)"""
+        self.fields.update(fields)
+        return self
+
+    def __enter__(self):
+        self.parent = _Config.stack[-1] if _Config.stack else None
+        _Config.stack.append(self)
+        self._profiler = None
+        if _Config.profile == 'cprofile' and self.parent is None:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif _Config.profile == 'tracemalloc':
+            import tracemalloc
+
+            # 父计时段的峰值先保存，再为本段重新计峰值
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+        self._rss = _rss_mb()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        # 内层计时段因异常未结束时一并出栈
+        while _Config.stack and _Config.stack.pop() is not self:
+            pass
+        rss = _rss_mb()
+        record = {
+            'name': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'seconds': round(seconds, 6),
+            'rss_mb': None if rss is None else round(rss, 1),
+            'rss_delta_mb': None if rss is None or self._rss is None else round(rss - self._rss, 1),
+        }
+        record.update(self.fields)
+        record['status'] = 'ok' if exc_type is None else 'error'
+        if exc_type is not None:
+            record['error'] = repr(exc)
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(_Config.profile_dir, exist_ok=True)
+            path = os.path.join(_Config.profile_dir, f"{self.name}.{os.getpid()}.prof")
+            self._profiler.dump_stats(path)
+            record['profile'] = path
+        elif _Config.profile == 'tracemalloc':
+            import tracemalloc
+
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_mb'] = round((peak - self._traced_start) / 1024 ** 2, 1)
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, peak)
+        _emit(record)
+        return False
+
+
+def _emit(record):
+    _Config.records.append(record)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    logger.info(line)
+    if _Config.log_file:
+        with open(_Config.log_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def span(name, **fields):
+    """
+    计时段上下文管理器
+
+    用法:
+        with span('clean.read', input_file=path) as sp:
+            df = read_survey(path)
+            sp.record(rows_out=len(df))
+
+    未启用时返回一个共享的空对象，几乎没有开销。
+
+    参数:
+        name: 计时段名称
+        fields: 附加记录字段 (如 rows_in)
+    """
+    if not _Config.enabled:
+        return _NULL_SPAN
+    return Span(name, fields)
+
+
+class Sections:
+    """
+    顺序排列的计时段: start() 结束上一段并开始下一段，适合按编号分节的长函数
+
+    用法:
+        section = sections('stats')
+        section.start('1_样本规模')
+        ...
+        section.start('2_个体特征')
+        ...
+        section.close()
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.current = None
+
+    def start(self, name, **fields):
+        self.close()
+        if not _Config.enabled:
+            return _NULL_SPAN
+        self.current = Span(f'{self.prefix}.{name}', fields).__enter__()
+        return self.current
+
+    def record(self, **fields):
+        if self.current is not None:
+            self.current.record(**fields)
+        return self
+
+    def close(self):
+        if self.current is not None:
+            current, self.current = self.current, None
+            current.__exit__(None, None, None)
+
+
+def sections(prefix):
+    """创建以 prefix 为名称前缀的顺序计时段 (见 Sections)"""
+    return Sections(prefix)
+
+
+def summary(records_list=None):
+    """
+    将计时记录整理为数据框 (每个计时段一行)
+
+    参数:
+        records_list: 记录列表，None 时为 records()
+    """
+    import pandas as pd
+
+    return pd.DataFrame(records() if records_list is None else records_list)
+
+
+def _enable_from_environment():
+    value = os.environ.get(TRACE_ENV)
+    if value:
+        enable(log_file=None if value == '1' else value, profile=os.environ.get(PROFILE_ENV) or None)
+
+
+_enable_from_environment()
+
+
+if __name__ == "__main__":
+    # 用法: python instrument.py <trace.jsonl>  汇总各计时段的耗时
+    if len(sys.argv) < 2:
+        print("用法: python instrument.py <计时记录 .jsonl>")
+    else:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            table = summary([json.loads(line) for line in f if line.strip()])
+        print(table.groupby('name', sort=False)['seconds'].agg(['count', 'sum', 'max'])
+              .round(3).to_string())
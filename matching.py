@@ -0,0 +1,317 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+from scipy.spatial import cKDTree
+
+from esr import COVARIATES, OUTCOME, TREATMENT, esr_design, fit_probit, prepare_esr_data
+
+
+def fit_logit(d, X, start=None):
+    """
+    Logit 倾向得分模型 (牛顿法)
+
+    返回:
+        (系数, 对数似然)
+    """
+    b = np.zeros(X.shape[1]) if start is None else np.asarray(start, dtype='float64').copy()
+    ll_old = -np.inf
+    for _ in range(100):
+        xb = X @ b
+        p = special.expit(xb)
+        ll = np.sum(d * special.log_expit(xb) + (1 - d) * special.log_expit(-xb))
+        grad = X.T @ (d - p)
+        hess = -(X * (p * (1 - p))[:, None]).T @ X
+        step = np.linalg.solve(hess, grad)
+        b = b - step
+        if abs(ll - ll_old) < 1e-12 * (1 + abs(ll)) and np.abs(step).max() < 1e-10:
+            break
+        ll_old = ll
+    return b, ll
+
+
+def propensity_scores(d, X, model='logit'):
+    """
+    估计倾向得分
+
+    参数:
+        d: 处理变量 (0/1)
+        X: 协变量矩阵 (含常数项)
+        model: 'logit' 或 'probit'
+
+    返回:
+        (倾向得分, 线性指数, 系数)
+    """
+    if model == 'logit':
+        b, _ = fit_logit(d, X)
+        index = X @ b
+        return special.expit(index), index, b
+    if model == 'probit':
+        b, _, _ = fit_probit(d, X)
+        index = X @ b
+        return special.ndtr(index), index, b
+    raise ValueError(f"不支持的倾向得分模型: {model}")
+
+
+def nearest_neighbors(target, pool, k=1, caliper=None):
+    """
+    用 KD 树为每个 target 点在 pool 中查找 k 个最近邻 (有放回)
+
+    参数:
+        target: (n_t, p) 待匹配的点
+        pool: (n_c, p) 可供匹配的点
+        k: 近邻个数
+        caliper: 最大匹配距离，超出者视为未匹配
+
+    返回:
+        (近邻索引 n_t × k，未匹配为 -1)
+    """
+    tree = cKDTree(pool)
+    bound = np.inf if caliper is None else caliper * (1 + 1e-12)
+    dist, idx = tree.query(target, k=k, distance_upper_bound=bound)
+    idx = np.asarray(idx).reshape(len(target), k)
+    dist = np.asarray(dist).reshape(len(target), k)
+    return np.where(np.isfinite(dist), idx, -1)
+
+
+def _matched_effect(y, d, score, treated_value, k, caliper):
+    """
+    k:1 近邻匹配估计 (ATT 时以处理组为目标，ATU 时以对照组为目标)
+
+    返回:
+        (效应, 标准误, 匹配成功的目标样本数, 每个样本作为对照的权重)
+    """
+    target = np.flatnonzero(d == treated_value)
+    pool = np.flatnonzero(d != treated_value)
+    neighbors = nearest_neighbors(score[target, None], score[pool, None], k, caliper)
+    n_match = (neighbors >= 0).sum(axis=1)
+    matched = n_match > 0
+    target = target[matched]
+    neighbors = neighbors[matched]
+    n_match = n_match[matched]
+    if len(target) == 0:
+        return np.nan, np.nan, 0, np.zeros(len(y))
+
+    # 对照样本的权重: 每个目标样本的 1/m 分给它的 m 个近邻
+    valid = neighbors >= 0
+    rows = np.repeat(np.arange(len(target)), valid.sum(axis=1))
+    pool_idx = pool[neighbors[valid]]
+    w = np.repeat(1.0 / n_match, n_match)
+    counterfactual = np.bincount(rows, weights=w * y[pool_idx], minlength=len(target))
+    sign = 1.0 if treated_value == 1 else -1.0
+    effect = sign * np.mean(y[target] - counterfactual)
+
+    weights = np.bincount(pool_idx, weights=w, minlength=len(y))
+    # 方差近似 (Lechner 2001): 目标组方差 + 对照组方差 × Σw²
+    n_t = len(target)
+    used = weights > 0
+    var_t = np.var(y[target], ddof=1) if n_t > 1 else np.nan
+    var_c = np.var(y[used], ddof=1) if used.sum() > 1 else np.nan
+    se = np.sqrt(var_t / n_t + var_c * np.sum(weights[used] ** 2) / n_t ** 2)
+    weights[target] = 1.0
+    return effect, se, n_t, weights
+
+
+def _ols_predict(y, X, fit_mask):
+    """用 fit_mask 样本做 OLS，返回全部样本的预测值"""
+    b = np.linalg.lstsq(X[fit_mask], y[fit_mask], rcond=None)[0]
+    return X @ b
+
+
+def weighted_effects(y, d, ps, X):
+    """
+    逆概率加权 (IPW) 与增强逆概率加权 (AIPW，双重稳健) 估计
+
+    标准误由影响函数计算 (视倾向得分与结果模型为已知)。
+
+    返回:
+        (结果表行列表, IPW 的 ATT 权重, IPW 的 ATE 权重)
+    """
+    n = len(y)
+    treated = d == 1
+    p_bar = treated.mean()
+    odds = ps / (1 - ps)
+
+    # IPW (Hajek 归一化)
+    w_att = np.where(treated, 1.0, odds)
+    w_ate = np.where(treated, 1 / ps, 1 / (1 - ps))
+    mu1_att = y[treated].mean()
+    mu0_att = np.sum(w_att[~treated] * y[~treated]) / np.sum(w_att[~treated])
+    att_ipw = mu1_att - mu0_att
+    psi = (treated * (y - mu1_att) - (~treated) * odds * (y - mu0_att)) / p_bar
+    se_att_ipw = np.sqrt(np.mean(psi ** 2) / n)
+
+    mu1 = np.sum(w_ate[treated] * y[treated]) / np.sum(w_ate[treated])
+    mu0 = np.sum(w_ate[~treated] * y[~treated]) / np.sum(w_ate[~treated])
+    ate_ipw = mu1 - mu0
+    psi = treated * (y - mu1) / ps - (~treated) * (y - mu0) / (1 - ps)
+    se_ate_ipw = np.sqrt(np.mean(psi ** 2) / n)
+
+    # AIPW: 各组的 OLS 结果模型 + 加权残差
+    m1 = _ols_predict(y, X, treated)
+    m0 = _ols_predict(y, X, ~treated)
+    resid0 = y - m0
+    att_aipw = np.sum(treated * resid0 - (~treated) * odds * resid0) / treated.sum()
+    psi = (treated * resid0 - (~treated) * odds * resid0 - treated * att_aipw) / p_bar
+    se_att_aipw = np.sqrt(np.mean(psi ** 2) / n)
+
+    score = m1 - m0 + treated * (y - m1) / ps - (~treated) * (y - m0) / (1 - ps)
+    ate_aipw = score.mean()
+    se_ate_aipw = np.std(score, ddof=1) / np.sqrt(n)
+
+    rows = [
+        ('IPW', 'ATT', att_ipw, se_att_ipw, n),
+        ('IPW', 'ATE', ate_ipw, se_ate_ipw, n),
+        ('AIPW', 'ATT', att_aipw, se_att_aipw, n),
+        ('AIPW', 'ATE', ate_aipw, se_ate_aipw, n),
+    ]
+    return rows, w_att, w_ate
+
+
+def balance_table(X, d, names, weights=None):
+    """
+    协变量平衡性诊断 (所有变量、所有加权方案一次矩阵运算)
+
+    参数:
+        X: 协变量矩阵 (不含常数项)
+        d: 处理变量
+        names: 协变量名
+        weights: {方案名: 样本权重}，未加权的结果总是包含在内
+
+    返回:
+        长表: 方案 / 变量 / 处理组均值 / 对照组均值 / 标准化均值差(%) / 方差比
+    """
+    schemes = {'未加权': np.ones(len(d))}
+    schemes.update(weights or {})
+    W = np.column_stack(list(schemes.values()))
+    treated = (d == 1)[:, None]
+    W1 = W * treated
+    W0 = W * ~treated
+    s1 = W1.sum(axis=0)[:, None]
+    s0 = W0.sum(axis=0)[:, None]
+    # (方案 × 变量) 的加权均值与方差
+    mean1 = W1.T @ X / s1
+    mean0 = W0.T @ X / s0
+    var1 = W1.T @ (X ** 2) / s1 - mean1 ** 2
+    var0 = W0.T @ (X ** 2) / s0 - mean0 ** 2
+    # 标准化均值差的分母固定使用未加权的两组方差 (Rosenbaum & Rubin 1985)
+    pooled = np.sqrt((var1[0] + var0[0]) / 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smd = 100 * (mean1 - mean0) / pooled
+        ratio = var1 / var0
+    n_schemes, n_vars = mean1.shape
+    return pd.DataFrame({
+        '方案': np.repeat(list(schemes), n_vars),
+        '变量': np.tile(names, n_schemes),
+        '处理组均值': mean1.ravel(),
+        '对照组均值': mean0.ravel(),
+        '标准化均值差(%)': smd.ravel(),
+        '方差比': ratio.ravel(),
+    })
+
+
+@dataclass
+class PSMResult:
+    """倾向得分匹配 / 加权估计结果"""
+    estimates: pd.DataFrame
+    balance: pd.DataFrame
+    pscore: np.ndarray = field(repr=False)
+    ps_params: pd.Series = field(repr=False)
+    caliper: float = None
+    n: int = None
+
+
+def estimate_psm(df, outcome=OUTCOME, covariates=COVARIATES, treatment=TREATMENT,
+                 model='logit', k=1, caliper='auto', common_support=True):
+    """
+    倾向得分匹配 (PSM) 与 IPW / AIPW 估计，作为 ESR 的稳健性检验
+
+    参数:
+        df: 结构化数据 (会先调用 prepare_esr_data)
+        outcome: 结果变量 (默认 lnincome_pc)
+        covariates: 倾向得分模型与结果模型的协变量 (默认与 ESR 相同)
+        treatment: 处理变量
+        model: 倾向得分模型 'logit' / 'probit'
+        k: 每个样本匹配的近邻个数 (k:1 匹配，有放回)
+        caliper: 卡尺 (在倾向得分线性指数上)，'auto' 为其标准差的 0.2 倍 (Austin 2011)，
+                 None 为不设卡尺
+        common_support: 为 True 时剔除倾向得分在对方组取值范围以外的样本
+
+    返回:
+        PSMResult
+    """
+    data = esr_design(prepare_esr_data(df), outcome, covariates, [], treatment)
+    y, d, X = data.y, data.d, data.X
+    ps, index, b = propensity_scores(d, X, model)
+
+    keep = np.ones(len(y), dtype=bool)
+    if common_support:
+        lo = max(ps[d == 1].min(), ps[d == 0].min())
+        hi = min(ps[d == 1].max(), ps[d == 0].max())
+        keep = (ps >= lo) & (ps <= hi)
+    if caliper == 'auto':
+        caliper = 0.2 * np.std(index[keep], ddof=1)
+
+    ys, ds, idx_s, Xs, pss = y[keep], d[keep], index[keep], X[keep], ps[keep]
+    att, se_att, n_att, w_match = _matched_effect(ys, ds, idx_s, 1, k, caliper)
+    atu, se_atu, n_atu, _ = _matched_effect(ys, ds, idx_s, 0, k, caliper)
+    ate = (n_att * att + n_atu * atu) / (n_att + n_atu) if n_att + n_atu else np.nan
+    se_ate = np.sqrt((n_att * se_att) ** 2 + (n_atu * se_atu) ** 2) / (n_att + n_atu) \
+        if n_att + n_atu else np.nan
+
+    rows = [
+        (f'PSM({k}:1)', 'ATT', att, se_att, n_att),
+        (f'PSM({k}:1)', 'ATU', atu, se_atu, n_atu),
+        (f'PSM({k}:1)', 'ATE', ate, se_ate, n_att + n_atu),
+    ]
+    ipw_rows, w_att, w_ate = weighted_effects(ys, ds, pss, Xs)
+    rows += ipw_rows
+
+    estimates = pd.DataFrame(rows, columns=['方法', '效应', '估计值', '标准误', '样本数'])
+    estimates['z'] = estimates['估计值'] / estimates['标准误']
+    estimates['p值'] = 2 * stats.norm.sf(np.abs(estimates['z']))
+    # 结果变量为对数收入时，效应对应的百分比变化 (与 ESR 相同)
+    estimates['百分比变化(%)'] = (np.exp(estimates['估计值']) - 1) * 100
+
+    names = data.x_names[:-1]
+    balance = balance_table(Xs[:, :-1], ds, names,
+                            {'匹配后': w_match, 'IPW(ATT)': w_att, 'IPW(ATE)': w_ate})
+
+    full_ps = np.full(len(data.mask), np.nan)
+    full_ps[np.flatnonzero(data.mask)] = ps
+    return PSMResult(estimates=estimates, balance=balance, pscore=full_ps,
+                     ps_params=pd.Series(b, index=data.x_names),
+                     caliper=caliper, n=int(keep.sum()))
+
+
+def run_psm(input_file, output_file='PSM_results.xlsx', **kwargs):
+    """
+    读取结构化数据，进行 PSM / IPW / AIPW 稳健性估计
+
+    参数:
+        input_file: 结构化数据路径
+        output_file: 输出的 Excel 文件
+        kwargs: 传给 estimate_psm 的参数
+    """
+    from survey_io import load_structured
+
+    print("正在读取数据...")
+    df = load_structured(input_file)
+    print("正在估计倾向得分并匹配...")
+    result = estimate_psm(df, **kwargs)
+    print(f"\n共同支撑样本: {result.n}，卡尺: {result.caliper}")
+    print(result.estimates.round(4).to_string(index=False))
+    print("\n平衡性检验 (标准化均值差 %):")
+    print(result.balance.pivot(index='变量', columns='方案', values='标准化均值差(%)').round(2))
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        result.estimates.to_excel(writer, sheet_name='处理效应', index=False)
+        result.balance.to_excel(writer, sheet_name='平衡性检验', index=False)
+        result.ps_params.rename('系数').to_frame().to_excel(writer, sheet_name='倾向得分模型')
+    print(f"\n结果已保存到: {output_file}")
+    return result
+
+
+if __name__ == "__main__":
+    run_psm("structured_data.parquet", "PSM_results.xlsx")
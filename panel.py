@@ -0,0 +1,374 @@
+import json
+import os
+import sqlite3
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+
+# 农户所在地 (batch.py 合并数据时由目录名与文件名生成)
+LOCATION_COLUMNS = ('county', 'village')
+# 精确匹配键: 所在地 + 受访者与家庭的基本属性
+KEY_VARIABLES = ('gender', 'age_cat', 'edu', 'f_size', 'land_cat')
+# 模糊匹配的分块变量: 只在同一所在地、同一分块内比较候选农户
+BLOCK_VARIABLES = ('gender',)
+# 模糊匹配比较的属性及容许的差异 (年龄分层在两期之间可能升一档，人口数可能增减)
+FUZZY_TOLERANCE = {'age_cat': 1, 'edu': 0, 'f_size': 1, 'l_size': 1, 'land_cat': 0}
+# 模糊匹配允许超出容差的属性个数
+MAX_DISTANCE = 1
+
+MATCH_EXACT = '精确'
+MATCH_EXACT_DUPLICATE = '精确(重复键)'
+MATCH_FUZZY = '模糊'
+MATCH_NEW = '新增'
+
+
+def normalize_text(values):
+    """文本标识的规范化: 全角转半角 (NFKC)、去除空白、统一小写，缺失值为空字符串"""
+    text = pd.Series(values, dtype=object).fillna('').astype(str)
+    text = text.map(lambda s: unicodedata.normalize('NFKC', s))
+    return text.str.replace(r'\s+', '', regex=True).str.lower()
+
+
+def _normalize_codes(df, variables):
+    """
+    属性统一为整数编码，缺失值为 -1
+
+    数值属性四舍五入取整；文本标识 (如调查时登记的户主姓名、电话) 规范化后
+    取 63 位哈希，跨期稳定，只能精确比较。
+    """
+    codes = np.empty((len(df), len(variables)), dtype='int64')
+    for j, var in enumerate(variables):
+        series = df[var]
+        if pd.api.types.is_numeric_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+            codes[:, j] = np.where(np.isnan(values), -1, np.round(values))
+        else:
+            text = normalize_text(series.to_numpy(dtype=object)).to_numpy(dtype=object)
+            hashed = (pd.util.hash_array(text) >> np.uint64(1)).astype('int64')
+            codes[:, j] = np.where(text == '', -1, hashed)
+    return codes
+
+
+def _hash_rows(*parts):
+    """多列的 64 位行哈希 (pandas 向量化哈希，以有符号整数保存于 SQLite)"""
+    frame = pd.concat([pd.DataFrame(p).reset_index(drop=True) for p in parts], axis=1,
+                      ignore_index=True)
+    if frame.shape[1] == 0:
+        return np.zeros(len(frame), dtype='int64')
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view('int64')
+
+
+class HouseholdIndex:
+    """
+    跨期农户匹配的持久化索引 (SQLite)
+
+    households    - 每户一行: 户编号 / 精确键哈希 / 分块键哈希 / 所在地 / 最近一期的属性
+    observations  - 每期每个样本一行: 期次 / 行号 / 样本 ID / 户编号 / 匹配方式 / 距离
+                    (合并多个村的数据中 ID 会重复，以行号标识样本)
+    meta          - 建立索引时的匹配设定 (再次打开时检查是否一致)
+
+    精确键与分块键均为 64 位哈希并建有索引，新一期数据只读取所在地与分块相同的农户。
+
+    参数:
+        path: 索引文件路径 (.sqlite)
+        key_variables: 精确匹配的属性
+        block_variables: 模糊匹配的分块属性 (应为 key_variables 的子集)
+        fuzzy_tolerance: 模糊匹配比较的属性及容差 (文本标识的容差应为 0)
+        location_columns: 所在地变量 (数据中不存在的忽略)
+    """
+
+    def __init__(self, path, key_variables=KEY_VARIABLES, block_variables=BLOCK_VARIABLES,
+                 fuzzy_tolerance=None, location_columns=LOCATION_COLUMNS):
+        self.path = path
+        self.settings = {
+            'key_variables': list(key_variables),
+            'block_variables': list(block_variables),
+            'fuzzy_tolerance': dict(FUZZY_TOLERANCE if fuzzy_tolerance is None else fuzzy_tolerance),
+            'location_columns': list(location_columns),
+        }
+        self.attributes = list(dict.fromkeys(self.settings['key_variables']
+                                             + list(self.settings['fuzzy_tolerance'])))
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self._create()
+
+    def _create(self):
+        conn = self.conn
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        row = conn.execute("SELECT value FROM meta WHERE name = 'settings'").fetchone()
+        if row is None:
+            attrs = ''.join(f', "a_{v}" INTEGER' for v in self.attributes)
+            conn.execute(f"""CREATE TABLE households (
+                household_id INTEGER PRIMARY KEY, exact_key INTEGER, block_key INTEGER,
+                location TEXT, first_wave TEXT, last_wave TEXT{attrs})""")
+            conn.execute("CREATE INDEX idx_exact ON households (exact_key)")
+            conn.execute("CREATE INDEX idx_block ON households (block_key)")
+            conn.execute("""CREATE TABLE observations (
+                wave TEXT, row INTEGER, sample_id INTEGER, household_id INTEGER, match TEXT,
+                distance INTEGER, PRIMARY KEY (wave, row))""")
+            conn.execute("CREATE INDEX idx_obs_household ON observations (household_id)")
+            conn.execute("INSERT INTO meta VALUES ('settings', ?)",
+                         (json.dumps(self.settings, ensure_ascii=False),))
+            conn.commit()
+        elif json.loads(row[0]) != self.settings:
+            raise ValueError(f"索引 {self.path} 的匹配设定与当前设定不一致: {row[0]}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def waves(self):
+        """已匹配的期次"""
+        return [w for (w,) in self.conn.execute(
+            "SELECT DISTINCT wave FROM observations ORDER BY wave")]
+
+    def observations(self, wave=None):
+        """样本与户编号的对应表 (期次 / 行号 / 样本 ID / 户编号 / 匹配方式 / 距离)"""
+        query = "SELECT wave, row, sample_id, household_id, match, distance FROM observations"
+        params = ()
+        if wave is not None:
+            query += " WHERE wave = ?"
+            params = (str(wave),)
+        return pd.read_sql_query(query + " ORDER BY wave, row", self.conn, params=params)
+
+    def _keys(self, df):
+        """一期数据的所在地、属性编码、精确键与分块键"""
+        settings = self.settings
+        missing = [v for v in self.attributes if v not in df.columns]
+        if missing:
+            raise ValueError(f"数据中缺少匹配变量: {missing}")
+        location = np.full(len(df), '', dtype=object)
+        for col in settings['location_columns']:
+            if col in df.columns:
+                # 只规范化不同的取值，再按编码展开
+                codes, uniques = pd.factorize(df[col].to_numpy(dtype=object), use_na_sentinel=False)
+                location = location + '/' + normalize_text(uniques).to_numpy(dtype=object)[codes]
+        attrs = _normalize_codes(df, self.attributes)
+        pos = {v: j for j, v in enumerate(self.attributes)}
+        key_cols = [pos[v] for v in settings['key_variables']]
+        block_cols = [pos[v] for v in settings['block_variables']]
+        exact = _hash_rows(location, attrs[:, key_cols])
+        block = _hash_rows(location, attrs[:, block_cols])
+        return location, attrs, exact, block
+
+    def _candidates(self, blocks):
+        """读取与本期分块键相同的已有农户 (临时表连接，按哈希索引查找)"""
+        conn = self.conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wave_blocks (block_key INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM wave_blocks")
+        conn.executemany("INSERT INTO wave_blocks VALUES (?)", ((int(b),) for b in np.unique(blocks)))
+        attrs = ''.join(f', h."a_{v}"' for v in self.attributes)
+        households = pd.read_sql_query(
+            f"SELECT h.household_id, h.exact_key, h.block_key{attrs} FROM households h "
+            "JOIN wave_blocks b ON h.block_key = b.block_key ORDER BY h.household_id", conn)
+        households.columns = ['household_id', 'exact_key', 'block_key'] + self.attributes
+        return households.astype('int64')
+
+    def link_wave(self, df, wave, max_distance=MAX_DISTANCE):
+        """
+        将一期数据与索引中的农户匹配，并把结果写入索引
+
+        1. 精确匹配: 精确键哈希相同 (哈希连接，O(n))；同一键有多户时按出现顺序一一对应
+        2. 模糊匹配: 其余样本只与同一分块内未匹配的农户比较，超出容差的属性个数
+           不超过 max_distance 的按距离从小到大一一对应
+        3. 仍未匹配的样本登记为新农户
+        匹配到的农户的属性更新为本期取值，以便跟踪属性的逐期变化。
+
+        参数:
+            df: 一期结构化数据 (含匹配变量)
+            wave: 期次标识 (如 2024)
+            max_distance: 模糊匹配允许超出容差的属性个数
+
+        返回:
+            与 df 逐行对应的匹配表: household_id / 匹配方式 / 距离
+        """
+        wave = str(wave)
+        if self.conn.execute("SELECT 1 FROM observations WHERE wave = ? LIMIT 1",
+                             (wave,)).fetchone():
+            raise ValueError(f"第 {wave} 期已经匹配过")
+        n = len(df)
+        with span('panel.link', wave=wave, rows_in=n) as sp:
+            location, attrs, exact, block = self._keys(df)
+            known = self._candidates(block)
+            household = np.full(n, -1, dtype='int64')
+            match = np.full(n, MATCH_NEW, dtype=object)
+            distance = np.zeros(n, dtype='int64')
+
+            # 1. 精确匹配: (键, 键内序号) 的哈希连接
+            rows = pd.DataFrame({'exact_key': exact, 'row': np.arange(n)})
+            rows['occ'] = rows.groupby('exact_key').cumcount()
+            known['occ'] = known.groupby('exact_key').cumcount()
+            pairs = rows.merge(known[['exact_key', 'occ', 'household_id']], on=['exact_key', 'occ'])
+            household[pairs['row'].to_numpy()] = pairs['household_id'].to_numpy()
+            duplicated = (rows['exact_key'].map(rows['exact_key'].value_counts()).to_numpy() > 1) | \
+                np.isin(exact, known.loc[known['occ'] > 0, 'exact_key'].to_numpy())
+            matched = household >= 0
+            match[matched] = np.where(duplicated[matched], MATCH_EXACT_DUPLICATE, MATCH_EXACT)
+
+            # 2. 模糊匹配: 分块内未匹配样本 × 未匹配农户
+            fuzzy = self._fuzzy_pairs(np.flatnonzero(~matched), block, attrs,
+                                      known[~known['household_id'].isin(pairs['household_id'])],
+                                      max_distance)
+            household[fuzzy['row']] = fuzzy['household_id']
+            match[fuzzy['row']] = MATCH_FUZZY
+            distance[fuzzy['row']] = fuzzy['distance']
+
+            # 3. 新农户
+            new = household < 0
+            start = (self.conn.execute("SELECT MAX(household_id) FROM households").fetchone()[0]
+                     or 0) + 1
+            household[new] = np.arange(start, start + new.sum())
+
+            ids = (df['ID'].to_numpy(dtype='int64') if 'ID' in df.columns
+                   else np.arange(1, n + 1))
+            self._write(wave, ids, household, match, distance, new, location, attrs, exact, block)
+            sp.record(rows_out=n, exact=int((match == MATCH_EXACT).sum()
+                                            + (match == MATCH_EXACT_DUPLICATE).sum()),
+                      fuzzy=len(fuzzy['row']), new=int(new.sum()))
+        return pd.DataFrame({'household_id': household, '匹配方式': match, '距离': distance},
+                            index=df.index)
+
+    def _fuzzy_pairs(self, rows, block, attrs, known, max_distance):
+        """分块内的模糊匹配，贪心地按距离一一对应 (每轮向量化处理，轮数很少)"""
+        empty = {'row': np.array([], dtype='int64'), 'household_id': np.array([], dtype='int64'),
+                 'distance': np.array([], dtype='int64')}
+        if len(rows) == 0 or len(known) == 0:
+            return empty
+        tolerance = self.settings['fuzzy_tolerance']
+        pos = {v: j for j, v in enumerate(self.attributes)}
+        left = pd.DataFrame(attrs[rows][:, [pos[v] for v in tolerance]], columns=list(tolerance))
+        left['row'] = rows
+        left['block_key'] = block[rows]
+        pairs = left.merge(known[['block_key', 'household_id'] + list(tolerance)],
+                           on='block_key', suffixes=('', '_h'))
+        dist = np.zeros(len(pairs), dtype='int64')
+        for var, tol in tolerance.items():
+            a = pairs[var].to_numpy()
+            b = pairs[f'{var}_h'].to_numpy()
+            dist += (np.abs(a - b) > tol) | (a < 0) | (b < 0)
+        pairs = pd.DataFrame({'row': pairs['row'].to_numpy(),
+                              'household_id': pairs['household_id'].to_numpy(), 'distance': dist})
+        pairs = pairs[pairs['distance'] <= max_distance].sort_values(
+            ['distance', 'household_id', 'row'], kind='stable')
+
+        accepted = []
+        while len(pairs):
+            best = pairs.drop_duplicates('row').drop_duplicates('household_id')
+            accepted.append(best)
+            pairs = pairs[~pairs['row'].isin(best['row'])
+                          & ~pairs['household_id'].isin(best['household_id'])]
+        if not accepted:
+            return empty
+        result = pd.concat(accepted)
+        return {c: result[c].to_numpy(dtype='int64') for c in ('row', 'household_id', 'distance')}
+
+    def _write(self, wave, ids, household, match, distance, new, location, attrs, exact, block):
+        """写入本期的对应关系，登记新农户并更新已有农户的属性 (一个事务)"""
+        conn = self.conn
+        names = ''.join(f', "a_{v}"' for v in self.attributes)
+        marks = ', ?' * len(self.attributes)
+        attr_rows = attrs.tolist()
+        with conn:
+            conn.executemany(
+                "INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?)",
+                zip([wave] * len(ids), range(len(ids)), ids.tolist(), household.tolist(),
+                    match.tolist(), distance.tolist()))
+            conn.executemany(
+                "INSERT INTO households (household_id, exact_key, block_key, location, "
+                f"first_wave, last_wave{names}) VALUES (?, ?, ?, ?, ?, ?{marks})",
+                ((int(household[i]), int(exact[i]), int(block[i]), location[i], wave, wave,
+                  *attr_rows[i]) for i in np.flatnonzero(new)))
+            # 已有农户的新属性先写入临时表，再以一条 UPDATE ... FROM 批量更新
+            conn.execute("DROP TABLE IF EXISTS temp.wave_updates")
+            conn.execute("CREATE TEMP TABLE wave_updates (household_id INTEGER PRIMARY KEY, "
+                         f"exact_key INTEGER, block_key INTEGER{names})")
+            conn.executemany(
+                f"INSERT INTO wave_updates VALUES (?, ?, ?{marks})",
+                ((int(household[i]), int(exact[i]), int(block[i]), *attr_rows[i])
+                 for i in np.flatnonzero(~new)))
+            sets = ''.join(f', "a_{v}" = u."a_{v}"' for v in self.attributes)
+            conn.execute(
+                "UPDATE households SET exact_key = u.exact_key, block_key = u.block_key, "
+                f"last_wave = ?{sets} FROM wave_updates u "
+                "WHERE households.household_id = u.household_id", (wave,))
+
+
+def build_panel(waves, index, max_distance=MAX_DISTANCE):
+    """
+    逐期匹配并生成长格式面板数据
+
+    参数:
+        waves: {期次: 结构化数据或文件路径}，按期次顺序匹配；已在索引中的期次不重复匹配
+        index: HouseholdIndex 或索引文件路径
+        max_distance: 模糊匹配允许超出容差的属性个数
+
+    返回:
+        长格式面板: household_id / wave / 匹配方式 / 距离 / 观测期数 / 各变量，
+        按 household_id、wave 排序，可直接用于固定效应或双重差分估计
+    """
+    from survey_io import load_structured
+
+    own = not isinstance(index, HouseholdIndex)
+    if own:
+        index = HouseholdIndex(index)
+    try:
+        done = set(index.waves())
+        parts = []
+        for wave, data in waves.items():
+            df = load_structured(data) if isinstance(data, (str, os.PathLike)) else data
+            wave = str(wave)
+            if wave in done:
+                links = index.observations(wave)
+                if len(links) != len(df):
+                    raise ValueError(f"第 {wave} 期的样本数与索引中的记录不一致")
+                links = links[['household_id', 'match', 'distance']].rename(
+                    columns={'match': '匹配方式', 'distance': '距离'})
+            else:
+                links = index.link_wave(df, wave, max_distance)
+            part = pd.concat([links.reset_index(drop=True), df.reset_index(drop=True)], axis=1)
+            part.insert(1, 'wave', wave)
+            parts.append(part)
+    finally:
+        if own:
+            index.close()
+    panel = pd.concat(parts, ignore_index=True)
+    front = ['household_id', 'wave', '匹配方式', '距离']
+    panel = panel[front + [c for c in panel.columns if c not in front]]
+    panel = panel.sort_values(['household_id', 'wave'], kind='stable', ignore_index=True)
+    panel.insert(4, '观测期数', panel.groupby('household_id')['wave'].transform('size'))
+    return panel
+
+
+def print_link_summary(panel):
+    """打印各期的匹配情况"""
+    table = pd.crosstab(panel['wave'], panel['匹配方式'])
+    print("\n各期匹配情况:")
+    print(table.to_string())
+    print(f"农户数: {panel['household_id'].nunique()}，"
+          f"多期观测的农户: {int((panel.groupby('household_id').size() > 1).sum())}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    from survey_io import save_structured
+
+    # 用法: python panel.py <索引.sqlite> <期次=结构化数据> [<期次=结构化数据> ...]
+    if len(sys.argv) < 3:
+        print("用法: python panel.py <索引.sqlite> 2023=wave2023.parquet 2024=wave2024.parquet")
+    else:
+        waves = dict(arg.split('=', 1) for arg in sys.argv[2:])
+        panel = build_panel(waves, sys.argv[1])
+        print_link_summary(panel)
+        save_structured(panel, 'panel_data.parquet')
+        print("\n面板数据已保存到: panel_data.parquet")
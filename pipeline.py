@@ -0,0 +1,334 @@
+import ast
+import contextlib
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from batch import file_digest
+
+STRUCTURED_FILE = 'structured_data.parquet'
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _imported_modules(path):
+    """源文件中导入的顶层模块名 (包括函数内的延迟导入，不含 __main__ 块)"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    tree.body = [node for node in tree.body
+                 if not (isinstance(node, ast.If) and '__main__' in ast.unparse(node.test))]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def local_dependencies(modules):
+    """
+    模块及其直接或间接导入的本项目模块 (与 pipeline.py 在同一目录下的源文件)
+
+    返回:
+        {模块名: 源文件路径}
+    """
+    found = {}
+    queue = list(modules)
+    while queue:
+        module = queue.pop()
+        if module in found:
+            continue
+        spec = importlib.util.find_spec(module)
+        origin = spec.origin if spec is not None else None
+        if (not origin or not origin.endswith('.py')
+                or os.path.dirname(os.path.abspath(origin)) != PROJECT_DIR):
+            continue
+        found[module] = origin
+        queue.extend(_imported_modules(origin))
+    return found
+
+
+@dataclass
+class Stage:
+    """
+    流水线中的一个阶段
+
+    参数:
+        name: 阶段名
+        func: 阶段函数 func(inputs, output_dir, **params)，inputs 为上游阶段的输出文件
+              (没有上游时为原始问卷文件)，结果写入 output_dir
+        depends: 上游阶段名 (使用其主要输出文件作为输入)
+        params: 阶段参数，参与缓存键的计算
+        modules: 阶段所调用的模块，其源代码及其 (直接或间接) 导入的本项目模块的源代码
+                 参与缓存键的计算
+    """
+    name: str
+    func: object
+    depends: tuple = ()
+    params: dict = field(default_factory=dict)
+    modules: tuple = ()
+
+    def cache_key(self, upstream_keys, input_digest=None):
+        """
+        阶段的内容地址: 阶段名、阶段函数与所调用模块的源代码、参数与上游阶段的缓存键
+        共同决定。只修改某一阶段的参数时，上游阶段的缓存键不变，可直接复用。
+        """
+        digest = hashlib.sha256()
+        digest.update(self.name.encode('utf-8'))
+        digest.update(inspect.getsource(self.func).encode('utf-8'))
+        for module, origin in sorted(local_dependencies(self.modules).items()):
+            digest.update(module.encode('utf-8'))
+            digest.update(file_digest(origin).encode('ascii'))
+        digest.update(json.dumps(self.params, sort_keys=True, default=repr,
+                                 ensure_ascii=False).encode('utf-8'))
+        for key in upstream_keys:
+            digest.update(key.encode('ascii'))
+        if input_digest:
+            digest.update(input_digest.encode('ascii'))
+        return digest.hexdigest()[:16]
+
+
+# ============= 各阶段 =============
+
+def clean_stage(inputs, output_dir, min_other_freq=None, validation='report'):
+    """清洗问卷 -> 结构化数据 (clear_structured_data.py)，并按 validation 策略校验逻辑约束"""
+    from clear_structured_data import process_survey_data
+
+    process_survey_data(inputs[0], os.path.join(output_dir, STRUCTURED_FILE),
+                        min_other_freq=min_other_freq, validation=validation)
+
+
+def stats_stage(inputs, output_dir, strata=None, n_perm=0):
+    """描述性统计 (statistics.py)"""
+    from statistics import comprehensive_descriptive_stats
+
+    comprehensive_descriptive_stats(inputs[0],
+                                    os.path.join(output_dir, 'comprehensive_descriptive_stats.xlsx'),
+                                    strata=strata, n_perm=n_perm)
+
+
+def chi2_stage(inputs, output_dir, **kwargs):
+    """卡方检验 (替代 Chi-squared test.do)"""
+    from chi2_tests import run_chi2_tests
+
+    run_chi2_tests(inputs[0], os.path.join(output_dir, 'chi2_results.xlsx'), **kwargs)
+
+
+def esr_stage(inputs, output_dir, **kwargs):
+    """内生转换模型与 ATT/ATU (替代 esr_final_short.do)"""
+    from esr import run_esr
+
+    result = run_esr(inputs[0], os.path.join(output_dir, 'ESR_results.csv'), **kwargs)
+    result.effects().to_csv(os.path.join(output_dir, 'ESR_effects.csv'), index=False,
+                            encoding='utf-8-sig')
+
+
+def default_stages(clean=None, stats=None, chi2=None, esr=None):
+    """
+    README 中的分析流程: 结构化数据 -> 描述性统计 / 卡方检验 / ESR 与 ATT
+
+    参数:
+        clean / stats / chi2 / esr: 各阶段的参数字典
+    """
+    return [
+        Stage('clean', clean_stage, (), clean or {},
+              ('clear_structured_data', 'codebook', 'survey_io', 'validation')),
+        Stage('stats', stats_stage, ('clean',), stats or {},
+              ('statistics', 'permutation', 'report', 'survey', 'survey_io')),
+        Stage('chi2', chi2_stage, ('clean',), chi2 or {}, ('chi2_tests', 'codebook', 'survey_io')),
+        Stage('esr', esr_stage, ('clean',), esr or {}, ('esr', 'survey', 'survey_io')),
+    ]
+
+
+# ============= 执行 =============
+
+def _peak_memory_mb():
+    """当前进程的峰值内存 (MB)，无法获取时为 None"""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以 KB 为单位
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    except ImportError:
+        return None
+
+
+def _run_stage(func, inputs, output_dir, params):
+    """
+    在独立的子进程中执行一个阶段 (每个子进程只执行一个阶段，峰值内存互不影响)
+
+    阶段的输出先写入临时目录，成功后整体改名为缓存目录。
+    """
+    tmp_dir = f'{output_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    start = time.perf_counter()
+    with open(os.path.join(tmp_dir, 'stage.log'), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log):
+        func(inputs, tmp_dir, **params)
+    seconds = time.perf_counter() - start
+    manifest = {
+        'outputs': sorted(f for f in os.listdir(tmp_dir) if f != 'stage.log'),
+        'seconds': seconds,
+        'peak_memory_mb': _peak_memory_mb(),
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_dir, output_dir)
+    return manifest
+
+
+def _load_manifest(stage_dir):
+    path = os.path.join(stage_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _primary_output(manifest):
+    """阶段的主要输出文件 (下游阶段的输入)"""
+    outputs = manifest['outputs']
+    return STRUCTURED_FILE if STRUCTURED_FILE in outputs else outputs[0]
+
+
+def _check_acyclic(by_name):
+    """检查阶段依赖关系中没有环 (拓扑排序)，有环时报错"""
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            cycle = path[path.index(name):] + [name]
+            raise ValueError(f"阶段依赖关系有环: {' -> '.join(cycle)}")
+        state[name] = 'visiting'
+        for dep in by_name[name].depends:
+            visit(dep, path + [name])
+        state[name] = 'done'
+
+    for name in by_name:
+        visit(name, [])
+
+
+def run_pipeline(input_file, stages=None, output_dir='pipeline_output',
+                 cache_dir='.agritour_pipeline', max_workers=None):
+    """
+    按依赖关系 (DAG) 执行分析流水线，每个阶段的输出按内容地址缓存
+
+    没有依赖关系的阶段 (描述性统计、卡方检验、ESR) 在不同进程中并行执行。
+    缓存键由阶段代码、参数与上游缓存键决定，例如只修改 ESR 的设定时，
+    清洗与描述性统计直接使用缓存。各阶段的最终输出复制到 output_dir。
+
+    参数:
+        input_file: 原始问卷文件
+        stages: Stage 列表，默认为 default_stages()
+        output_dir: 最终输出目录
+        cache_dir: 缓存目录
+        max_workers: 并行进程数，None 时为 CPU 核数
+
+    返回:
+        各阶段的执行报告: 阶段 / 状态 (运行/缓存/失败/跳过) / 耗时(秒) / 峰值内存(MB) / 缓存键 / 输出 / 错误
+    """
+    stages = default_stages() if stages is None else list(stages)
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [d for d in stage.depends if d not in by_name]
+        if missing:
+            raise ValueError(f"阶段 {stage.name} 依赖未定义的阶段: {missing}")
+    _check_acyclic(by_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    input_digest = file_digest(input_file)
+
+    keys = {}
+    outputs = {}
+    rows = {}
+    pending = [stage.name for stage in stages]
+    running = {}
+    pipeline_start = time.perf_counter()
+
+    def finish(name, status, manifest=None, error=''):
+        stage_dir = os.path.join(cache_dir, name, keys.get(name, ''))
+        files = []
+        if manifest is not None:
+            outputs[name] = os.path.join(stage_dir, _primary_output(manifest))
+            for f in manifest['outputs']:
+                shutil.copy2(os.path.join(stage_dir, f), os.path.join(output_dir, f))
+                files.append(f)
+        rows[name] = {
+            '阶段': name,
+            '状态': status,
+            '耗时(秒)': round(manifest['seconds'], 3) if manifest else None,
+            '峰值内存(MB)': (round(manifest['peak_memory_mb'], 1)
+                          if manifest and manifest['peak_memory_mb'] is not None else None),
+            '缓存键': keys.get(name, ''),
+            '输出': ', '.join(files),
+            '错误': error,
+        }
+        print(f"  [{status}] {name}" + (f" ({rows[name]['耗时(秒)']} 秒)" if manifest else ''))
+
+    # 每个子进程只执行一个阶段，以便分别统计峰值内存
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) as pool:
+        while pending or running:
+            for name in list(pending):
+                stage = by_name[name]
+                if any(d not in rows for d in stage.depends):
+                    continue
+                pending.remove(name)
+                if any(rows[d]['状态'] in ('失败', '跳过') for d in stage.depends):
+                    finish(name, '跳过', error='上游阶段失败')
+                    continue
+                keys[name] = stage.cache_key([keys[d] for d in stage.depends],
+                                             None if stage.depends else input_digest)
+                stage_dir = os.path.join(cache_dir, name, keys[name])
+                manifest = _load_manifest(stage_dir)
+                if manifest is not None:
+                    finish(name, '缓存', manifest)
+                    continue
+                inputs = ([outputs[d] for d in stage.depends] if stage.depends
+                          else [os.path.abspath(input_file)])
+                os.makedirs(os.path.dirname(stage_dir), exist_ok=True)
+                future = pool.submit(_run_stage, stage.func, inputs, stage_dir, stage.params)
+                running[future] = name
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    finish(name, '运行', future.result())
+                except Exception as e:
+                    finish(name, '失败', error=repr(e))
+
+    report = pd.DataFrame([rows[stage.name] for stage in stages])
+    print(f"\n流水线完成，总耗时 {time.perf_counter() - pipeline_start:.1f} 秒")
+    print(report.drop(columns=['输出', '错误']).to_string(index=False))
+    report.to_csv(os.path.join(output_dir, 'pipeline_report.csv'), index=False, encoding='utf-8-sig')
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python pipeline.py <问卷文件> [输出目录]")
+    else:
+        run_pipeline(sys.argv[1], output_dir=sys.argv[2] if len(sys.argv) > 2 else 'pipeline_output')
@@ -0,0 +1,477 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from codebook import CODEBOOK
+
+# 建立位图索引的低基数编码变量 (数据中存在的 county / village 也建立索引)
+INDEX_VARIABLES = ('gender', 'age_cat', 'edu', 'land_cat', 'participate', 'county', 'village')
+# 位图索引的最大取值个数
+MAX_INDEX_CARDINALITY = 256
+CACHE_SIZE = 1024
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost')
+DEFAULT_PORT = 8765
+
+STATISTICS = ('count', 'sum', 'mean', 'std', 'min', 'max', 'median', 'share')
+_COMPARISONS = {
+    '==': np.equal, '!=': np.not_equal, '>': np.greater, '>=': np.greater_equal,
+    '<': np.less, '<=': np.less_equal,
+}
+
+
+def _label_tables(codebook=CODEBOOK):
+    """分类变量的 选项文本 -> 编码 与 编码 -> 选项文本 (取第一个文本) 对照表"""
+    to_code, to_label = {}, {}
+    for var in codebook:
+        if var.mapping:
+            to_code[var.name] = dict(var.mapping)
+            labels = {}
+            for text, code in var.mapping.items():
+                labels.setdefault(code, text)
+            to_label[var.name] = labels
+    return to_code, to_label
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存 (按查询的规范化 JSON 文本缓存聚合结果)"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def info(self):
+        return {'size': len(self.items), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses}
+
+
+class QueryEngine:
+    """
+    常驻内存的列式查询引擎
+
+    每个变量保存为一个 NumPy 数组 (编码变量、整数变量与文本变量为整数编码，缺失为 -1；
+    连续变量为 float64，缺失为 NaN)。低基数编码变量的每个取值预先建立压缩位图
+    (np.packbits，每行 1 位，缺失 -1 也有位图)，等值/集合条件为位图的按位与/或，计数为位图的 popcount，
+    不需要逐行扫描。分组统计在筛选出的行上以 np.bincount 一次完成。
+
+    查询格式 (JSON):
+        {
+          "where": {"age_cat": "46-55岁", "land_cat": [1, 2], "income": {">=": 5}},
+          "group_by": ["training"],
+          "metrics": ["count", "share:participate", "mean:agri_income"]
+        }
+        where: 变量 -> 取值 (编码或选项文本)、取值列表或 {比较运算符: 数值}
+        group_by: 分组变量 (编码变量或文本变量)
+        metrics: "count" 或 "统计量:变量"，统计量为 sum / mean / std / min / max / median /
+                 share (取值为 1 的比例，如参与率)
+
+    返回:
+        {"columns": [...], "rows": [[...], ...], "matched": 满足条件的行数}
+
+    参数:
+        df: 结构化数据
+        index_variables: 建立位图索引的变量
+    """
+
+    def __init__(self, df, index_variables=INDEX_VARIABLES, cache_size=CACHE_SIZE):
+        self.n = len(df)
+        self.to_code, self.to_label = _label_tables()
+        self.columns = {}
+        self.categories = {}
+        for name in df.columns:
+            series = df[name]
+            if (isinstance(series.dtype, pd.CategoricalDtype)
+                    and pd.api.types.is_numeric_dtype(series.cat.categories.dtype)):
+                # 以编码为类别的 Categorical (schema.compact_frame(categorical=True)) 还原为编码
+                series = series.astype('Float64')
+            if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+                values = series.to_numpy(dtype='float64', na_value=np.nan)
+                if (name in self.to_code or name in index_variables
+                        or pd.api.types.is_integer_dtype(series.dtype)
+                        or pd.api.types.is_bool_dtype(series.dtype)):
+                    codes = np.where(np.isnan(values), -1, values).astype('int64')
+                    self.columns[name] = codes
+                else:
+                    self.columns[name] = values
+            else:
+                # 文本变量 (如 county / village) 以整数编码保存
+                codes, uniques = pd.factorize(series, sort=True)
+                self.columns[name] = codes.astype('int64')
+                self.categories[name] = {str(v): i for i, v in enumerate(uniques)}
+
+        self.bitmaps = {}
+        for name in index_variables:
+            values = self.columns.get(name)
+            if values is None or values.dtype.kind != 'i':
+                continue
+            # 缺失 (-1) 也建立位图，使位图路径与一般路径的分组一致
+            codes = np.unique(values)
+            if len(codes) <= MAX_INDEX_CARDINALITY:
+                self.bitmaps[name] = {int(c): np.packbits(values == c) for c in codes}
+        self.cache = LRUCache(cache_size)
+
+    # ---------- 条件 ----------
+
+    def _code(self, var, value):
+        """取值转为编码: 选项文本按码本转换，文本变量按其取值表转换"""
+        if var in self.categories:
+            return self.categories[var].get(str(value), -2)
+        if isinstance(value, str):
+            mapping = self.to_code.get(var, {})
+            if value in mapping:
+                return mapping[value]
+            try:
+                return float(value)
+            except ValueError:
+                raise ValueError(f"变量 {var} 没有取值: {value}") from None
+        return value
+
+    def _packed_condition(self, var, values):
+        """索引变量的取值集合条件: 各取值位图的按位或"""
+        bitmaps = self.bitmaps[var]
+        packed = np.zeros((self.n + 7) // 8, dtype='uint8')
+        for value in values:
+            bitmap = bitmaps.get(self._code(var, value))
+            if bitmap is not None:
+                packed |= bitmap
+        return packed
+
+    def _column(self, var):
+        if var not in self.columns:
+            raise ValueError(f"数据中没有变量: {var}")
+        return self.columns[var]
+
+    def _mask_condition(self, var, condition):
+        """非索引条件的布尔掩码"""
+        values = self._column(var)
+        if isinstance(condition, dict):
+            mask = np.ones(self.n, dtype=bool)
+            for op, value in condition.items():
+                if op not in _COMPARISONS:
+                    raise ValueError(f"未知的比较运算符: {op}")
+                with np.errstate(invalid='ignore'):
+                    mask &= _COMPARISONS[op](values, self._code(var, value))
+            if values.dtype.kind == 'i':
+                mask &= values >= 0
+            return mask
+        conditions = condition if isinstance(condition, list) else [condition]
+        return np.isin(values, [self._code(var, v) for v in conditions])
+
+    def _filter(self, where):
+        """
+        满足全部条件的行
+
+        返回:
+            (压缩位图或 None, 布尔掩码或 None)；两者都为 None 表示全部行
+        """
+        packed = None
+        mask = None
+        for var, condition in (where or {}).items():
+            if var in self.bitmaps and not isinstance(condition, dict):
+                bits = self._packed_condition(var, condition if isinstance(condition, list)
+                                              else [condition])
+                packed = bits if packed is None else packed & bits
+            else:
+                m = self._mask_condition(var, condition)
+                mask = m if mask is None else mask & m
+        return packed, mask
+
+    # ---------- 聚合 ----------
+
+    @staticmethod
+    def _parse_metric(metric):
+        if metric == 'count':
+            return 'count', None
+        stat, sep, var = metric.partition(':')
+        if not sep or stat not in STATISTICS or stat == 'count':
+            raise ValueError(f"无法解析的统计量: {metric} (应为 count 或 统计量:变量)")
+        return stat, var
+
+    @staticmethod
+    def _bitmap_count(packed):
+        """位图中 1 的个数"""
+        return int(np.bitwise_count(packed).sum())
+
+    def _fast_counts(self, packed, group_by, metrics):
+        """只含索引条件、按索引变量分组、统计量只有 count / share(索引变量) 时直接由位图计算"""
+        groups = [()]
+        masks = [packed]
+        for var in group_by:
+            groups = [g + (code,) for g in groups for code in self.bitmaps[var]]
+            masks = [m & self.bitmaps[var][code] for m in masks for code in self.bitmaps[var]]
+        rows = []
+        for key, m in zip(groups, masks):
+            n = self._bitmap_count(m)
+            if n == 0:
+                continue
+            row = list(key)
+            for stat, var in metrics:
+                if stat == 'count':
+                    row.append(n)
+                else:
+                    ones = self._bitmap_count(m & self.bitmaps[var][1]) if 1 in self.bitmaps[var] else 0
+                    valid = self._bitmap_count(m & self._packed_condition(
+                        var, [code for code in self.bitmaps[var] if code >= 0]))
+                    row.append(ones / valid if valid else None)
+            rows.append(row)
+        return rows
+
+    def _group_codes(self, rows, group_by):
+        """
+        分组编码: 各分组变量的编码 (缺失 -1 记为 0) 按混合进制合成一个整数键；
+        键空间不大时由 np.bincount 直接找出出现的键，否则用 np.unique
+
+        返回:
+            (各组的分组变量编码 k × g, 每行的组号)
+        """
+        if not group_by:
+            return np.empty((1, 0), dtype='int64'), np.zeros(len(rows), dtype='int64')
+        codes = [self._column(var)[rows] + 1 for var in group_by]
+        radix = [int(c.max()) + 1 for c in codes]
+        combined = np.zeros(len(rows), dtype='int64')
+        for c, r in zip(codes, radix):
+            combined = combined * r + c
+        space = int(np.prod(radix, dtype='float64'))
+        if space <= 4 * len(rows) + MAX_INDEX_CARDINALITY:
+            present = np.flatnonzero(np.bincount(combined, minlength=space))
+            lookup = np.zeros(space, dtype='int64')
+            lookup[present] = np.arange(len(present))
+            inverse = lookup[combined]
+        else:
+            present, inverse = np.unique(combined, return_inverse=True)
+        keys = np.empty((len(present), len(group_by)), dtype='int64')
+        rest = present
+        for j in range(len(group_by) - 1, -1, -1):
+            keys[:, j] = rest % radix[j] - 1
+            rest = rest // radix[j]
+        return keys, inverse
+
+    def _aggregate(self, rows, group_by, metrics):
+        """一般情形: 在筛选出的行上按分组编码以 np.bincount 计算各统计量"""
+        keys, inverse = self._group_codes(rows, group_by)
+        k = len(keys)
+        columns = []
+        for stat, var in metrics:
+            if stat == 'count':
+                columns.append(np.bincount(inverse, minlength=k))
+                continue
+            values = self._column(var)[rows].astype('float64')
+            if self._column(var).dtype.kind == 'i':
+                values[values < 0] = np.nan
+            valid = ~np.isnan(values)
+            x = np.where(valid, values, 0.0)
+            n = np.bincount(inverse, weights=valid, minlength=k)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if stat == 'sum':
+                    result = np.bincount(inverse, weights=x, minlength=k)
+                elif stat == 'mean':
+                    result = np.bincount(inverse, weights=x, minlength=k) / n
+                elif stat == 'share':
+                    result = np.bincount(inverse, weights=valid & (values == 1), minlength=k) / n
+                elif stat == 'std':
+                    mean = np.bincount(inverse, weights=x, minlength=k) / n
+                    dev = np.where(valid, values - mean[inverse], 0.0)
+                    result = np.sqrt(np.bincount(inverse, weights=dev ** 2, minlength=k) / (n - 1))
+                elif stat in ('min', 'max'):
+                    ufunc = np.minimum if stat == 'min' else np.maximum
+                    result = np.full(k, np.inf if stat == 'min' else -np.inf)
+                    ufunc.at(result, inverse[valid], values[valid])
+                    result[n == 0] = np.nan
+                else:
+                    # 中位数: 按 (组, 取值) 排序，各组的有效值连续排列
+                    order = np.lexsort((values[valid], inverse[valid]))
+                    sorted_values = values[valid][order]
+                    size = n.astype('int64')
+                    starts = np.concatenate([[0], np.cumsum(size)[:-1]])
+                    result = np.full(k, np.nan)
+                    has = size > 0
+                    lo = (starts + (size - 1) // 2)[has]
+                    hi = (starts + size // 2)[has]
+                    result[has] = (sorted_values[lo] + sorted_values[hi]) / 2
+            columns.append(result)
+        return [list(map(int, key))
+                + [int(c[i]) if c.dtype.kind == 'i' else None if np.isnan(c[i]) else float(c[i])
+                   for c in columns]
+                for i, key in enumerate(keys)]
+
+    def query(self, spec):
+        """
+        执行一个查询 (见类说明)，相同查询的结果由 LRU 缓存直接返回
+
+        返回:
+            {"columns", "rows", "matched", "cached", "seconds"}
+        """
+        start = time.perf_counter()
+        key = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self._execute(spec)
+            self.cache.put(key, cached)
+            hit = False
+        else:
+            hit = True
+        return dict(cached, cached=hit, seconds=round(time.perf_counter() - start, 6))
+
+    def _execute(self, spec):
+        unknown = set(spec) - {'where', 'group_by', 'metrics', 'labels'}
+        if unknown:
+            raise ValueError(f"未知的查询字段: {sorted(unknown)}")
+        group_by = list(spec.get('group_by') or [])
+        for var in group_by:
+            if self._column(var).dtype.kind != 'i':
+                raise ValueError(f"分组变量应为编码变量: {var}")
+        metrics = [self._parse_metric(m) for m in (spec.get('metrics') or ['count'])]
+        for _, var in metrics:
+            if var is not None:
+                self._column(var)
+        packed, mask = self._filter(spec.get('where'))
+
+        if (mask is None and all(v in self.bitmaps for v in group_by)
+                and all(stat == 'count' or (stat == 'share' and var in self.bitmaps)
+                        for stat, var in metrics)):
+            if packed is None:
+                packed = np.packbits(np.ones(self.n, dtype=bool))
+            matched = self._bitmap_count(packed)
+            rows = self._fast_counts(packed, group_by, metrics)
+        else:
+            selected = np.ones(self.n, dtype=bool) if mask is None else mask
+            if packed is not None:
+                selected &= np.unpackbits(packed, count=self.n).astype(bool)
+            rows_idx = np.flatnonzero(selected)
+            matched = len(rows_idx)
+            rows = self._aggregate(rows_idx, group_by, metrics) if matched else []
+        rows.sort(key=lambda r: r[:len(group_by)])
+
+        columns = group_by + [s if v is None else f'{s}:{v}' for s, v in metrics]
+        if spec.get('labels', True):
+            # 分组编码附加选项文本
+            for j, var in reversed(list(enumerate(group_by))):
+                labels = self._labels(var)
+                if labels:
+                    columns.insert(j + 1, f'{var}_label')
+                    for row in rows:
+                        row.insert(j + 1, labels.get(row[j]))
+        return {'columns': columns, 'rows': rows, 'matched': matched}
+
+    def _labels(self, var):
+        if var in self.categories:
+            return {code: text for text, code in self.categories[var].items()}
+        return self.to_label.get(var)
+
+    def describe(self):
+        """可查询的变量: 变量 -> {类型, 是否有位图索引, 取值 (编码变量)}"""
+        result = {}
+        for name, values in self.columns.items():
+            info = {'type': 'code' if values.dtype.kind == 'i' else 'numeric',
+                    'indexed': name in self.bitmaps}
+            labels = self._labels(name)
+            if labels and len(labels) <= MAX_INDEX_CARDINALITY:
+                info['values'] = {str(code): text for code, text in labels.items()}
+            result[name] = info
+        return {'rows': self.n, 'variables': result}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    engine = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/variables':
+            self._send(200, self.engine.describe())
+        elif self.path == '/cache':
+            self._send(200, self.engine.cache.info())
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok', 'rows': self.engine.n})
+        else:
+            self._send(404, {'error': f'未知路径: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/query':
+            self._send(404, {'error': f'未知路径: {self.path}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            spec = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(spec, dict):
+                raise ValueError("查询应为 JSON 对象")
+            self._send(200, self.engine.query(spec))
+        except (ValueError, KeyError) as e:
+            self._send(400, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(engine, host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    创建只监听本机地址的 HTTP 服务
+
+    GET  /variables  可查询的变量与取值
+    GET  /cache      缓存命中情况
+    GET  /health
+    POST /query      查询 (JSON，见 QueryEngine)
+    """
+    if host not in LOOPBACK_HOSTS:
+        raise ValueError(f"查询服务只能监听本机地址 {LOOPBACK_HOSTS}: {host}")
+    handler = type('Handler', (_Handler,), {'engine': engine})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(input_file, host='127.0.0.1', port=DEFAULT_PORT):
+    """读取结构化数据 (只读取一次)，启动本机查询服务"""
+    from survey_io import load_structured
+
+    print("正在读取数据...")
+    start = time.perf_counter()
+    engine = QueryEngine(load_structured(input_file))
+    print(f"已载入 {engine.n} 行，{len(engine.bitmaps)} 个变量建立位图索引 "
+          f"({time.perf_counter() - start:.2f} 秒)")
+    server = make_server(engine, host, port)
+    print(f"查询服务: http://{host}:{server.server_address[1]}/query (Ctrl+C 结束)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    serve(sys.argv[1] if len(sys.argv) > 1 else 'structured_data.parquet',
+          port=int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT)
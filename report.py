@@ -0,0 +1,126 @@
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# 常用的数字显示格式
+INT = '0'
+FLOAT2 = '0.00'
+FLOAT4 = '0.0000'
+
+
+@dataclass
+class Table:
+    """
+    工作表中的一个表格
+
+    参数:
+        data: 表格内容 (列名作为表头)
+        formats: 列名 -> 显示格式；格式可以是一个字符串 (整列相同) 或与行数等长的列表
+                 (逐行指定，None 表示常规格式)。数字始终以数值写入，格式只影响显示
+        skip: 表格上方空出的行数
+    """
+    data: pd.DataFrame
+    formats: dict = field(default_factory=dict)
+    skip: int = 0
+
+
+@dataclass
+class Sheet:
+    """一个工作表，由若干表格自上而下排列"""
+    name: str
+    tables: list
+
+    def add(self, data, formats=None, skip=0):
+        self.tables.append(Table(data, formats or {}, skip))
+        return self
+
+
+@dataclass
+class Report:
+    """一个工作簿，按 sheets 的顺序写出"""
+    sheets: list = field(default_factory=list)
+
+    def sheet(self, name):
+        """新增工作表并返回，便于链式添加表格"""
+        sheet = Sheet(name, [])
+        self.sheets.append(sheet)
+        return sheet
+
+
+def _is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value))
+
+
+def _cell_width(text):
+    """单元格显示宽度 (中文按两个字符计)"""
+    return sum(2 if ord(ch) > 0x2E80 else 1 for ch in str(text))
+
+
+def write_report(report, output_file, constant_memory=True):
+    """
+    用 xlsxwriter 写出报告
+
+    各工作表按行顺序写出，constant_memory 模式下每行写完即刷新到磁盘，
+    内存占用与行数无关。数值以数字写入，显示格式作为单元格样式 (同一格式只创建一次)。
+
+    参数:
+        report: Report
+        output_file: 输出的 .xlsx 文件
+        constant_memory: 是否使用 xlsxwriter 的 constant_memory 模式
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output_file, {'constant_memory': constant_memory})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    styles = {None: None}
+
+    def style(num_format):
+        if num_format not in styles:
+            styles[num_format] = workbook.add_format({'num_format': num_format})
+        return styles[num_format]
+
+    try:
+        for sheet in report.sheets:
+            worksheet = workbook.add_worksheet(sheet.name)
+            # 列宽由表头决定，需在写入数据之前设置
+            widths = {}
+            for table in sheet.tables:
+                for col, name in enumerate(table.data.columns):
+                    widths[col] = max(widths.get(col, 8), _cell_width(name) + 2)
+            for col, width in widths.items():
+                worksheet.set_column(col, col, width)
+
+            row = 0
+            for table in sheet.tables:
+                row += table.skip
+                data = table.data
+                for col, name in enumerate(data.columns):
+                    worksheet.write_string(row, col, str(name), header_format)
+                row += 1
+                # 每列的格式展开为逐行列表
+                column_formats = []
+                for name in data.columns:
+                    fmt = table.formats.get(name)
+                    if isinstance(fmt, (list, tuple)):
+                        column_formats.append([style(f) for f in fmt])
+                    else:
+                        column_formats.append([style(fmt)] * len(data))
+                for i, values in enumerate(data.itertuples(index=False, name=None)):
+                    for col, value in enumerate(values):
+                        cell_format = column_formats[col][i]
+                        if _is_missing(value):
+                            worksheet.write_blank(row, col, None, cell_format)
+                        elif isinstance(value, (bool, np.bool_)):
+                            worksheet.write_boolean(row, col, bool(value), cell_format)
+                        elif isinstance(value, (int, float, np.integer, np.floating)):
+                            if math.isfinite(value):
+                                worksheet.write_number(row, col, value, cell_format)
+                            else:
+                                worksheet.write_blank(row, col, None, cell_format)
+                        else:
+                            worksheet.write_string(row, col, str(value), cell_format)
+                    row += 1
+    finally:
+        workbook.close()
@@ -0,0 +1,186 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from codebook import CODEBOOK
+
+# float32 可精确表示的小数位数上限 (收入以万元计，一般为两位小数)
+FLOAT32_MAX_DECIMALS = 4
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """
+    结构化数据中一列的类型约定
+
+    参数:
+        name: 变量名
+        kind: 'code' (编码型分类变量)、'numeric' (连续变量)、'dummy' (0/1 虚拟变量) 或 'id'
+        codes: 编码型变量的合法取值 (升序)
+        low / high: 连续变量的合法范围 (None 表示不限)
+    """
+    name: str
+    kind: str
+    codes: tuple = ()
+    low: float = None
+    high: float = None
+
+
+def build_schema(codebook=CODEBOOK):
+    """
+    由码本生成各列的类型约定
+
+    分类变量的合法取值为码本 mapping 中的编码；连续变量 (人数与收入) 均不小于 0。
+    多选题虚拟变量的列名由数据决定，不在约定中，compact_frame 按 0/1 取值识别。
+
+    返回:
+        {变量名: ColumnSpec}
+    """
+    schema = {'ID': ColumnSpec('ID', 'id')}
+    for var in codebook:
+        if var.kind == 'categorical' and var.mapping:
+            schema[var.name] = ColumnSpec(var.name, 'code', tuple(sorted(set(var.mapping.values()))))
+        elif var.kind == 'derived' and var.name != 'ID':
+            # 派生变量目前均为二分变量
+            schema[var.name] = ColumnSpec(var.name, 'code', (0, 1))
+        elif var.kind == 'numeric':
+            schema[var.name] = ColumnSpec(var.name, 'numeric', low=0)
+    return schema
+
+
+SCHEMA = build_schema()
+
+
+def validate_frame(df, schema=None):
+    """
+    检查各列取值是否在约定范围内
+
+    参数:
+        df: 结构化数据
+        schema: build_schema() 的结果，None 时为 SCHEMA
+
+    返回:
+        越界情况表 (变量 / 越界数 / 示例值)，全部合法时为空表
+    """
+    schema = SCHEMA if schema is None else schema
+    rows = []
+    for name, spec in schema.items():
+        if name not in df.columns or spec.kind == 'id':
+            continue
+        values = df[name].to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(values)
+        if spec.kind == 'code':
+            bad = valid & ~np.isin(values, spec.codes)
+        else:
+            bad = np.zeros(len(values), dtype=bool)
+            if spec.low is not None:
+                bad |= valid & (values < spec.low)
+            if spec.high is not None:
+                bad |= valid & (values > spec.high)
+        if bad.any():
+            rows.append({'变量': name, '越界数': int(bad.sum()),
+                         '示例值': ', '.join(map(str, np.unique(values[bad])[:5]))})
+    return pd.DataFrame(rows, columns=['变量', '越界数', '示例值'])
+
+
+def _float32_safe(values):
+    """float64 列转为 float32 后按原有小数位数舍入能否还原 (缺失值除外)"""
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return True
+    if np.abs(finite).max() >= np.finfo('float32').max:
+        return False
+    back = finite.astype('float32').astype('float64')
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        rounded = np.round(finite, decimals)
+        if np.array_equal(rounded, finite):
+            return bool(np.array_equal(np.round(back, decimals), finite))
+    return False
+
+
+def _is_dummy(series):
+    """取值只有 0/1 且无缺失的列 (多选题虚拟变量)"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.SparseDtype):
+        return True
+    if pd.api.types.is_bool_dtype(dtype):
+        return True
+    if not (isinstance(dtype, np.dtype) and pd.api.types.is_integer_dtype(dtype)):
+        return False
+    return len(series) == 0 or (series.min() >= 0 and series.max() <= 1)
+
+
+def compact_frame(df, categorical=False, float32=True, validate=True, schema=None):
+    """
+    将结构化数据转换为紧凑的内存表示
+
+    编码型分类变量存为可空 Int8 (categorical=True 时为以编码为类别的有序 Categorical)，
+    多选题虚拟变量存为 bool，连续变量在按原有小数位数舍入可还原时 (收入一般为两位小数)
+    存为 float32，由此计算的统计量与 float64 相比只有约 1e-7 的相对误差。
+    与全部为 float64 的表示相比，清洗后的数据内存约为原来的四分之一
+    (categorical=True 时约为五分之一；每个虚拟变量仍占 1 字节，未按位压缩)。
+    描述性统计、卡方检验、置换检验、ESR、PSM 与本机查询服务 (query_service)
+    可直接使用转换后的数据。
+
+    参数:
+        df: 结构化数据
+        categorical: 编码型变量是否存为有序 Categorical
+        float32: 是否在安全时将连续变量存为 float32
+        validate: 是否检查取值范围，有越界时报错
+        schema: build_schema() 的结果，None 时为 SCHEMA
+
+    返回:
+        新的数据框
+    """
+    schema = SCHEMA if schema is None else schema
+    if validate:
+        problems = validate_frame(df, schema)
+        if len(problems):
+            detail = '; '.join(f"{r.变量}: {r.越界数} 个 (如 {r.示例值})"
+                               for r in problems.itertuples(index=False))
+            raise ValueError(f"数据取值超出码本范围: {detail}")
+
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        spec = schema.get(name)
+        if isinstance(series.dtype, pd.SparseDtype):
+            series = series.sparse.to_dense()
+        if spec is not None and spec.kind == 'code':
+            codes = series.astype('Int8')
+            if categorical:
+                codes = pd.Series(pd.Categorical(codes, categories=list(spec.codes), ordered=True),
+                                  index=series.index, name=name)
+            columns[name] = codes
+        elif spec is not None and spec.kind == 'id':
+            columns[name] = series.astype('int32' if len(series) == 0 or series.max() < 2 ** 31
+                                          else 'int64')
+        elif spec is not None and spec.kind == 'numeric':
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+            columns[name] = pd.Series(values.astype('float32') if float32 and _float32_safe(values)
+                                      else values, index=series.index, name=name)
+        elif _is_dummy(series):
+            columns[name] = series.astype('bool')
+        else:
+            columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_usage_mb(df):
+    """数据框占用的内存 (MB，含对象列的内容)"""
+    return df.memory_usage(deep=True, index=False).sum() / 1024 ** 2
+
+
+if __name__ == "__main__":
+    import sys
+
+    from survey_io import load_structured
+
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'structured_data.parquet'
+    df = load_structured(input_file)
+    problems = validate_frame(df)
+    print(problems.to_string(index=False) if len(problems) else "取值范围检查通过")
+    compact = compact_frame(df, validate=False)
+    print(f"原始: {memory_usage_mb(df):.1f} MB, 紧凑: {memory_usage_mb(compact):.1f} MB")
+    print(compact.dtypes.value_counts().to_string())
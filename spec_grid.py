@@ -0,0 +1,192 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from esr import COVARIATES, INSTRUMENTS, OUTCOME, TREATMENT, ESRData, fit_esr, prepare_esr_data
+
+_WORKER_DATA = None
+
+
+def _named_sets(sets, prefix):
+    """变量组: 字典原样返回，列表按顺序命名为 prefix1、prefix2..."""
+    if isinstance(sets, dict):
+        return {name: list(v) for name, v in sets.items()}
+    return {f'{prefix}{i + 1}': list(v) for i, v in enumerate(sets)}
+
+
+def _init_worker(shm_name, shape, columns):
+    """子进程: 连接共享内存中的设计矩阵 (不复制)"""
+    global _WORKER_DATA
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    matrix = np.ndarray(shape, dtype='float64', buffer=shm.buf, order='F')
+    _WORKER_DATA = (shm, matrix, columns)
+
+
+def spec_design(matrix, columns, outcome, covariates, instruments, treatment=TREATMENT):
+    """
+    从全部变量的设计矩阵中取出一个设定的 ESRData (与 esr.esr_design 相同的缺失值处理)
+
+    矩阵按列存储，每个变量是一段连续内存，取列不复制；
+    只有该设定的完整样本行被收集为估计所需的 X、Z。
+    """
+    index = {name: j for j, name in enumerate(columns)}
+    k = len(covariates)
+    cols = [index[c] for c in [outcome, treatment] + list(covariates) + list(instruments)]
+    mask = np.ones(matrix.shape[0], dtype=bool)
+    for j in cols:
+        mask &= ~np.isnan(matrix[:, j])
+    rows = np.flatnonzero(mask)
+    n = len(rows)
+    Z = np.empty((n, len(cols) - 1))
+    for pos, j in enumerate(cols[2:]):
+        Z[:, pos] = matrix[rows, j]
+    Z[:, -1] = 1.0
+    X = np.hstack([Z[:, :k], Z[:, -1:]])
+    return ESRData(y=matrix[rows, cols[0]], d=matrix[rows, cols[1]], X=X, Z=Z,
+                   x_names=list(covariates) + ['_cons'],
+                   z_names=list(covariates) + list(instruments) + ['_cons'],
+                   mask=mask)
+
+
+def _fit_spec(spec, matrix=None, columns=None):
+    """估计一个设定，返回结果表的一行 (估计失败时记录错误)"""
+    if matrix is None:
+        _, matrix, columns = _WORKER_DATA
+    outcome, treatment, cov_name, covariates, iv_name, instruments = spec
+    row = {'结果变量': outcome, '协变量组': cov_name, '工具变量组': iv_name,
+           '协变量': ' '.join(covariates), '工具变量': ' '.join(instruments)}
+    try:
+        data = spec_design(matrix, columns, outcome, covariates, instruments, treatment)
+        result = fit_esr(data=data)
+    except (ValueError, np.linalg.LinAlgError) as e:
+        row['错误'] = repr(e)
+        return row
+    rho_chi2, _, rho_p = result.rho_test
+    iv_chi2, iv_dof, iv_p = result.instrument_test
+    row.update({
+        '样本数': result.n,
+        '收敛': result.converged,
+        '对数似然': result.loglik,
+        'ATT': result.att,
+        'ATT(%)': result.att_pct,
+        'ATU': result.atu,
+        'ATU(%)': result.atu_pct,
+        'rho1': result.rho1,
+        'rho1标准误': result.ancillary.loc['rho1', '标准误'],
+        'rho2': result.rho2,
+        'rho2标准误': result.ancillary.loc['rho2', '标准误'],
+        '独立性检验chi2': rho_chi2,
+        '独立性检验p值': rho_p,
+        '工具变量chi2': iv_chi2,
+        '工具变量自由度': iv_dof,
+        '工具变量F': iv_chi2 / iv_dof,
+        '工具变量p值': iv_p,
+        '错误': '',
+    })
+    return row
+
+
+def esr_spec_grid(df, outcomes=(OUTCOME,), covariate_sets=None, instrument_sets=None,
+                  treatment=TREATMENT, max_workers=None):
+    """
+    ESR 设定网格: 结果变量 × 协变量组 × 工具变量组的全部组合
+
+    所有设定用到的变量只转换一次，组成按列存储的设计矩阵放入共享内存，
+    各子进程直接映射该内存，按设定取列、剔除缺失后估计，不再复制整份数据。
+
+    参数:
+        df: 结构化数据 (会先调用 prepare_esr_data；结果变量为 ln_income 时由 income 生成)
+        outcomes: 结果变量列表 (如 ['lnincome_pc', 'ln_income'])
+        covariate_sets: 协变量组，字典 {组名: 变量列表} 或列表；默认为 do 文件的设定
+        instrument_sets: 工具变量组，格式同上；默认为 do 文件的设定
+        treatment: 处理变量
+        max_workers: 进程数，None 时为 CPU 核数，1 时在当前进程中计算
+
+    返回:
+        每个设定一行: 结果变量 / 协变量组 / 工具变量组 / 样本数 / 收敛 / ATT / ATU /
+        rho1 / rho2 / 独立性检验 / 第一阶段工具变量的 chi2 与 F (= chi2 / 自由度) 等
+    """
+    covariate_sets = _named_sets(covariate_sets or {'baseline': COVARIATES}, 'cov')
+    instrument_sets = _named_sets(instrument_sets or {'baseline': INSTRUMENTS}, 'iv')
+
+    df = prepare_esr_data(df)
+    if 'ln_income' in outcomes and 'ln_income' not in df.columns:
+        from statistics import add_derived_variables
+
+        df = add_derived_variables(df)
+    columns = list(dict.fromkeys(
+        list(outcomes) + [treatment]
+        + [v for covs in covariate_sets.values() for v in covs]
+        + [v for ivs in instrument_sets.values() for v in ivs]))
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"数据中缺少变量: {missing}")
+
+    specs = [(outcome, treatment, cov_name, covs, iv_name, ivs)
+             for outcome, (cov_name, covs), (iv_name, ivs)
+             in itertools.product(outcomes, covariate_sets.items(), instrument_sets.items())]
+    values = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+    print(f"共 {len(specs)} 个设定，设计矩阵 {values.shape[0]} 行 × {values.shape[1]} 列")
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1 or len(specs) == 1:
+        matrix = np.asfortranarray(values)
+        rows = [_fit_spec(spec, matrix, columns) for spec in specs]
+    else:
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            matrix = np.ndarray(values.shape, dtype='float64', buffer=shm.buf, order='F')
+            matrix[:] = values
+            del values
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, matrix.shape, columns)) as pool:
+                rows = list(pool.map(_fit_spec, specs))
+            del matrix
+        finally:
+            shm.close()
+            shm.unlink()
+    return pd.DataFrame(rows)
+
+
+def run_spec_grid(input_file, output_file='ESR_spec_grid.csv', **kwargs):
+    """
+    读取结构化数据，估计 ESR 设定网格并输出结果表
+
+    参数:
+        input_file: 结构化数据路径
+        output_file: 结果输出路径 (.csv)
+        kwargs: 传给 esr_spec_grid 的参数
+    """
+    from survey_io import load_structured
+
+    print("正在读取数据...")
+    df = load_structured(input_file)
+    result = esr_spec_grid(df, **kwargs)
+    print(result.drop(columns=['协变量', '工具变量']).round(4).to_string(index=False))
+    result.to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"\n结果已保存到: {output_file}")
+    return result
+
+
+if __name__ == "__main__":
+    # 稳健性检验: 去掉 migrant、两种收入口径、替代工具变量
+    run_spec_grid(
+        "structured_data.parquet", "ESR_spec_grid.csv",
+        outcomes=['lnincome_pc', 'ln_income'],
+        covariate_sets={
+            'baseline': COVARIATES,
+            'no_migrant': [v for v in COVARIATES if v != 'migrant'],
+        },
+        instrument_sets={
+            'baseline': INSTRUMENTS,
+            'info_attraction': ['info', 'attraction'],
+            'all': INSTRUMENTS + ['info', 'attraction'],
+        })
@@ -1,377 +1,677 @@
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-from scipy import stats
+from scipy import special
+
+from instrument import sections, span
+from permutation import permutation_test
+from report import FLOAT2, FLOAT4, INT, Report, Sheet, Table, write_report
+from survey import (survey_design, survey_frequencies, survey_mean_difference, survey_means,
+                    weighted_quantiles)
+from survey_io import load_structured
+
+# 描述性统计中的连续变量与分类变量
+CONTINUOUS_VARS = ['edu', 'f_size', 'up15_size', 'l_size', 'migrant', 'income', 'ln_income',
+                   'transport', 'policy', 'info', 'attraction', 'env']
+CATEGORICAL_VARS = ['gender', 'age_cat', 'edu', 'participate', 'training_yes']
 
 
-def comprehensive_descriptive_stats(input_file, output_file='comprehensive_descriptive_stats.xlsx'):
+class DescriptiveCache:
     """
-    生成完整的描述性统计分析（包括分类变量和连续变量）
+    描述性统计缓存
+
+    连续变量堆叠为一个二维数组，一次计算全部矩统计量与分位数；
+    分类变量堆叠为长表，一次计算全部频数表；分组统计一次 groupby 完成。
+    各工作表只从缓存中取值，不再重复扫描数据。
 
     参数:
-        input_file: 处理后的结构化数据文件路径
-        output_file: 输出的统计结果文件路径
+        df: 结构化数据
+        continuous: 连续变量列表
+        categorical: 分类变量列表
+        by: 分组变量 (默认按是否参与农文旅分组)
     """
 
-    # 读取数据
-    print("正在读取数据...")
-    df = pd.read_excel(input_file)
+    QUANTILES = (0.25, 0.5, 0.75)
+
+    def __init__(self, df, continuous=CONTINUOUS_VARS, categorical=CATEGORICAL_VARS,
+                 by='participate'):
+        self.n = len(df)
+        continuous = [v for v in continuous if v in df.columns]
+        categorical = [v for v in categorical if v in df.columns]
+
+        # 连续变量：矩统计量与分位数
+        values = df[continuous].to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            total = np.where(valid, values, 0).sum(axis=0)
+            mean = total / count
+            dev = np.where(valid, values - mean, 0)
+            std = np.sqrt((dev ** 2).sum(axis=0) / (count - 1))
+        has_data = count > 0
+        lo = np.full(len(continuous), np.nan)
+        hi = np.full(len(continuous), np.nan)
+        quantiles = np.full((len(self.QUANTILES), len(continuous)), np.nan)
+        if has_data.any():
+            lo[has_data] = np.nanmin(values[:, has_data], axis=0)
+            hi[has_data] = np.nanmax(values[:, has_data], axis=0)
+            quantiles[:, has_data] = np.nanquantile(values[:, has_data], self.QUANTILES, axis=0)
+        self.moments = pd.DataFrame({
+            'count': count, 'mean': mean, 'std': std, 'min': lo, 'max': hi,
+            'q25': quantiles[0], 'median': quantiles[1], 'q75': quantiles[2]
+        }, index=continuous)
+
+        # 分类变量：所有频数表一次计算
+        codes = df[categorical].to_numpy(dtype='float64', na_value=np.nan)
+        stacked = pd.DataFrame({
+            'variable': np.repeat(np.arange(len(categorical)), self.n),
+            'value': codes.ravel(order='F')
+        }).dropna()
+        counts = stacked.value_counts().sort_index()
+        self.frequencies = {
+            var: counts.xs(i, level='variable') if i in counts.index.get_level_values(0)
+            else pd.Series(dtype='int64')
+            for i, var in enumerate(categorical)
+        }
 
-    total_n = len(df)
-    print(f"样本总数: {total_n}")
+        # 按分组变量的连续变量统计
+        self.by = by
+        self.grouped = None
+        if by in df.columns:
+            # 使用已转换为 float64 的数组分组 (编码变量可能为 Int8 或有序 Categorical)
+            key = pd.Index(df[by].to_numpy(dtype='float64', na_value=np.nan), name=by)
+            self.grouped = (pd.DataFrame(values, columns=continuous).groupby(key)
+                            .agg(['mean', 'std', 'count']))
+
+    @classmethod
+    def from_grouped(cls, long_table, **keys):
+        """
+        由 grouped_descriptive_stats 的长表取出某一分层，构造该分层的缓存
+
+        参数:
+            long_table: grouped_descriptive_stats 的结果
+            keys: 分层取值，如 county='A县', participate=1
+        """
+        part = slice_stratum(long_table, **keys)
+        cache = cls.__new__(cls)
+        cache.n = int(part.loc[part['variable'] == '_n', 'value'].sum())
+        cont = part[part['category'].isna() & (part['variable'] != '_n')]
+        cache.moments = cont.pivot_table(index='variable', columns='statistic', values='value',
+                                         aggfunc='first', sort=False)
+        cat = part[part['category'].notna() & (part['statistic'] == 'count')]
+        cache.frequencies = {var: grp.set_index('category')['value'].astype('int64').sort_index()
+                             for var, grp in cat.groupby('variable', sort=False)}
+        cache.by = None
+        cache.grouped = None
+        return cache
+
+    def stat(self, var, name):
+        """取连续变量的统计量 (count/mean/std/min/max/q25/median/q75)"""
+        return self.moments.loc[var, name]
+
+    def freq(self, var):
+        """取分类变量的频数表 (取值 -> 频数)"""
+        return self.frequencies[var]
+
+    def group_stat(self, var, group, name):
+        """取分组统计量 (mean/std/count)"""
+        return self.grouped.loc[group, (var, name)]
+
+
+def welch_ttest(mean1, std1, n1, mean2, std2, n2):
+    """
+    由两组的均值、标准差与样本数计算 Welch t 检验 (与 scipy.stats.ttest_ind_from_stats
+    的 equal_var=False 相同)，t 分布尾概率直接由 scipy.special.stdtr 计算
 
-    # 创建Excel写入器
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+    返回:
+        (t统计量, 双侧p值)
+    """
+    v1 = std1 ** 2 / n1
+    v2 = std2 ** 2 / n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_stat = (mean1 - mean2) / np.sqrt(v1 + v2)
+        dof = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+    return float(t_stat), float(2 * special.stdtr(dof, -abs(t_stat)))
 
-        # ============= 1. 样本规模 =============
-        print("\n生成样本规模统计...")
-        sample_size = pd.DataFrame({
-            '统计项': ['样本总数'],
-            '数量(n)': [total_n]
-        })
-        sample_size.to_excel(writer, sheet_name='1_样本规模', index=False)
 
-        # ============= 2. 个体特征 =============
-        print("生成个体特征统计...")
+def _significance(p_value):
+    return '***' if p_value < 0.01 else '**' if p_value < 0.05 else '*' if p_value < 0.1 else '不显著'
 
-        # 2.1 性别
-        gender_stats = df['gender'].value_counts().sort_index()
-        gender_table = pd.DataFrame({
-            '类别': ['男', '女', '合计'],
-            '频数': [
-                gender_stats.get(0, 0),
-                gender_stats.get(1, 0),
-                gender_stats.get(0, 0) + gender_stats.get(1, 0)
-            ],
-            '百分比(%)': [
-                f"{(gender_stats.get(0, 0) / total_n * 100):.2f}",
-                f"{(gender_stats.get(1, 0) / total_n * 100):.2f}",
-                "100.00"
-            ]
-        })
 
-        # 2.2 年龄分层
-        age_labels = ['35岁及以下', '36-45岁', '46-55岁', '56-65岁', '66岁及以上']
-        age_stats = df['age_cat'].value_counts().sort_index()
-        age_data = []
-        cumsum = 0
-        for i, label in enumerate(age_labels, 1):
-            count = age_stats.get(i, 0)
-            pct = (count / total_n * 100) if total_n > 0 else 0
-            cumsum += pct
-            age_data.append({
-                '类别': label,
-                '频数': count,
-                '百分比(%)': f"{pct:.2f}",
-                '累计百分比(%)': f"{cumsum:.2f}"
-            })
-        age_data.append({'类别': '合计', '频数': total_n, '百分比(%)': '100.00', '累计百分比(%)': '100.00'})
-        age_table = pd.DataFrame(age_data)
-
-        # 2.3 教育程度
-        edu_labels = ['小学及以下', '初中/中专', '高中', '大专', '本科']
-        edu_stats = df['edu'].value_counts().sort_index()
-        edu_data = []
-        cumsum = 0
-        for i, label in enumerate(edu_labels, 1):
-            count = edu_stats.get(i, 0)
-            pct = (count / total_n * 100) if total_n > 0 else 0
-            cumsum += pct
-            edu_data.append({
-                '类别': label,
-                '编码': i,
-                '频数': count,
-                '百分比(%)': f"{pct:.2f}",
-                '累计百分比(%)': f"{cumsum:.2f}"
-            })
-        edu_data.append({'类别': '合计', '编码': '', '频数': total_n, '百分比(%)': '100.00', '累计百分比(%)': '100.00'})
-        edu_table = pd.DataFrame(edu_data)
-
-        # 教育程度均值
-        edu_mean = df['edu'].mean()
-        edu_std = df['edu'].std()
-        edu_summary = pd.DataFrame({
-            '统计量': ['均值', '标准差'],
-            '数值': [f"{edu_mean:.2f}", f"{edu_std:.2f}"]
-        })
+def add_derived_variables(df):
+    """补充统计所需的派生变量 (结构化数据中没有 ln_income 时由 income 生成)"""
+    if 'ln_income' not in df.columns and 'income' in df.columns:
+        df = df.copy()
+        df['ln_income'] = np.log(df['income'].astype('float64').replace(0, np.nan))
+    return df
 
-        # 保存个体特征
-        gender_table.to_excel(writer, sheet_name='2_个体特征_性别', index=False)
-        age_table.to_excel(writer, sheet_name='2_个体特征_年龄', index=False)
-        edu_table.to_excel(writer, sheet_name='2_个体特征_教育', index=False)
-
-        # 在同一sheet添加教育程度均值
-        workbook = writer.book
-        worksheet = writer.sheets['2_个体特征_教育']
-        startrow = len(edu_table) + 3
-        edu_summary.to_excel(writer, sheet_name='2_个体特征_教育',
-                             startrow=startrow, index=False)
-
-        # ============= 3. 家庭结构特征 =============
-        print("生成家庭结构统计...")
-
-        household_vars = {
-            'f_size': '家庭总人口',
-            'up15_size': '15周岁以上人口数',
-            'l_size': '劳动力人口数',
-            'migrant': '外出务工人数'
-        }
 
-        household_data = []
-        for var, name in household_vars.items():
-            if var in df.columns:
-                household_data.append({
-                    '变量': name,
-                    '均值': f"{df[var].mean():.2f}",
-                    '标准差': f"{df[var].std():.2f}",
-                    '最小值': f"{df[var].min():.0f}",
-                    '最大值': f"{df[var].max():.0f}",
-                    '有效样本数': df[var].notna().sum()
-                })
-
-        household_table = pd.DataFrame(household_data)
-        household_table.to_excel(writer, sheet_name='3_家庭结构特征', index=False)
-
-        # ============= 4. 经济特征 =============
-        print("生成经济特征统计...")
-
-        # 4.1 家庭年收入基本统计
-        income_basic = pd.DataFrame({
-            '统计量': ['均值', '标准差', '最小值', '最大值', '中位数', '有效样本数'],
-            '家庭年收入(万元)': [
-                f"{df['income'].mean():.2f}",
-                f"{df['income'].std():.2f}",
-                f"{df['income'].min():.2f}",
-                f"{df['income'].max():.2f}",
-                f"{df['income'].median():.2f}",
-                df['income'].notna().sum()
-            ]
-        })
+def grouped_descriptive_stats(df, strata, continuous=CONTINUOUS_VARS,
+                              categorical=CATEGORICAL_VARS):
+    """
+    按任意分层变量 (县、村、调查轮次、是否参与等) 一次计算全部描述性统计
 
-        # 4.2 收入对数的统计
-        ln_income_basic = pd.DataFrame({
-            '统计量': ['均值', '标准差', '最小值', '最大值', '有效样本数'],
-            'ln(收入)': [
-                f"{df['ln_income'].mean():.4f}",
-                f"{df['ln_income'].std():.4f}",
-                f"{df['ln_income'].min():.4f}",
-                f"{df['ln_income'].max():.4f}",
-                df['ln_income'].notna().sum()
-            ]
-        })
+    连续变量的统计量由一次 groupby 完成；分类变量堆叠为长表后一次 groupby
+    得到所有分层的全部频数表。
 
-        # 4.3 按参与状态分组的收入对比
-        participate_income = df.groupby('participate')['ln_income'].agg(['mean', 'std', 'count'])
-        participate_income_table = pd.DataFrame({
-            '组别': ['未参与农文旅(0)', '参与农文旅(1)'],
-            '均值': [f"{participate_income.loc[0, 'mean']:.4f}",
-                     f"{participate_income.loc[1, 'mean']:.4f}"],
-            '标准差': [f"{participate_income.loc[0, 'std']:.4f}",
-                       f"{participate_income.loc[1, 'std']:.4f}"],
-            '样本数': [int(participate_income.loc[0, 'count']),
-                       int(participate_income.loc[1, 'count'])]
-        })
+    参数:
+        df: 结构化数据
+        strata: 分层变量名或列表
+        continuous: 连续变量列表
+        categorical: 分类变量列表
+
+    返回:
+        长表，列为 分层变量... / variable / category / statistic / value
+        - 连续变量: category 为空，statistic 为 count/mean/std/min/max/median
+        - 分类变量: category 为取值，statistic 为 count (频数) 与 percent (占该分层样本的百分比)
+        - variable 为 '_n' 的行是各分层的样本数
+    """
+    df = add_derived_variables(df)
+    strata = [strata] if isinstance(strata, str) else list(strata)
+    continuous = [v for v in continuous if v in df.columns and v not in strata]
+    categorical = [v for v in categorical if v in df.columns and v not in strata]
+    groups = df.groupby(strata, observed=True)
+
+    sizes = groups.size()
+    size_long = sizes.rename('value').reset_index()
+    size_long['variable'] = '_n'
+    size_long['statistic'] = 'count'
+
+    # 连续变量 (统一转为 float64 计算，编码变量可能为 Int8 或有序 Categorical、收入可能为 float32)
+    values = pd.DataFrame(df[continuous].to_numpy(dtype='float64', na_value=np.nan),
+                          columns=continuous, index=df.index)
+    moments = (values.groupby([df[s] for s in strata], observed=True)
+               .agg(['count', 'mean', 'std', 'min', 'max', 'median']))
+    moments.columns = moments.columns.set_names(['variable', 'statistic'])
+    cont_long = moments.stack(['variable', 'statistic'], future_stack=True).rename('value').reset_index()
+
+    # 分类变量：堆叠后一次分组计数
+    n = len(df)
+    stacked = {s: np.tile(df[s].to_numpy(), len(categorical)) for s in strata}
+    stacked['variable'] = np.repeat(categorical, n)
+    stacked['category'] = df[categorical].to_numpy(dtype='float64', na_value=np.nan).ravel(order='F')
+    stacked = pd.DataFrame(stacked).dropna(subset=['category'])
+    counts = stacked.groupby(strata + ['variable', 'category'], observed=True).size().rename('count')
+    counts = counts.reset_index()
+    counts['percent'] = counts['count'] / counts[strata].merge(
+        sizes.rename('n').reset_index(), on=strata, how='left')['n'].to_numpy() * 100
+    cat_long = counts.melt(id_vars=strata + ['variable', 'category'],
+                           var_name='statistic', value_name='value')
+
+    long_table = pd.concat([size_long, cont_long, cat_long], ignore_index=True)
+    long_table['value'] = long_table['value'].astype('float64')
+    return long_table[strata + ['variable', 'category', 'statistic', 'value']]
+
+
+def slice_stratum(long_table, **keys):
+    """取出长表中某一分层的结果，如 slice_stratum(t, county='A县')"""
+    mask = np.ones(len(long_table), dtype=bool)
+    for col, value in keys.items():
+        mask &= (long_table[col] == value).to_numpy()
+    return long_table[mask]
+
+
+def pivot_grouped_stats(long_table, strata, statistic='mean'):
+    """
+    将长表转换为宽表：行为变量 (分类变量为 变量/取值)，列为各分层
+
+    参数:
+        long_table: grouped_descriptive_stats 的结果
+        strata: 分层变量名或列表
+        statistic: 连续变量取的统计量；分类变量固定取百分比
+    """
+    strata = [strata] if isinstance(strata, str) else list(strata)
+    cont = long_table[long_table['category'].isna() & (long_table['statistic'] == statistic)]
+    cat = long_table[long_table['category'].notna() & (long_table['statistic'] == 'percent')]
+    wide_cont = cont.pivot_table(index='variable', columns=strata, values='value', sort=False)
+    wide_cat = cat.pivot_table(index=['variable', 'category'], columns=strata, values='value',
+                               sort=False)
+    wide_cont.index = pd.MultiIndex.from_arrays([wide_cont.index, [np.nan] * len(wide_cont)],
+                                                names=['variable', 'category'])
+    return pd.concat([wide_cont, wide_cat])
 
-        # 4.4 t检验
-        group0 = df[df['participate'] == 0]['ln_income'].dropna()
-        group1 = df[df['participate'] == 1]['ln_income'].dropna()
-        t_stat, p_value = stats.ttest_ind(group0, group1)
 
-        ttest_result = pd.DataFrame({
-            '检验项': ['t统计量', 'p值', '显著性'],
-            '数值': [f"{t_stat:.4f}", f"{p_value:.4f}",
-                     '***' if p_value < 0.01 else '**' if p_value < 0.05 else '*' if p_value < 0.1 else '不显著']
-        })
+def _pct(count, total_n):
+    return count / total_n * 100 if total_n > 0 else 0.0
+
 
-        # 保存经济特征
-        income_basic.to_excel(writer, sheet_name='4_经济特征_收入', index=False)
+def build_descriptive_report(df, cache=None, strata=None, design=None, n_perm=0, max_workers=None):
+    """
+    构造完整描述性统计报告 (各工作表与表格的声明式布局)
+
+    所有数值保持为数字，显示的小数位数由单元格格式决定。
 
-        worksheet = writer.sheets['4_经济特征_收入']
-        ln_income_basic.to_excel(writer, sheet_name='4_经济特征_收入',
-                                 startrow=len(income_basic) + 2, index=False)
-        participate_income_table.to_excel(writer, sheet_name='4_经济特征_收入',
-                                          startrow=len(income_basic) + len(ln_income_basic) + 5, index=False)
-        ttest_result.to_excel(writer, sheet_name='4_经济特征_收入',
-                              startrow=len(income_basic) + len(ln_income_basic) + len(participate_income_table) + 8,
-                              index=False)
+    参数:
+        df: 结构化数据 (已调用 add_derived_variables)
+        cache: DescriptiveCache，None 时由 df 计算
+        strata: 分层变量名或列表，给定时增加分层统计工作表
+        design: survey.SurveyDesign，给定时增加按抽样设计加权的统计工作表
+                (加权均值、比例、分位数与线性化标准误，参与状态的设计 t 检验)
+        n_perm: ln_income 置换检验的置换次数，0 时不做置换检验 (大样本下耗时较长)
+        max_workers: 置换检验的进程数 (见 permutation.permutation_test)
+
+    返回:
+        report.Report
+    """
+    if cache is None:
+        cache = DescriptiveCache(df)
+    total_n = len(df)
+    sheets = {}
+    section = sections('stats')
+
+    # ============= 1. 样本规模 =============
+    print("\n生成样本规模统计...")
+    section.start('1_样本规模', rows_in=total_n)
+    sample_size = pd.DataFrame({
+        '统计项': ['样本总数'],
+        '数量(n)': [total_n]
+    })
+    sheets['1_样本规模'] = [Table(sample_size)]
+
+    # ============= 2. 个体特征 =============
+    print("生成个体特征统计...")
+    section.start('2_个体特征', rows_in=total_n)
+
+    # 2.1 性别
+    gender_stats = cache.freq('gender')
+    gender_table = pd.DataFrame({
+        '类别': ['男', '女', '合计'],
+        '频数': [
+            gender_stats.get(0, 0),
+            gender_stats.get(1, 0),
+            gender_stats.get(0, 0) + gender_stats.get(1, 0)
+        ],
+        '百分比(%)': [
+            _pct(gender_stats.get(0, 0), total_n),
+            _pct(gender_stats.get(1, 0), total_n),
+            100.0
+        ]
+    })
+    sheets['2_个体特征_性别'] = [Table(gender_table, {'百分比(%)': FLOAT2})]
+
+    # 2.2 年龄分层
+    age_labels = ['35岁及以下', '36-45岁', '46-55岁', '56-65岁', '66岁及以上']
+    age_stats = cache.freq('age_cat')
+    age_counts = [age_stats.get(i, 0) for i in range(1, len(age_labels) + 1)]
+    age_pct = [_pct(count, total_n) for count in age_counts]
+    age_table = pd.DataFrame({
+        '类别': age_labels + ['合计'],
+        '频数': age_counts + [total_n],
+        '百分比(%)': age_pct + [100.0],
+        '累计百分比(%)': list(np.cumsum(age_pct)) + [100.0]
+    })
+    sheets['2_个体特征_年龄'] = [Table(age_table, {'百分比(%)': FLOAT2, '累计百分比(%)': FLOAT2})]
+
+    # 2.3 教育程度
+    edu_labels = ['小学及以下', '初中/中专', '高中', '大专', '本科']
+    edu_stats = cache.freq('edu')
+    edu_counts = [edu_stats.get(i, 0) for i in range(1, len(edu_labels) + 1)]
+    edu_pct = [_pct(count, total_n) for count in edu_counts]
+    edu_table = pd.DataFrame({
+        '类别': edu_labels + ['合计'],
+        '编码': list(range(1, len(edu_labels) + 1)) + [None],
+        '频数': edu_counts + [total_n],
+        '百分比(%)': edu_pct + [100.0],
+        '累计百分比(%)': list(np.cumsum(edu_pct)) + [100.0]
+    })
+
+    # 教育程度均值 (与教育程度表在同一工作表)
+    edu_mean = cache.stat('edu', 'mean')
+    edu_std = cache.stat('edu', 'std')
+    edu_summary = pd.DataFrame({
+        '统计量': ['均值', '标准差'],
+        '数值': [edu_mean, edu_std]
+    })
+    sheets['2_个体特征_教育'] = [
+        Table(edu_table, {'百分比(%)': FLOAT2, '累计百分比(%)': FLOAT2}),
+        Table(edu_summary, {'数值': FLOAT2}, skip=2),
+    ]
+
+    # ============= 3. 家庭结构特征 =============
+    print("生成家庭结构统计...")
+    section.start('3_家庭结构特征', rows_in=total_n)
+
+    household_vars = {
+        'f_size': '家庭总人口',
+        'up15_size': '15周岁以上人口数',
+        'l_size': '劳动力人口数',
+        'migrant': '外出务工人数'
+    }
+
+    household_data = []
+    for var, name in household_vars.items():
+        if var in df.columns:
+            household_data.append({
+                '变量': name,
+                '均值': cache.stat(var, 'mean'),
+                '标准差': cache.stat(var, 'std'),
+                '最小值': cache.stat(var, 'min'),
+                '最大值': cache.stat(var, 'max'),
+                '有效样本数': int(cache.stat(var, 'count'))
+            })
+    household_table = pd.DataFrame(household_data)
+    sheets['3_家庭结构特征'] = [Table(household_table, {'均值': FLOAT2, '标准差': FLOAT2,
+                                                       '最小值': INT, '最大值': INT})]
+
+    # ============= 4. 经济特征 =============
+    print("生成经济特征统计...")
+    section.start('4_经济特征', rows_in=total_n)
+
+    # 4.1 家庭年收入基本统计
+    income_basic = pd.DataFrame({
+        '统计量': ['均值', '标准差', '最小值', '最大值', '中位数', '有效样本数'],
+        '家庭年收入(万元)': [cache.stat('income', name)
+                             for name in ('mean', 'std', 'min', 'max', 'median', 'count')]
+    })
+
+    # 4.2 收入对数的统计
+    ln_income_basic = pd.DataFrame({
+        '统计量': ['均值', '标准差', '最小值', '最大值', '有效样本数'],
+        'ln(收入)': [cache.stat('ln_income', name)
+                     for name in ('mean', 'std', 'min', 'max', 'count')]
+    })
+
+    # 4.3 按参与状态分组的收入对比
+    participate_income = cache.grouped['ln_income'].reindex([0, 1])
+    participate_income_table = pd.DataFrame({
+        '组别': ['未参与农文旅(0)', '参与农文旅(1)'],
+        '均值': participate_income['mean'].to_numpy(),
+        '标准差': participate_income['std'].to_numpy(),
+        '样本数': participate_income['count'].fillna(0).astype('int64').to_numpy()
+    })
+
+    # 4.4 t检验 (两组样本量不平衡、方差不相等，使用 Welch t 检验，
+    # n_perm > 0 时以置换检验作为稳健性检验)
+    t_stat, p_value = welch_ttest(
+        participate_income.loc[0, 'mean'], participate_income.loc[0, 'std'],
+        participate_income.loc[0, 'count'],
+        participate_income.loc[1, 'mean'], participate_income.loc[1, 'std'],
+        participate_income.loc[1, 'count'])
+    test_items = ['t统计量(Welch)', 'p值', '显著性']
+    test_values = [t_stat, p_value, _significance(p_value)]
+    if n_perm:
+        with span('stats.permutation_test', rows_in=total_n, n_perm=n_perm):
+            perm = permutation_test(df, outcomes=['ln_income'], n_perm=n_perm,
+                                    max_workers=max_workers).iloc[0]
+        p_perm = perm['置换p值(t统计量)']
+        test_items += [f'置换检验p值({n_perm}次)', '置换检验显著性']
+        test_values += [p_perm, _significance(p_perm)]
+
+    ttest_result = pd.DataFrame({'检验项': test_items, '数值': test_values})
+
+    sheets['4_经济特征_收入'] = [
+        Table(income_basic, {'家庭年收入(万元)': [FLOAT2] * 5 + [INT]}),
+        Table(ln_income_basic, {'ln(收入)': [FLOAT4] * 4 + [INT]}, skip=1),
+        Table(participate_income_table, {'均值': FLOAT4, '标准差': FLOAT4}, skip=2),
+        Table(ttest_result, {'数值': FLOAT4}, skip=2),
+    ]
+
+    # ============= 5. 产业参与特征 =============
+    print("生成产业参与统计...")
+    section.start('5_产业参与特征', rows_in=total_n)
+
+    participate_stats = cache.freq('participate')
+    participate_table = pd.DataFrame({
+        '类别': ['未参与', '参与', '合计'],
+        '频数': [
+            participate_stats.get(0, 0),
+            participate_stats.get(1, 0),
+            total_n
+        ],
+        '百分比(%)': [
+            _pct(participate_stats.get(0, 0), total_n),
+            _pct(participate_stats.get(1, 0), total_n),
+            100.0
+        ]
+    })
+    sheets['5_产业参与特征'] = [Table(participate_table, {'百分比(%)': FLOAT2})]
+
+    # ============= 6. 主观感知变量 =============
+    print("生成主观感知统计...")
+    section.start('6_主观感知', rows_in=total_n)
+
+    perception_vars = {
+        'transport': '交通通畅程度',
+        'info': '信息化建设程度',
+        'attraction': '旅游吸引力',
+        'env': '环境卫生条件'
+    }
+    perception_formats = {'均值': FLOAT2, '标准差': FLOAT2, '最小值': INT, '最大值': INT,
+                          '中位数': FLOAT2}
+
+    perception_data = []
+    for var, name in perception_vars.items():
+        if var in df.columns:
+            perception_data.append({
+                '变量': name,
+                '均值': cache.stat(var, 'mean'),
+                '标准差': cache.stat(var, 'std'),
+                '最小值': cache.stat(var, 'min'),
+                '最大值': cache.stat(var, 'max'),
+                '中位数': cache.stat(var, 'median'),
+                '有效样本数': int(cache.stat(var, 'count'))
+            })
+    perception_table = pd.DataFrame(perception_data)
+    sheets['6_主观感知'] = [Table(perception_table, perception_formats)]
+
+    # ============= 7. 政策支持 =============
+    print("生成政策支持统计...")
+    section.start('7_政策支持', rows_in=total_n)
+
+    if 'policy' in df.columns:
+        policy_table = pd.DataFrame({
+            '变量': ['政策扶持力度'],
+            '均值': [cache.stat('policy', 'mean')],
+            '标准差': [cache.stat('policy', 'std')],
+            '最小值': [cache.stat('policy', 'min')],
+            '最大值': [cache.stat('policy', 'max')],
+            '中位数': [cache.stat('policy', 'median')],
+            '有效样本数': [int(cache.stat('policy', 'count'))]
+        })
+        sheets['7_政策支持'] = [Table(policy_table, perception_formats)]
 
-        # ============= 5. 产业参与特征 =============
-        print("生成产业参与统计...")
+    # ============= 8. 培训情况 =============
+    print("生成培训统计...")
+    section.start('8_培训情况', rows_in=total_n)
 
-        participate_stats = df['participate'].value_counts().sort_index()
-        participate_table = pd.DataFrame({
-            '类别': ['未参与', '参与', '合计'],
+    if 'training_yes' in df.columns:
+        training_stats = cache.freq('training_yes')
+        training_table = pd.DataFrame({
+            '类别': ['未参加培训', '参加培训', '合计'],
             '频数': [
-                participate_stats.get(0, 0),
-                participate_stats.get(1, 0),
+                training_stats.get(0, 0),
+                training_stats.get(1, 0),
                 total_n
             ],
             '百分比(%)': [
-                f"{(participate_stats.get(0, 0) / total_n * 100):.2f}",
-                f"{(participate_stats.get(1, 0) / total_n * 100):.2f}",
-                "100.00"
+                _pct(training_stats.get(0, 0), total_n),
+                _pct(training_stats.get(1, 0), total_n),
+                100.0
             ]
         })
-        participate_table.to_excel(writer, sheet_name='5_产业参与特征', index=False)
-
-        # ============= 6. 主观感知变量 =============
-        print("生成主观感知统计...")
-
-        perception_vars = {
-            'transport': '交通通畅程度',
-            'info': '信息化建设程度',
-            'attraction': '旅游吸引力',
-            'env': '环境卫生条件'
-        }
-
-        perception_data = []
-        for var, name in perception_vars.items():
-            if var in df.columns:
-                perception_data.append({
-                    '变量': name,
-                    '均值': f"{df[var].mean():.2f}",
-                    '标准差': f"{df[var].std():.2f}",
-                    '最小值': int(df[var].min()),
-                    '最大值': int(df[var].max()),
-                    '中位数': f"{df[var].median():.2f}",
-                    '有效样本数': df[var].notna().sum()
-                })
-
-        perception_table = pd.DataFrame(perception_data)
-        perception_table.to_excel(writer, sheet_name='6_主观感知', index=False)
-
-        # ============= 7. 政策支持 =============
-        print("生成政策支持统计...")
-
-        if 'policy' in df.columns:
-            policy_table = pd.DataFrame({
-                '变量': ['政策扶持力度'],
-                '均值': [f"{df['policy'].mean():.2f}"],
-                '标准差': [f"{df['policy'].std():.2f}"],
-                '最小值': [int(df['policy'].min())],
-                '最大值': [int(df['policy'].max())],
-                '中位数': [f"{df['policy'].median():.2f}"],
-                '有效样本数': [df['policy'].notna().sum()]
-            })
-            policy_table.to_excel(writer, sheet_name='7_政策支持', index=False)
-
-        # ============= 8. 培训情况 =============
-        print("生成培训统计...")
-
-        if 'training_yes' in df.columns:
-            training_stats = df['training_yes'].value_counts().sort_index()
-            training_table = pd.DataFrame({
-                '类别': ['未参加培训', '参加培训', '合计'],
-                '频数': [
-                    training_stats.get(0, 0),
-                    training_stats.get(1, 0),
-                    total_n
-                ],
-                '百分比(%)': [
-                    f"{(training_stats.get(0, 0) / total_n * 100):.2f}",
-                    f"{(training_stats.get(1, 0) / total_n * 100):.2f}",
-                    "100.00"
-                ]
+        sheets['8_培训情况'] = [Table(training_table, {'百分比(%)': FLOAT2})]
+
+    # ============= 9. 综合汇总表 =============
+    print("生成综合汇总表...")
+    section.start('0_综合汇总', rows_in=total_n)
+
+    summary_data = []
+
+    # 样本规模
+    summary_data.append({
+        '类别': '样本规模',
+        '变量': 'n',
+        '统计结果': str(total_n),
+        '说明': '样本总数'
+    })
+
+    # 个体特征
+    summary_data.append({
+        '类别': '个体特征',
+        '变量': 'gender',
+        '统计结果': f"男: {gender_stats.get(0, 0)} ({_pct(gender_stats.get(0, 0), total_n):.2f}%); 女: {gender_stats.get(1, 0)} ({_pct(gender_stats.get(1, 0), total_n):.2f}%)",
+        '说明': '性别分布'
+    })
+
+    summary_data.append({
+        '类别': '个体特征',
+        '变量': 'age_cat',
+        '统计结果': f"详见年龄分层表",
+        '说明': '年龄分层'
+    })
+
+    summary_data.append({
+        '类别': '个体特征',
+        '变量': 'edu',
+        '统计结果': f"{edu_mean:.2f} ± {edu_std:.2f}",
+        '说明': '教育程度(均值±标准差)'
+    })
+
+    # 家庭结构
+    for var, name in household_vars.items():
+        if var in df.columns:
+            summary_data.append({
+                '类别': '家庭结构',
+                '变量': var,
+                '统计结果': f"{cache.stat(var, 'mean'):.2f} ± {cache.stat(var, 'std'):.2f}",
+                '说明': name
             })
-            training_table.to_excel(writer, sheet_name='8_培训情况', index=False)
 
-        # ============= 9. 综合汇总表 =============
-        print("生成综合汇总表...")
-
-        summary_data = []
+    # 经济特征
+    summary_data.append({
+        '类别': '经济特征',
+        '变量': 'income',
+        '统计结果': f"{cache.stat('income', 'mean'):.2f} ± {cache.stat('income', 'std'):.2f}",
+        '说明': '家庭年收入(万元)'
+    })
+
+    summary_data.append({
+        '类别': '经济特征',
+        '变量': 'ln_income',
+        '统计结果': f"未参与: {participate_income.loc[0, 'mean']:.4f}; 参与: {participate_income.loc[1, 'mean']:.4f}; t={t_stat:.4f}, p={p_value:.4f}",
+        '说明': 'ln(收入)按参与状态对比'
+    })
+
+    # 产业参与
+    summary_data.append({
+        '类别': '产业参与',
+        '变量': 'participate',
+        '统计结果': f"未参与: {participate_stats.get(0, 0)} ({_pct(participate_stats.get(0, 0), total_n):.2f}%); 参与: {participate_stats.get(1, 0)} ({_pct(participate_stats.get(1, 0), total_n):.2f}%)",
+        '说明': '是否参与农文旅'
+    })
+
+    # 主观感知
+    for var, name in perception_vars.items():
+        if var in df.columns:
+            summary_data.append({
+                '类别': '主观感知',
+                '变量': var,
+                '统计结果': f"{cache.stat(var, 'mean'):.2f} ± {cache.stat(var, 'std'):.2f}",
+                '说明': name
+            })
 
-        # 样本规模
+    # 政策支持
+    if 'policy' in df.columns:
         summary_data.append({
-            '类别': '样本规模',
-            '变量': 'n',
-            '统计结果': str(total_n),
-            '说明': '样本总数'
+            '类别': '政策支持',
+            '变量': 'policy',
+            '统计结果': f"{cache.stat('policy', 'mean'):.2f} ± {cache.stat('policy', 'std'):.2f}",
+            '说明': '政策扶持力度'
         })
 
-        # 个体特征
+    # 培训
+    if 'training_yes' in df.columns:
         summary_data.append({
-            '类别': '个体特征',
-            '变量': 'gender',
-            '统计结果': f"男: {gender_stats.get(0, 0)} ({(gender_stats.get(0, 0) / total_n * 100):.2f}%); 女: {gender_stats.get(1, 0)} ({(gender_stats.get(1, 0) / total_n * 100):.2f}%)",
-            '说明': '性别分布'
+            '类别': '培训',
+            '变量': 'training_yes',
+            '统计结果': f"未培训: {training_stats.get(0, 0)} ({_pct(training_stats.get(0, 0), total_n):.2f}%); 培训: {training_stats.get(1, 0)} ({_pct(training_stats.get(1, 0), total_n):.2f}%)",
+            '说明': '是否接受培训'
         })
 
-        summary_data.append({
-            '类别': '个体特征',
-            '变量': 'age_cat',
-            '统计结果': f"详见年龄分层表",
-            '说明': '年龄分层'
+    summary_table = pd.DataFrame(summary_data)
+    sheets['0_综合汇总'] = [Table(summary_table)]
+
+    # ============= 10. 分层统计 =============
+    if strata:
+        print("生成分层统计...")
+        section.start('10_分层统计', rows_in=total_n)
+        grouped_table = grouped_descriptive_stats(df, strata)
+        sheets['10_分层统计'] = [Table(grouped_table, {'value': FLOAT4})]
+        section.record(rows_out=len(grouped_table))
+
+    # ============= 11. 加权统计 (抽样设计) =============
+    if design is not None:
+        print("生成加权统计...")
+        section.start('11_加权统计', rows_in=total_n, n_psu=design.n_psu)
+        continuous = [v for v in CONTINUOUS_VARS if v in df.columns]
+        weighted_means = survey_means(df, continuous, design).reset_index()
+        weighted_freq = pd.concat(
+            [survey_frequencies(df, var, design).assign(变量=var)
+             for var in CATEGORICAL_VARS if var in df.columns], ignore_index=True)
+        weighted_freq = weighted_freq[['变量'] + [c for c in weighted_freq.columns if c != '变量']]
+        quantile_table = weighted_quantiles(df, continuous, design).reset_index()
+        design_info = pd.DataFrame({
+            '设计项': ['权重变量', '聚类变量', '分层变量', 'PSU数', '设计自由度'],
+            '取值': [design.weight or '(无)', design.cluster or '(无，每户为一个PSU)',
+                     design.strata or '(无)', design.n_psu, design.dof]
         })
+        tables = [
+            Table(design_info),
+            Table(weighted_means, {c: FLOAT4 for c in weighted_means.columns[3:]}, skip=2),
+            Table(weighted_freq, {'加权频数': FLOAT2, '加权比例(%)': FLOAT2,
+                                  '标准误(%)': FLOAT4, '设计效应': FLOAT4}, skip=2),
+            Table(quantile_table, {c: FLOAT4 for c in quantile_table.columns[1:]}, skip=2),
+        ]
+        if {'ln_income', 'participate'} <= set(df.columns):
+            test = survey_mean_difference(df, 'ln_income', 'participate', design)
+            test_table = pd.DataFrame({
+                '检验项': ['ln(收入)按参与状态: ' + name for name in test.index] + ['显著性'],
+                '数值': list(test.to_numpy()) + [_significance(test['p值'])]
+            })
+            tables.append(Table(test_table, {'数值': FLOAT4}, skip=2))
+        sheets['11_加权统计'] = tables
+    section.close()
 
-        summary_data.append({
-            '类别': '个体特征',
-            '变量': 'edu',
-            '统计结果': f"{edu_mean:.2f} ± {edu_std:.2f}",
-            '说明': '教育程度(均值±标准差)'
-        })
+    return Report([Sheet(name, tables) for name, tables in sheets.items()])
 
-        # 家庭结构
-        for var, name in household_vars.items():
-            if var in df.columns:
-                summary_data.append({
-                    '类别': '家庭结构',
-                    '变量': var,
-                    '统计结果': f"{df[var].mean():.2f} ± {df[var].std():.2f}",
-                    '说明': name
-                })
-
-        # 经济特征
-        summary_data.append({
-            '类别': '经济特征',
-            '变量': 'income',
-            '统计结果': f"{df['income'].mean():.2f} ± {df['income'].std():.2f}",
-            '说明': '家庭年收入(万元)'
-        })
 
-        summary_data.append({
-            '类别': '经济特征',
-            '变量': 'ln_income',
-            '统计结果': f"未参与: {participate_income.loc[0, 'mean']:.4f}; 参与: {participate_income.loc[1, 'mean']:.4f}; t={t_stat:.4f}, p={p_value:.4f}",
-            '说明': 'ln(收入)按参与状态对比'
-        })
+def comprehensive_descriptive_stats(input_file, output_file='comprehensive_descriptive_stats.xlsx',
+                                    strata=None, weight=None, cluster=None, n_perm=0):
+    """
+    生成完整的描述性统计分析（包括分类变量和连续变量）
 
-        # 产业参与
-        summary_data.append({
-            '类别': '产业参与',
-            '变量': 'participate',
-            '统计结果': f"未参与: {participate_stats.get(0, 0)} ({(participate_stats.get(0, 0) / total_n * 100):.2f}%); 参与: {participate_stats.get(1, 0)} ({(participate_stats.get(1, 0) / total_n * 100):.2f}%)",
-            '说明': '是否参与农文旅'
-        })
+    参数:
+        input_file: 处理后的结构化数据文件路径 (.parquet / .feather / .dta / .xlsx)
+        output_file: 输出的统计结果文件路径
+        strata: 分层变量名或列表 (如 ['county', 'village'])，给定时增加分层统计工作表
+        weight / cluster: 抽样权重变量与聚类变量 (如 'village')，任一给定时增加
+                          11_加权统计 工作表 (见 survey.py)；其余工作表仍为不加权统计
+        n_perm: ln_income 置换检验的置换次数 (如 9999)，默认 0 不做置换检验
+    """
 
-        # 主观感知
-        for var, name in perception_vars.items():
-            if var in df.columns:
-                summary_data.append({
-                    '类别': '主观感知',
-                    '变量': var,
-                    '统计结果': f"{df[var].mean():.2f} ± {df[var].std():.2f}",
-                    '说明': name
-                })
-
-        # 政策支持
-        if 'policy' in df.columns:
-            summary_data.append({
-                '类别': '政策支持',
-                '变量': 'policy',
-                '统计结果': f"{df['policy'].mean():.2f} ± {df['policy'].std():.2f}",
-                '说明': '政策扶持力度'
-            })
+    # 读取数据
+    print("正在读取数据...")
+    with span('stats.read', input_file=str(input_file)) as sp:
+        df = add_derived_variables(load_structured(input_file))
+        sp.record(rows_out=len(df), columns_out=df.shape[1])
 
-        # 培训
-        if 'training_yes' in df.columns:
-            summary_data.append({
-                '类别': '培训',
-                '变量': 'training_yes',
-                '统计结果': f"未培训: {training_stats.get(0, 0)} ({(training_stats.get(0, 0) / total_n * 100):.2f}%); 培训: {training_stats.get(1, 0)} ({(training_stats.get(1, 0) / total_n * 100):.2f}%)",
-                '说明': '是否接受培训'
-            })
+    total_n = len(df)
+    print(f"样本总数: {total_n}")
 
-        summary_table = pd.DataFrame(summary_data)
-        summary_table.to_excel(writer, sheet_name='0_综合汇总', index=False)
+    # 一次计算全部统计量，各工作表只从缓存中取值
+    print("计算统计量...")
+    with span('stats.cache', rows_in=total_n):
+        cache = DescriptiveCache(df)
+
+    design = survey_design(df, weight, cluster) if weight or cluster else None
+    report = build_descriptive_report(df, cache, strata, design, n_perm=n_perm)
+    with span('stats.write', output_file=str(output_file)) as sp:
+        write_report(report, output_file)
+        sp.record(sheets=len(report.sheets))
 
     print(f"\n完成！所有统计结果已保存到: {output_file}")
     print("\n生成的工作表:")
@@ -384,11 +684,56 @@ def comprehensive_descriptive_stats(input_file, output_file='comprehensive_descr
     print("  - 6_主观感知")
     print("  - 7_政策支持")
     print("  - 8_培训情况")
+    if strata:
+        print("  - 10_分层统计")
+    if design is not None:
+        print("  - 11_加权统计")
 
     return
 
+
+def _stratum_report(df, output_file, n_perm=0):
+    """子进程: 计算并写出一个分层的报告 (置换检验在本进程中计算，不再嵌套进程池)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        write_report(build_descriptive_report(df, n_perm=n_perm, max_workers=1), output_file)
+    return output_file
+
+
+def stratified_descriptive_reports(input_file, strata, output_dir='reports', max_workers=None,
+                                   n_perm=0):
+    """
+    为每个分层 (如每个村) 单独生成一份完整描述性统计工作簿，多个进程并行写出
+
+    参数:
+        input_file: 结构化数据路径
+        strata: 分层变量名或列表
+        output_dir: 输出目录，文件名为 描述性统计_<分层取值>.xlsx
+        max_workers: 进程数，None 时为 CPU 核数
+        n_perm: 各分层 ln_income 置换检验的置换次数，0 时不做置换检验
+
+    返回:
+        写出的文件列表
+    """
+    print("正在读取数据...")
+    df = add_derived_variables(load_structured(input_file))
+    os.makedirs(output_dir, exist_ok=True)
+    strata = [strata] if isinstance(strata, str) else list(strata)
+
+    tasks = []
+    for key, part in df.groupby(strata, observed=True):
+        key = key if isinstance(key, tuple) else (key,)
+        name = '_'.join(str(k) for k in key)
+        tasks.append((part, os.path.join(output_dir, f'描述性统计_{name}.xlsx'), n_perm))
+    print(f"共 {len(tasks)} 个分层，开始并行生成报告...")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        files = list(pool.map(_stratum_report, *zip(*tasks))) if tasks else []
+    print(f"完成！报告已保存到: {output_dir}")
+    return files
+
+
 if __name__ == "__main__":
-    input_file = "structured_data.xlsx"  
+    input_file = "structured_data.parquet"
 
     print("=" * 70)
     print("生成完整描述性统计分析")
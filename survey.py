@@ -0,0 +1,301 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+# 默认的聚类变量: 抽样以村为初级抽样单位 (batch.py 合并数据时生成)
+CLUSTER = 'village'
+
+
+@dataclass
+class SurveyDesign:
+    """
+    抽样设计
+
+    weights: 每个样本的抽样权重 (未指定时全为 1)
+    psu: 每个样本所属初级抽样单位 (PSU) 的编码 0..n_psu-1；未指定聚类时每个样本自成一个 PSU
+    psu_strata: 每个 PSU 所在分层的编码 0..n_strata-1 (未指定分层时全为 0)
+    """
+    weights: np.ndarray = field(repr=False)
+    psu: np.ndarray = field(repr=False)
+    psu_strata: np.ndarray = field(repr=False)
+    n_psu: int
+    n_strata: int
+    weight: str = None
+    cluster: str = None
+    strata: str = None
+
+    @property
+    def n(self):
+        return len(self.weights)
+
+    @property
+    def dof(self):
+        """设计自由度 = PSU 数 - 分层数"""
+        return self.n_psu - self.n_strata
+
+
+def _codes(df, name, role):
+    """变量的整数编码 (0..k-1)，变量不存在或有缺失时报错"""
+    if name not in df.columns:
+        raise ValueError(f"数据中缺少{role}变量: {name}")
+    codes, uniques = pd.factorize(df[name], sort=True)
+    if (codes < 0).any():
+        raise ValueError(f"{role}变量 {name} 有缺失值")
+    return codes.astype('int64'), len(uniques)
+
+
+def survey_design(df, weight=None, cluster=CLUSTER, strata=None):
+    """
+    由数据中的权重、聚类与分层变量构造抽样设计
+
+    不同分层中同名的聚类视为不同的 PSU (如不同县的同名村)。
+
+    参数:
+        df: 结构化数据
+        weight: 抽样权重变量名，None 时各样本权重相同
+        cluster: 聚类变量名 (默认 village)，None 时每个样本自成一个 PSU
+        strata: 分层变量名 (如 county)，None 时不分层
+
+    返回:
+        SurveyDesign
+    """
+    n = len(df)
+    if weight is None:
+        weights = np.ones(n)
+    else:
+        if weight not in df.columns:
+            raise ValueError(f"数据中缺少权重变量: {weight}")
+        weights = df[weight].to_numpy(dtype='float64', na_value=np.nan)
+        if np.isnan(weights).any():
+            raise ValueError(f"权重变量 {weight} 有缺失值")
+        if (weights < 0).any():
+            raise ValueError(f"权重变量 {weight} 有负值")
+
+    stratum, n_strata = _codes(df, strata, '分层') if strata else (np.zeros(n, dtype='int64'), 1)
+    if cluster:
+        psu, n_psu = _codes(df, cluster, '聚类')
+        if strata:
+            psu, uniques = pd.factorize(stratum * n_psu + psu, sort=True)
+            n_psu = len(uniques)
+    else:
+        psu, n_psu = np.arange(n, dtype='int64'), n
+    psu_strata = np.zeros(n_psu, dtype='int64')
+    psu_strata[psu] = stratum
+    return SurveyDesign(weights=weights, psu=psu, psu_strata=psu_strata, n_psu=n_psu,
+                        n_strata=n_strata, weight=weight, cluster=cluster, strata=strata)
+
+
+def segment_sum(values, codes, n_groups):
+    """
+    按组编码求和 (每列一次 np.bincount，不按组循环)
+
+    参数:
+        values: 一维数组或 n × p 矩阵
+        codes: 每行的组编码 (0..n_groups-1)
+        n_groups: 组数
+
+    返回:
+        长度为 n_groups 的数组或 n_groups × p 矩阵
+    """
+    values = np.asarray(values, dtype='float64')
+    if values.ndim == 1:
+        return np.bincount(codes, weights=values, minlength=n_groups)
+    totals = np.empty((n_groups, values.shape[1]))
+    for j in range(values.shape[1]):
+        totals[:, j] = np.bincount(codes, weights=values[:, j], minlength=n_groups)
+    return totals
+
+
+def psu_variance(design, totals):
+    """
+    由各 PSU 的线性化变量合计 (n_psu × p) 计算设计方差
+
+    分层内对 PSU 合计求离差平方和，乘以 G_h / (G_h - 1) 后相加 (有放回抽样近似，
+    与 Stata svy 的线性化方差相同)。只有一个 PSU 的分层无法估计方差，结果为缺失值。
+    """
+    h = design.psu_strata
+    g_h = np.bincount(h, minlength=design.n_strata).astype('float64')
+    mean_h = segment_sum(totals, h, design.n_strata) / g_h[:, None]
+    dev = totals - mean_h[h]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(g_h > 1, g_h / (g_h - 1), np.nan)
+    return segment_sum(dev ** 2, h, design.n_strata).T @ factor
+
+
+def design_variance(design, z):
+    """
+    线性化方差: z 为各统计量在每个样本上的影响值 (n × p)，按 PSU 汇总后由 psu_variance 计算
+    """
+    z = np.asarray(z, dtype='float64')
+    column = z.ndim == 1
+    var = psu_variance(design, segment_sum(z[:, None] if column else z, design.psu, design.n_psu))
+    return var[0] if column else var
+
+
+def _values(df, variables):
+    values = df[list(variables)].to_numpy(dtype='float64', na_value=np.nan)
+    return values, ~np.isnan(values)
+
+
+def survey_means(df, variables, design, level=0.95):
+    """
+    加权均值及其线性化标准误
+
+    均值为比率估计 Σwy / Σw，影响值为 w(y - ȳ) / Σw。
+    变量缺失的样本在该变量上权重视为 0 (子总体估计，PSU 与分层结构不变)。
+
+    参数:
+        df: 结构化数据
+        variables: 变量列表
+        design: survey_design() 的结果
+        level: 置信水平 (临界值取设计自由度的 t 分布)
+
+    返回:
+        每个变量一行: 样本数 / 加权样本数 / 加权均值 / 标准误 / 置信下限 / 置信上限 /
+        加权标准差 / 设计效应 (设计方差与同样本量简单随机抽样方差之比)
+    """
+    values, valid = _values(df, variables)
+    w = design.weights[:, None] * valid
+    count = valid.sum(axis=0)
+    total_w = w.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (w * np.where(valid, values, 0)).sum(axis=0) / total_w
+        dev = np.where(valid, values - mean, 0)
+        se = np.sqrt(design_variance(design, w * dev / total_w))
+        sd = np.sqrt((w * dev ** 2).sum(axis=0) / total_w * count / (count - 1))
+        deff = se ** 2 / (sd ** 2 / count)
+    crit = special.stdtrit(max(design.dof, 1), 0.5 + level / 2)
+    return pd.DataFrame({
+        '样本数': count,
+        '加权样本数': total_w,
+        '加权均值': mean,
+        '标准误': se,
+        '置信下限': mean - crit * se,
+        '置信上限': mean + crit * se,
+        '加权标准差': sd,
+        '设计效应': deff,
+    }, index=pd.Index(list(variables), name='变量'))
+
+
+def survey_frequencies(df, variable, design):
+    """
+    加权频数表与比例的线性化标准误
+
+    各类别在每个 PSU 中的加权频数由一次 np.bincount (PSU × 类别) 得到，
+    类别 k 的 PSU 合计影响值为 (A_ck - p_k W_c) / W。
+
+    返回:
+        每个取值一行: 取值 / 样本数 / 加权频数 / 加权比例(%) / 标准误(%) / 设计效应
+    """
+    values = df[variable].to_numpy(dtype='float64', na_value=np.nan)
+    valid = ~np.isnan(values)
+    categories, codes = np.unique(values[valid], return_inverse=True)
+    k = len(categories)
+    w = design.weights[valid]
+    psu = design.psu[valid]
+    total_w = w.sum()
+    counts = np.bincount(codes, minlength=k)
+    weighted = np.bincount(codes, weights=w, minlength=k)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = weighted / total_w
+        by_psu = np.bincount(psu * k + codes, weights=w, minlength=design.n_psu * k)
+        totals = (by_psu.reshape(design.n_psu, k)
+                  - np.bincount(psu, weights=w, minlength=design.n_psu)[:, None] * share) / total_w
+        se = np.sqrt(psu_variance(design, totals))
+        deff = se ** 2 / (share * (1 - share) / valid.sum())
+    return pd.DataFrame({
+        '取值': categories,
+        '样本数': counts,
+        '加权频数': weighted,
+        '加权比例(%)': share * 100,
+        '标准误(%)': se * 100,
+        '设计效应': deff,
+    })
+
+
+def weighted_quantiles(df, variables, design, quantiles=(0.25, 0.5, 0.75)):
+    """
+    加权分位数: 按取值排序后累计权重首次达到 q·Σw 的取值
+
+    返回:
+        每个变量一行，列为 P25 / P50 / P75 等
+    """
+    values, valid = _values(df, variables)
+    quantiles = np.asarray(quantiles, dtype='float64')
+    result = np.full((len(variables), len(quantiles)), np.nan)
+    for j in range(len(variables)):
+        v = values[valid[:, j], j]
+        w = design.weights[valid[:, j]]
+        if len(v) == 0 or w.sum() <= 0:
+            continue
+        order = np.argsort(v, kind='stable')
+        cum = np.cumsum(w[order])
+        pos = np.searchsorted(cum, quantiles * cum[-1], side='left')
+        result[j] = v[order][np.minimum(pos, len(v) - 1)]
+    return pd.DataFrame(result, index=pd.Index(list(variables), name='变量'),
+                        columns=[f'P{q * 100:g}' for q in quantiles])
+
+
+def survey_mean_difference(df, outcome, group, design):
+    """
+    两组加权均值之差的设计检验 (取代独立同分布假设下的 Welch t 检验)
+
+    差值的影响值为 w[1(g=1)(y - ȳ1)/W1 - 1(g=0)(y - ȳ0)/W0]，
+    t 统计量 = 差值 / 线性化标准误，自由度为设计自由度 (PSU 数 - 分层数)。
+
+    参数:
+        outcome: 结果变量
+        group: 0/1 分组变量
+
+    返回:
+        pd.Series: 组0均值 / 组1均值 / 差值 / 标准误 / t统计量 / 自由度 / p值
+    """
+    values, valid = _values(df, [outcome, group])
+    y, g = values[:, 0], values[:, 1]
+    ok = valid.all(axis=1)
+    in1 = ok & (g == 1)
+    in0 = ok & (g == 0)
+    w1 = design.weights * in1
+    w0 = design.weights * in0
+    y = np.where(ok, y, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean1 = (w1 * y).sum() / w1.sum()
+        mean0 = (w0 * y).sum() / w0.sum()
+        z = w1 * (y - mean1) / w1.sum() - w0 * (y - mean0) / w0.sum()
+        se = float(np.sqrt(design_variance(design, z)))
+        t_stat = (mean1 - mean0) / se
+    dof = max(design.dof, 1)
+    return pd.Series({
+        '组0均值': mean0,
+        '组1均值': mean1,
+        '差值': mean1 - mean0,
+        '标准误': se,
+        't统计量': t_stat,
+        '自由度': dof,
+        'p值': 2 * special.stdtr(dof, -abs(t_stat)),
+    })
+
+
+if __name__ == "__main__":
+    import sys
+
+    from statistics import CATEGORICAL_VARS, CONTINUOUS_VARS, add_derived_variables
+    from survey_io import load_structured
+
+    # 用法: python survey.py [数据文件] [权重变量] [聚类变量]
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'structured_data.parquet'
+    df = add_derived_variables(load_structured(input_file))
+    weight = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+    cluster = sys.argv[3] if len(sys.argv) > 3 else (CLUSTER if CLUSTER in df.columns else None)
+    design = survey_design(df, weight=weight, cluster=cluster)
+    print(f"样本数: {design.n}，PSU 数: {design.n_psu}，分层数: {design.n_strata}")
+    continuous = [v for v in CONTINUOUS_VARS if v in df.columns]
+    print(survey_means(df, continuous, design).round(4).to_string())
+    for var in CATEGORICAL_VARS:
+        if var in df.columns:
+            print(f"\n{var}:")
+            print(survey_frequencies(df, var, design).round(4).to_string(index=False))
+    print("\nln_income 按参与状态的设计检验:")
+    print(survey_mean_difference(df, 'ln_income', 'participate', design).round(4).to_string())
@@ -0,0 +1,233 @@
+import os
+
+import pandas as pd
+
+from codebook import variables_of_kind
+
+# 编码型分类变量 (取值范围小，以可空 Int8 存储)
+CODED_VARIABLES = [v for v in variables_of_kind('categorical', 'derived') if v != 'ID']
+# 连续变量
+CONTINUOUS_VARIABLES = variables_of_kind('numeric')
+
+
+def _suffix(path):
+    return os.path.splitext(str(path))[1].lower()
+
+
+def read_survey(input_file):
+    """整体读取问卷导出文件 (.csv / .xlsx / .xls)"""
+    if _suffix(input_file) == '.csv':
+        return pd.read_csv(input_file)
+    return pd.read_excel(input_file)
+
+
+def iter_survey_chunks(input_file, chunksize=50000):
+    """
+    按行分块读取问卷导出文件
+
+    参数:
+        input_file: 问卷文件路径 (.csv / .xlsx / .xlsm / .xls)
+        chunksize: 每块的行数
+
+    说明:
+        .csv 使用 pandas 分块读取，.xlsx 使用 openpyxl 只读模式逐行读取，
+        内存占用与总行数无关。.xls 格式无法流式解析，只能整体读入后再分块，
+        大文件请先另存为 .xlsx 或 .csv。
+    """
+    suffix = _suffix(input_file)
+    if suffix == '.csv':
+        yield from pd.read_csv(input_file, chunksize=chunksize)
+    elif suffix in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= chunksize:
+                    yield pd.DataFrame(buffer, columns=header)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=header)
+        finally:
+            workbook.close()
+    else:
+        df = pd.read_excel(input_file)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def read_survey_header(input_file):
+    """只读取问卷文件的表头"""
+    suffix = _suffix(input_file)
+    if suffix == '.csv':
+        return pd.read_csv(input_file, nrows=0).columns.tolist()
+    if suffix in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            return list(next(workbook.active.iter_rows(max_row=1, values_only=True), ()))
+        finally:
+            workbook.close()
+    return pd.read_excel(input_file, nrows=0).columns.tolist()
+
+
+def read_survey_column(input_file, position):
+    """
+    只读取问卷文件中的某一列 (按列位置，从0开始)
+
+    参数:
+        input_file: 问卷文件路径
+        position: 列位置
+    """
+    suffix = _suffix(input_file)
+    if suffix == '.csv':
+        return pd.read_csv(input_file, usecols=[position]).iloc[:, 0]
+    if suffix in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(min_col=position + 1, max_col=position + 1,
+                                             values_only=True)
+            header = next(rows, (None,))[0]
+            return pd.Series([row[0] for row in rows], name=header, dtype=object)
+        finally:
+            workbook.close()
+    return pd.read_excel(input_file, usecols=[position]).iloc[:, 0]
+
+
+class ParquetChunkWriter:
+    """
+    分块追加写入 Parquet 文件
+
+    以第一块的结构作为文件结构，后续各块按该结构转换后写入同一文件。
+    需要安装 pyarrow。
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.output_file, self._schema)
+        else:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fits_int8(series):
+    """整数列的取值是否都在 int8 范围内 (空列视为是)"""
+    if len(series) == 0 or series.isna().all():
+        return True
+    return bool(series.min() >= -128 and series.max() <= 127)
+
+
+def compact_dtypes(df):
+    """
+    将结构化数据转换为紧凑的数据类型
+
+    编码变量转为可空 Int8，连续变量统一为 float64，多选题虚拟变量等取值在 int8 范围内的
+    整数列转为 int8；超出范围的整数列 (如农户编号、期数) 保持原类型，避免溢出。
+    """
+    df = df.copy()
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in CODED_VARIABLES:
+            df[col] = df[col].astype('Int8')
+        elif col in CONTINUOUS_VARIABLES:
+            df[col] = df[col].astype('float64')
+        elif col == 'ID':
+            df[col] = df[col].astype('int64')
+        elif isinstance(dtype, pd.SparseDtype):
+            df[col] = df[col].sparse.to_dense().astype('int8')
+        elif (pd.api.types.is_bool_dtype(dtype)
+              or pd.api.types.is_signed_integer_dtype(dtype) and _fits_int8(df[col])):
+            # 无符号整数 (如数据校验的位图列 _violations) 保持原样；有缺失值的可空列转为 Int8
+            df[col] = df[col].astype('Int8' if df[col].hasnans else 'int8')
+    return df
+
+
+def save_structured(df, output_file):
+    """
+    保存结构化数据，格式由扩展名决定
+
+    参数:
+        df: 结构化数据
+        output_file: 输出路径
+            .parquet          - Parquet (推荐，保留数据类型)
+            .feather / .arrow - Arrow IPC (可内存映射读取)
+            .dta              - Stata 数据文件 (供 do 文件使用)
+            .xlsx             - Excel (仅作为最终展示)
+    """
+    suffix = _suffix(output_file)
+    if suffix == '.parquet':
+        compact_dtypes(df).to_parquet(output_file, index=False)
+    elif suffix in ('.feather', '.arrow'):
+        compact_dtypes(df).reset_index(drop=True).to_feather(output_file)
+    elif suffix == '.dta':
+        data = compact_dtypes(df)
+        # Stata 对可空整数的支持有限，缺失值统一为 double 缺失
+        nullable = [c for c in data.columns if isinstance(data[c].dtype, pd.Int8Dtype)]
+        data[nullable] = data[nullable].astype('float64')
+        data.to_stata(output_file, write_index=False, version=118)
+    elif suffix in ('.xlsx', '.xls'):
+        from clear_structured_data import densify
+
+        densify(df).to_excel(output_file, index=False)
+    else:
+        raise ValueError(f"不支持的输出格式: {output_file}")
+
+
+def load_structured(input_file, columns=None, memory_map=True, compact=False):
+    """
+    读取结构化数据，格式由扩展名决定
+
+    参数:
+        input_file: 结构化数据路径 (.parquet / .feather / .arrow / .dta / .xlsx)
+        columns: 只读取指定的列
+        memory_map: 对 Parquet / Arrow 文件使用内存映射读取
+        compact: 为 True 时转换为紧凑的内存表示并检查取值范围 (见 schema.compact_frame)
+    """
+    if compact:
+        from schema import compact_frame
+
+        return compact_frame(load_structured(input_file, columns, memory_map))
+    suffix = _suffix(input_file)
+    if suffix == '.parquet':
+        return pd.read_parquet(input_file, columns=columns, memory_map=memory_map)
+    if suffix in ('.feather', '.arrow'):
+        from pyarrow import feather
+
+        table = feather.read_table(input_file, columns=columns, memory_map=memory_map)
+        return table.to_pandas()
+    if suffix == '.dta':
+        return pd.read_stata(input_file, columns=columns)
+    df = pd.read_excel(input_file)
+    return df if columns is None else df[columns]
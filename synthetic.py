@@ -0,0 +1,228 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from codebook import LIKERT_MAPPING
+
+SKIP = '(跳过)'
+
+# 问卷星导出文件的表头 (列位置与 codebook 中的 position 一致)
+SURVEY_HEADERS = [
+    '序号',
+    '1、您的性别：',
+    '2、您的年龄：',
+    '3、您的受教育程度：',
+    '4、您的家庭总人口（人）：',
+    '5、家庭中15周岁以上人口数（人）：',
+    '6、家庭劳动力人口数（人）：',
+    '7、家庭常年外出务工人数（人）：',
+    '8、家庭年总收入（万元）：',
+    '9、您家是否参与农文旅融合相关产业？',
+    '10、您家参与的产业类型：',
+    '11、农文旅产业年收入（万元）：',
+    '12、村集体分红收入（万元）：',
+    '13、您对本村发展乡村旅游的了解程度：',
+    '14、您是否参加过相关技能培训？',
+    '15、您认为本村的发展优势：',
+    '16、您家耕地面积：',
+    '17、您认为本村交通通畅程度：',
+    '18、您认为政府政策扶持力度：',
+    '19、本村信息化建设程度：',
+    '20、本村旅游吸引力：',
+    '21、本村环境卫生条件是否适合发展乡村旅游：',
+    '22、您认为本村发展农文旅存在的主要问题（多选）：',
+]
+
+GENDERS = ['男', '女']
+AGES = ['35岁及以下', '36-45岁', '46-55岁', '56-65岁', '66岁及以上']
+EDUCATION = ['小学及以下', '初中/中专', '高中', '大专', '本科']
+TRAINING = ['是，政府组织', '是，企业培训', '是，在学校学习过', '否']
+LAND = ['无', '1-5亩', '6-10亩', '11-15亩', '16-20亩', '21亩及以上']
+ENV = ['完全不适合', '适合但需要改进', '适合需要加大投入建设', '适合', '非常适合']
+LIKERT = list(LIKERT_MAPPING)
+AWARENESS = ['非常了解', '比较了解', '一般', '不太了解', '完全不了解']
+INDUSTRY_OPTIONS = ['农家乐', '民宿', '采摘园', '特色农产品销售', '手工艺品']
+ADVANTAGE_OPTIONS = ['自然风光', '历史文化', '特色农业', '区位交通']
+PROBLEM_OPTIONS = ['资金不足', '交通不便', '人才缺乏', '宣传不够', '基础设施差', '缺乏特色']
+OTHER_TEXTS = ['缺水', '游客少', '没人管', '停车难', '缺 水']
+
+
+def _multiselect_vocabulary(options, other_texts):
+    """
+    多选题所有可能答案的文本表
+
+    编号 = 选项子集的位掩码 + 2^k × 其他文本编号 (0 为没有“其他”)。
+    生成数据时只需抽取编号再查表，不需要逐行拼接字符串。
+    """
+    k = len(options)
+    texts = []
+    for other in [None] + list(other_texts):
+        for mask in range(2 ** k):
+            items = [opt for j, opt in enumerate(options) if mask >> j & 1]
+            if other is not None:
+                items.append(f'其他（请注明）〖{other}〗')
+            texts.append('┋'.join(items))
+    return texts
+
+
+def _multiselect_codes(rng, n, options, other_texts, p_select=0.3, p_other=0.1):
+    """抽取 n 个多选题答案在 _multiselect_vocabulary 中的编号 (至少选择一项)"""
+    k = len(options)
+    mask = (rng.random((n, k)) < p_select) @ (1 << np.arange(k))
+    other = np.where(rng.random(n) < p_other, rng.integers(1, len(other_texts) + 1, n), 0)
+    # 既没有选项也没有“其他”时改为只选第一个选项
+    mask = np.where((mask == 0) & (other == 0), 1, mask)
+    return mask + other * 2 ** k
+
+
+def _answers(codes, labels, skip=None, missing=None):
+    """
+    选项编号 -> 问卷答案列 (分类类型，不逐行生成字符串)
+
+    参数:
+        codes: 选项编号
+        labels: 选项文本
+        skip: 为 True 的样本答案为 (跳过)
+        missing: 为 True 的样本答案为空白
+    """
+    codes = np.asarray(codes, dtype='int64')
+    if skip is not None:
+        codes = np.where(skip, len(labels), codes)
+    if missing is not None:
+        codes = np.where(missing, -1, codes)
+    return pd.Categorical.from_codes(codes, categories=list(labels) + [SKIP])
+
+
+def generate_survey(n, seed=0, id_start=1, skip_rate=0.03, missing_rate=0.01,
+                    violation_rate=0.0):
+    """
+    生成与问卷星导出格式相同的合成问卷数据
+
+    各列位置与表头与 process_survey_data 的要求一致：分类题为中文选项文本，
+    多选题以 ┋ 连接并含 〖…〗 自由填写的“其他”，未参与者的跟进题为 (跳过)。
+    答案按选项编号向量化抽取，千万行的数据可分块生成 (见 write_synthetic_survey)。
+
+    参数:
+        n: 样本数
+        seed: 随机数种子 (整数或 SeedSequence)
+        id_start: 第一行的序号
+        skip_rate: 非跳转题被跳过 ((跳过)) 的比例
+        missing_rate: 空白答案的比例
+        violation_rate: 家庭人口结构不一致 (如劳动人口多于家庭总人口) 的样本比例，
+                        用于测试数据校验
+
+    返回:
+        原始问卷数据框
+    """
+    rng = np.random.default_rng(seed)
+
+    def answered(codes, labels):
+        # 非跳转题: 按比例随机跳过或留空
+        u = rng.random(n)
+        return _answers(codes, labels, skip=u < skip_rate,
+                        missing=(u >= skip_rate) & (u < skip_rate + missing_rate))
+
+    f_size = rng.integers(1, 9, n)
+    up15 = f_size - rng.binomial(f_size, 0.2)
+    l_size = up15 - rng.binomial(up15, 0.25)
+    migrant = rng.binomial(l_size, 0.3)
+    if violation_rate > 0:
+        bad = rng.random(n) < violation_rate
+        l_size = np.where(bad, f_size + rng.integers(1, 3, n), l_size)
+
+    edu = rng.choice(len(EDUCATION), n, p=[0.25, 0.35, 0.2, 0.12, 0.08])
+    participate = rng.random(n) < 0.3 + 0.05 * edu
+    agri_income = np.round(rng.gamma(2.0, 1.5, n), 2)
+    dividend = np.where(rng.random(n) < 0.4, np.round(rng.gamma(1.5, 0.3, n), 2), 0.0)
+    income = np.round(rng.lognormal(1.5 + 0.1 * edu, 0.6, n) + participate * agri_income
+                      + dividend, 2)
+
+    columns = [
+        np.arange(id_start, id_start + n),
+        _answers(rng.integers(0, 2, n), GENDERS),
+        answered(rng.choice(len(AGES), n, p=[0.15, 0.25, 0.3, 0.2, 0.1]), AGES),
+        answered(edu, EDUCATION),
+        f_size,
+        up15,
+        l_size,
+        migrant,
+        income,
+        _answers(~participate, ['是', '否']),
+        _answers(_multiselect_codes(rng, n, INDUSTRY_OPTIONS, ['农事体验']),
+                 _multiselect_vocabulary(INDUSTRY_OPTIONS, ['农事体验']), skip=~participate),
+        # 未参与者的农文旅收入为 (跳过)
+        pd.array(np.where(participate, agri_income, np.nan), dtype=object),
+        dividend,
+        _answers(rng.integers(0, len(AWARENESS), n), AWARENESS),
+        answered(rng.choice(len(TRAINING), n, p=[0.3, 0.15, 0.05, 0.5]), TRAINING),
+        _answers(_multiselect_codes(rng, n, ADVANTAGE_OPTIONS, ['民俗活动']),
+                 _multiselect_vocabulary(ADVANTAGE_OPTIONS, ['民俗活动'])),
+        answered(rng.choice(len(LAND), n, p=[0.1, 0.4, 0.25, 0.12, 0.08, 0.05]), LAND),
+        answered(rng.integers(0, len(LIKERT), n), LIKERT),
+        answered(rng.integers(0, len(LIKERT), n), LIKERT),
+        answered(rng.integers(0, len(LIKERT), n), LIKERT),
+        answered(rng.integers(0, len(LIKERT), n), LIKERT),
+        answered(rng.integers(0, len(ENV), n), ENV),
+        answered(_multiselect_codes(rng, n, PROBLEM_OPTIONS, OTHER_TEXTS),
+                 _multiselect_vocabulary(PROBLEM_OPTIONS, OTHER_TEXTS)),
+    ]
+    df = pd.DataFrame(dict(zip(SURVEY_HEADERS, columns)))
+    df.iloc[~participate, 11] = SKIP
+    return df
+
+
+def write_synthetic_survey(output_file, n, seed=0, chunksize=200_000, **kwargs):
+    """
+    分块生成合成问卷并写入文件，内存占用与总行数无关
+
+    参数:
+        output_file: 输出路径，.csv (可达千万行) 或 .xlsx (不超过 1048575 行)
+        n: 样本数
+        seed: 随机数种子，相同的 (seed, chunksize) 生成相同的数据
+        chunksize: 每块的行数
+        kwargs: 传给 generate_survey 的参数
+    """
+    suffix = os.path.splitext(output_file)[1].lower()
+    if suffix == '.xlsx' and n > 1_048_575:
+        raise ValueError("xlsx 文件最多 1048575 行数据，请使用 .csv")
+    if suffix not in ('.csv', '.xlsx'):
+        raise ValueError(f"不支持的输出格式: {output_file}")
+    seeds = np.random.SeedSequence(seed).spawn((n + chunksize - 1) // chunksize)
+    chunks = ((seeds[i], start, min(chunksize, n - start))
+              for i, start in enumerate(range(0, n, chunksize)))
+
+    if suffix == '.csv':
+        with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+            for i, (chunk_seed, start, size) in enumerate(chunks):
+                generate_survey(size, chunk_seed, id_start=start + 1, **kwargs).to_csv(
+                    f, index=False, header=i == 0)
+        return output_file
+
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output_file, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, SURVEY_HEADERS)
+        row = 1
+        for chunk_seed, start, size in chunks:
+            chunk = generate_survey(size, chunk_seed, id_start=start + 1, **kwargs)
+            for values in chunk.itertuples(index=False, name=None):
+                worksheet.write_row(row, 0, [None if isinstance(v, float) and np.isnan(v) else v
+                                             for v in values])
+                row += 1
+    finally:
+        workbook.close()
+    return output_file
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("用法: python synthetic.py <输出文件 .csv/.xlsx> <样本数> [种子]")
+    else:
+        write_synthetic_survey(sys.argv[1], int(sys.argv[2]),
+                               seed=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+        print(f"合成问卷已保存到: {sys.argv[1]}")
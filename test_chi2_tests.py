@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from chi2_tests import CHI2_VARS, _binary_columns, chi2_battery, multiselect_dummy_columns
+
+
+def _variables(df):
+    dummies = multiselect_dummy_columns(df)
+    # 虚拟变量走指示矩阵乘积路径，编码变量走 bincount 路径
+    assert set(dummies) <= _binary_columns(df, dummies)
+    assert not _binary_columns(df, CHI2_VARS)
+    return CHI2_VARS + dummies
+
+
+def _scipy_chi2(part, var, by='participate'):
+    table = pd.crosstab(part[var], part[by]).to_numpy()
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    if min(table.shape) < 2:
+        return 0.0, 0
+    chi2, _, dof, _ = stats.chi2_contingency(table, correction=False)
+    return chi2, dof
+
+
+@pytest.mark.parametrize('strata', [None, 'village'])
+def test_chi2_matches_scipy(structured, strata):
+    variables = _variables(structured)
+    result, _ = chi2_battery(structured, variables, strata=strata, p_method='asymptotic')
+    groups = structured.groupby(strata) if strata else [(None, structured)]
+    expected = []
+    for _, part in groups:
+        part = part.dropna(subset=['participate'])
+        expected.extend(_scipy_chi2(part, var) for var in variables)
+    chi2, dof = np.array(expected).T
+    np.testing.assert_allclose(result['chi2'].to_numpy(), chi2, rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(result['自由度'].to_numpy(), dof)
+
+
+@pytest.mark.parametrize('strata', [None, 'village'])
+def test_fisher_matches_scipy(structured, strata):
+    dummies = multiselect_dummy_columns(structured)
+    result, _ = chi2_battery(structured, dummies, strata=strata, p_method='exact', correction=None)
+    groups = structured.groupby(strata) if strata else [(None, structured)]
+    expected = []
+    for _, part in groups:
+        part = part.dropna(subset=['participate'])
+        for var in dummies:
+            table = pd.crosstab(part[var], part['participate']).to_numpy()
+            expected.append(stats.fisher_exact(table)[1] if table.shape == (2, 2) else np.nan)
+    fisher = result['p值方法'] == 'Fisher精确'
+    assert fisher.any() and fisher.sum() == np.isfinite(expected).sum()
+    np.testing.assert_allclose(result.loc[fisher, 'p值'].to_numpy(),
+                               np.asarray(expected)[fisher.to_numpy()], rtol=1e-7)
+
+
+def test_crosstab_counts_match_pandas(structured):
+    variables = _variables(structured)
+    _, crosstab = chi2_battery(structured, variables, p_method='asymptotic')
+    data = structured.dropna(subset=['participate'])
+    for var in variables:
+        expected = data.groupby([var, 'participate']).size()
+        got = crosstab[crosstab['变量'] == var].set_index(['取值', 'participate'])['频数']
+        got = got[got > 0]
+        np.testing.assert_array_equal(got.to_numpy(), expected.to_numpy())
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from esr import (COVARIATES, INSTRUMENTS, OUTCOME, TREATMENT, _start_values, esr_design,
+                 esr_hessian, esr_loglik, fit_esr, prepare_esr_data, treatment_effects)
+from spec_grid import spec_design
+
+
+@pytest.fixture(scope='module')
+def data(structured):
+    return esr_design(prepare_esr_data(structured))
+
+
+@pytest.fixture(scope='module')
+def fitted(data):
+    return fit_esr(data=data)
+
+
+def _theta(data):
+    """初始值附近、ρ 不为 0 的参数 (避免在 ρ = 0 处检验导数)"""
+    theta = _start_values(data)
+    theta[-2:] = [0.4, -0.3]
+    return theta
+
+
+def _numeric_gradient(f, theta, h=1e-5):
+    grad = np.empty((len(theta),) + np.shape(f(theta)))
+    for j in range(len(theta)):
+        step = np.zeros_like(theta)
+        step[j] = h
+        grad[j] = (f(theta + step) - f(theta - step)) / (2 * h)
+    return grad
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_score_and_hessian_match_finite_differences(data, weighted):
+    if weighted:
+        data = data.take(np.arange(data.n))
+        data.w = np.random.default_rng(3).uniform(0.5, 2.0, data.n)
+    theta = _theta(data)
+    ll, grad = esr_loglik(theta, data)
+    numeric = _numeric_gradient(lambda t: esr_loglik(t, data)[0], theta)
+    np.testing.assert_allclose(grad, numeric, rtol=1e-6, atol=1e-5)
+
+    _, score = esr_loglik(theta, data, scores=True)
+    np.testing.assert_allclose(score.sum(axis=0), grad, rtol=1e-10, atol=1e-8)
+
+    hess = esr_hessian(theta, data)
+    numeric = _numeric_gradient(lambda t: esr_loglik(t, data)[1], theta)
+    np.testing.assert_allclose(hess, numeric, rtol=1e-6, atol=1e-4)
+    np.testing.assert_allclose(hess, hess.T)
+
+
+def test_treatment_effects_match_conditional_expectations(data, fitted):
+    k = data.X.shape[1]
+    m = data.Z.shape[1]
+    theta = fitted.theta
+    b1, b2, g = theta[:k], theta[k:2 * k], theta[2 * k:2 * k + m]
+    sigma1, sigma2 = np.exp(theta[2 * k + m:2 * k + m + 2])
+    rho1, rho2 = np.tanh(theta[2 * k + m + 2:])
+
+    att_terms, atu_terms = [], []
+    for x, z, d in zip(data.X, data.Z, data.d):
+        zg = z @ g
+        if d == 1:
+            mills = stats.norm.pdf(zg) / stats.norm.cdf(zg)
+            y1 = x @ b1 + sigma1 * rho1 * mills
+            y2 = x @ b2 + sigma2 * rho2 * mills
+            att_terms.append(y1 - y2)
+        else:
+            mills = stats.norm.pdf(zg) / (1 - stats.norm.cdf(zg))
+            y1 = x @ b1 - sigma1 * rho1 * mills
+            y2 = x @ b2 - sigma2 * rho2 * mills
+            atu_terms.append(y1 - y2)
+
+    assert fitted.att == pytest.approx(np.mean(att_terms), rel=1e-9)
+    assert fitted.atu == pytest.approx(np.mean(atu_terms), rel=1e-9)
+    assert treatment_effects(theta, data) == pytest.approx((fitted.att, fitted.atu))
+
+
+def test_fit_matches_spec_grid_design(structured, data, fitted):
+    df = prepare_esr_data(structured)
+    columns = [OUTCOME, TREATMENT] + COVARIATES + INSTRUMENTS
+    matrix = np.asfortranarray(df[columns].to_numpy(dtype='float64', na_value=np.nan))
+    grid = spec_design(matrix, columns, OUTCOME, COVARIATES, INSTRUMENTS)
+
+    np.testing.assert_array_equal(grid.mask, data.mask)
+    for name in ('y', 'd', 'X', 'Z'):
+        np.testing.assert_array_equal(getattr(grid, name), getattr(data, name))
+    assert grid.x_names == data.x_names and grid.z_names == data.z_names
+
+    result = fit_esr(data=grid)
+    assert result.converged and fitted.converged
+    np.testing.assert_allclose(result.theta, fitted.theta, rtol=1e-10, atol=1e-12)
+    assert result.att == pytest.approx(fitted.att, rel=1e-10)
+    assert result.atu == pytest.approx(fitted.atu, rel=1e-10)
+    np.testing.assert_allclose(result.vcov.to_numpy(), fitted.vcov.to_numpy(), rtol=1e-8)
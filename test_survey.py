@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from survey import survey_design, survey_frequencies, survey_mean_difference, survey_means
+
+
+@pytest.fixture
+def small():
+    rng = np.random.default_rng(7)
+    n = 200
+    df = pd.DataFrame({
+        'y': rng.normal(5, 2, n),
+        'g': rng.integers(0, 2, n),
+        'village': rng.integers(0, 15, n),
+        'county': rng.integers(0, 3, n),
+        'w': rng.uniform(0.5, 3.0, n),
+    })
+    df.loc[::17, 'y'] = np.nan
+    return df
+
+
+def test_unit_weights_one_psu_per_row_is_simple_mean(small):
+    """权重为 1、每个样本自成一个 PSU 时: 均值与标准误为普通均值与 (n-1)/n 修正的标准误"""
+    design = survey_design(small, cluster=None)
+    result = survey_means(small, ['y'], design).loc['y']
+    y = small['y'].dropna()
+    n = len(y)
+    assert result['样本数'] == n
+    assert result['加权均值'] == pytest.approx(y.mean())
+    assert result['加权标准差'] == pytest.approx(y.std())
+    # 线性化方差: Σ(y - ȳ)² / n² × N / (N - 1)，N 为全部样本数 (缺失样本的影响值为 0)
+    total = len(small)
+    expected_se = np.sqrt(((y - y.mean()) ** 2).sum() / n ** 2 * total / (total - 1))
+    assert result['标准误'] == pytest.approx(expected_se)
+
+
+def _loop_cluster_se(df, weight, cluster, strata=None):
+    """逐个分层、逐个 PSU 循环计算比率均值的线性化标准误"""
+    data = df.dropna(subset=['y'])
+    w = data[weight]
+    mean = (w * data['y']).sum() / w.sum()
+    z = (w * (data['y'] - mean) / w.sum()).reindex(df.index, fill_value=0.0)
+    variance = 0.0
+    for _, part in df.groupby(strata if strata else np.zeros(len(df))):
+        totals = np.array([z[psu.index].sum() for _, psu in part.groupby(cluster)])
+        g = len(totals)
+        variance += g / (g - 1) * ((totals - totals.mean()) ** 2).sum()
+    return mean, np.sqrt(variance)
+
+
+@pytest.mark.parametrize('strata', [None, 'county'])
+def test_cluster_se_matches_psu_loop(small, strata):
+    df = small.assign(village=small['village'] if strata is None
+                      else small['county'] * 100 + small['village'])
+    design = survey_design(df, weight='w', cluster='village', strata=strata)
+    result = survey_means(df, ['y'], design).loc['y']
+    mean, se = _loop_cluster_se(df, 'w', 'village', strata)
+    assert result['加权均值'] == pytest.approx(mean)
+    assert result['标准误'] == pytest.approx(se)
+
+
+def test_frequencies_match_indicator_means(small):
+    design = survey_design(small, weight='w', cluster='village')
+    freq = survey_frequencies(small, 'g', design).set_index('取值')
+    indicator = small.assign(one=(small['g'] == 1).astype(float))
+    mean = survey_means(indicator, ['one'], design).loc['one']
+    assert freq.loc[1, '加权比例(%)'] == pytest.approx(mean['加权均值'] * 100)
+    assert freq.loc[1, '标准误(%)'] == pytest.approx(mean['标准误'] * 100)
+
+
+def test_mean_difference_matches_psu_loop(small):
+    design = survey_design(small, weight='w', cluster='village')
+    result = survey_mean_difference(small, 'y', 'g', design)
+    data = small.dropna(subset=['y'])
+    means = {}
+    z = pd.Series(0.0, index=small.index)
+    for group in (0, 1):
+        part = data[data['g'] == group]
+        means[group] = (part['w'] * part['y']).sum() / part['w'].sum()
+        sign = 1 if group == 1 else -1
+        z.loc[part.index] = sign * part['w'] * (part['y'] - means[group]) / part['w'].sum()
+    totals = z.groupby(small['village']).sum().to_numpy()
+    g = len(totals)
+    se = np.sqrt(g / (g - 1) * ((totals - totals.mean()) ** 2).sum())
+    assert result['组1均值'] == pytest.approx(means[1])
+    assert result['组0均值'] == pytest.approx(means[0])
+    assert result['标准误'] == pytest.approx(se)
+    assert result['自由度'] == g - 1
@@ -0,0 +1,269 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from instrument import span
+
+# 比较运算符 (缺失值不参与比较)
+_OPERATORS = {
+    '<=': np.less_equal,
+    '<': np.less,
+    '>=': np.greater_equal,
+    '>': np.greater,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+# 浮点数求和比较的容差 (收入以万元计，两位小数)
+TOLERANCE = 1e-6
+
+POLICIES = ('report', 'flag', 'drop', 'quarantine')
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    一条逻辑约束: 满足 when 条件的样本应满足 left op right
+
+    参数:
+        name: 规则名 (英文标识，用于位图与报告)
+        label: 中文说明
+        left: 变量名、变量名列表 (取和) 或常数
+        op: 比较运算符 (<= < >= > == !=)
+        right: 变量名、变量名列表 (取和) 或常数
+        when: 适用条件 (变量名, 运算符, 常数)，None 时适用于全部样本
+    """
+    name: str
+    label: str
+    left: object
+    op: str
+    right: object
+    when: tuple = None
+
+    def columns(self):
+        """规则引用的变量"""
+        names = []
+        for term in (self.left, self.right, self.when[0] if self.when else None):
+            if isinstance(term, str):
+                names.append(term)
+            elif isinstance(term, (list, tuple)):
+                names.extend(term)
+        return names
+
+
+DEFAULT_RULES = (
+    Rule('labor_le_adult', '劳动人口数不超过15周岁以上人口数', 'l_size', '<=', 'up15_size'),
+    Rule('adult_le_family', '15周岁以上人口数不超过家庭总人口', 'up15_size', '<=', 'f_size'),
+    Rule('migrant_le_labor', '外出务工人数不超过劳动人口数', 'migrant', '<=', 'l_size'),
+    Rule('income_components', '农文旅收入与分红之和不超过家庭年总收入',
+         ('agri_income', 'dividend'), '<=', 'income'),
+    Rule('nonparticipant_agri_income', '未参与农文旅的农户农文旅收入为0',
+         'agri_income', '==', 0, when=('participate', '==', 0)),
+)
+
+
+def load_rules(path):
+    """
+    从 JSON / YAML 文件读取规则集
+
+    文件内容为规则列表，每条规则的字段与 Rule 相同。
+    """
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    rules = []
+    for item in spec:
+        for key in ('left', 'right', 'when'):
+            if isinstance(item.get(key), list):
+                item[key] = tuple(item[key])
+        rules.append(Rule(**item))
+    return tuple(rules)
+
+
+def _bitmap_dtype(n_rules):
+    for dtype in ('uint8', 'uint16', 'uint32', 'uint64'):
+        if n_rules <= np.dtype(dtype).itemsize * 8:
+            return np.dtype(dtype)
+    raise ValueError(f"规则数 {n_rules} 超过位图上限 64")
+
+
+@dataclass
+class ValidationResult:
+    """
+    校验结果
+
+    bitmap: 每行一个无符号整数，第 i 位为 1 表示违反第 i 条规则
+    checked: 各规则实际检查的样本数 (引用变量均不缺失且满足适用条件)
+    """
+    rules: tuple
+    bitmap: np.ndarray
+    checked: np.ndarray = field(repr=False)
+
+    @property
+    def n(self):
+        return len(self.bitmap)
+
+    def mask(self, rule=None):
+        """违反指定规则 (规则名或序号) 的行；rule 为 None 时为违反任一规则的行"""
+        if rule is None:
+            return self.bitmap != 0
+        index = rule if isinstance(rule, int) else [r.name for r in self.rules].index(rule)
+        return (self.bitmap >> index) & 1 == 1
+
+    def summary(self):
+        """各规则的违反情况: 规则 / 说明 / 检查样本数 / 违反数 / 违反比例(%)"""
+        violated = np.array([np.count_nonzero(self.mask(i)) for i in range(len(self.rules))],
+                            dtype='int64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = violated / self.checked * 100
+        return pd.DataFrame({
+            '规则': [r.name for r in self.rules],
+            '说明': [r.label for r in self.rules],
+            '检查样本数': self.checked,
+            '违反数': violated,
+            '违反比例(%)': share,
+        })
+
+    def violated_rules(self):
+        """每行违反的规则名 (以 ; 连接)，按位图的不同取值查表生成"""
+        codes, inverse = np.unique(self.bitmap, return_inverse=True)
+        names = ['; '.join(r.name for i, r in enumerate(self.rules) if int(code) >> i & 1)
+                 for code in codes]
+        return np.array(names, dtype=object)[inverse]
+
+
+def combine_results(results):
+    """合并分块校验的结果 (位图按块顺序拼接，检查样本数相加)"""
+    results = list(results)
+    if not results:
+        raise ValueError("没有可合并的校验结果")
+    return ValidationResult(results[0].rules,
+                            np.concatenate([r.bitmap for r in results]),
+                            np.sum([r.checked for r in results], axis=0))
+
+
+def _term(term, columns):
+    """规则一侧的取值: 变量、变量之和或常数"""
+    if isinstance(term, str):
+        return columns[term]
+    if isinstance(term, (list, tuple)):
+        return sum(columns[name] for name in term)
+    return np.float64(term)
+
+
+def validate_rules(df, rules=DEFAULT_RULES, tolerance=TOLERANCE):
+    """
+    一次扫描评估全部规则，返回每行的违反位图
+
+    所有引用的变量只转换一次为 float64 数组，每条规则是一次向量化比较，
+    结果按位写入位图。引用变量缺失或不满足适用条件的样本不检查。
+    缺少引用变量的规则跳过 (检查样本数为 0)。
+
+    参数:
+        df: 结构化数据
+        rules: 规则集
+        tolerance: 求和比较的容差
+
+    返回:
+        ValidationResult
+    """
+    rules = tuple(rules)
+    dtype = _bitmap_dtype(len(rules))
+    for rule in rules:
+        if rule.op not in _OPERATORS or (rule.when and rule.when[1] not in _OPERATORS):
+            raise ValueError(f"规则 {rule.name} 的运算符无效")
+    names = list(dict.fromkeys(c for rule in rules for c in rule.columns() if c in df.columns))
+    values = df[names].to_numpy(dtype='float64', na_value=np.nan) if names else np.empty((len(df), 0))
+    columns = {name: values[:, j] for j, name in enumerate(names)}
+
+    bitmap = np.zeros(len(df), dtype=dtype)
+    checked = np.zeros(len(rules), dtype='int64')
+    for i, rule in enumerate(rules):
+        if any(c not in columns for c in rule.columns()):
+            continue
+        left = _term(rule.left, columns)
+        right = _term(rule.right, columns)
+        applies = ~(np.isnan(left) | np.isnan(right))
+        if rule.when:
+            name, op, value = rule.when
+            applies &= _OPERATORS[op](columns[name], value)
+        # 带容差的比较: 例如 a <= b 视为 a <= b + tol
+        if rule.op in ('<=', '<'):
+            ok = _OPERATORS[rule.op](left, right + tolerance)
+        elif rule.op in ('>=', '>'):
+            ok = _OPERATORS[rule.op](left, right - tolerance)
+        else:
+            close = np.abs(left - right) <= tolerance
+            ok = close if rule.op == '==' else ~close
+        checked[i] = applies.sum()
+        bitmap |= ((applies & ~ok).astype(dtype) << dtype.type(i))
+    return ValidationResult(rules, bitmap, checked)
+
+
+def quarantine_rows(df, result):
+    """违反规则的样本，附加 _violations (位图) 与 _rules (违反的规则名) 两列"""
+    bad = result.mask()
+    return df[bad].assign(_violations=result.bitmap[bad], _rules=result.violated_rules()[bad])
+
+
+def enforce_rules(df, rules=DEFAULT_RULES, policy='report', quarantine_file=None):
+    """
+    校验数据并按策略处理违反规则的样本
+
+    参数:
+        df: 结构化数据
+        rules: 规则集
+        policy: 'report' (只报告)、'flag' (增加 _violations 位图列)、
+                'drop' (删除违反规则的样本) 或 'quarantine' (移出违反规则的样本，
+                连同违反的规则名保存到 quarantine_file)
+        quarantine_file: 隔离样本的保存路径 (格式由扩展名决定，见 survey_io.save_structured)，
+                         分块处理时可传入 survey_io.ParquetChunkWriter 逐块追加
+
+    返回:
+        (处理后的数据, ValidationResult)
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"未知的校验策略: {policy}，可选 {POLICIES}")
+    if policy == 'quarantine' and quarantine_file is None:
+        raise ValueError("quarantine 策略需要指定 quarantine_file")
+    with span('validate', rows_in=len(df), rules=len(rules)) as sp:
+        result = validate_rules(df, rules)
+        bad = result.mask()
+        sp.record(rows_violating=int(bad.sum()))
+        if policy == 'flag':
+            df = df.assign(_violations=result.bitmap)
+        elif policy in ('drop', 'quarantine') and bad.any():
+            if policy == 'quarantine':
+                quarantined = quarantine_rows(df, result)
+                from survey_io import compact_dtypes, save_structured
+
+                if hasattr(quarantine_file, 'write'):
+                    quarantine_file.write(compact_dtypes(quarantined))
+                else:
+                    save_structured(quarantined, quarantine_file)
+            df = df[~bad]
+        sp.record(rows_out=len(df))
+    return df, result
+
+
+def print_summary(result):
+    """打印各规则的违反情况"""
+    summary = result.summary()
+    print(f"\n数据校验: {result.n} 行，{int(result.mask().sum())} 行违反至少一条规则")
+    print(summary.round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    import sys
+
+    from survey_io import load_structured
+
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'structured_data.parquet'
+    print_summary(validate_rules(load_structured(input_file)))